@@ -11,6 +11,7 @@
 # Import libraries
 import os
 import numpy as np
+import SimpleITK as sitk
 
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
@@ -58,6 +59,7 @@ def main():
     input_parser.add_shrink_factors(default=[2, 1])
     input_parser.add_smoothing_sigmas(default=[1, 0])
     input_parser.add_sigma(default=0.9)
+    input_parser.add_sda_approach(default="Shepard-YVV")
     input_parser.add_reconstruction_type(default="TK1L2")
     input_parser.add_iterations(default=15)
     input_parser.add_alpha(default=0.02)
@@ -76,7 +78,16 @@ def main():
     input_parser.add_write_motion_correction(default=1)
     input_parser.add_verbose(default=0)
     input_parser.add_two_step_cycles(default=3)
+    input_parser.add_two_step_resolution_levels(default=None)
     input_parser.add_use_masks_srr(default=1)
+    input_parser.add_use_assembled_operator(default=0)
+    input_parser.add_use_preconditioning(default=0)
+    input_parser.add_rtol_residual()
+    input_parser.add_rtol_x()
+    input_parser.add_rtol_data_fit()
+    input_parser.add_iter_step(default=5)
+    input_parser.add_threads(default=1)
+    input_parser.add_precision(default="double")
     input_parser.add_boundary_stacks(default=[10, 10, 0])
     input_parser.add_reference()
     input_parser.add_reference_mask()
@@ -104,12 +115,16 @@ def main():
     # '--dir-input' specified
     elif args.dir_input is not None:
         data_reader = dr.ImageDirectoryReader(
-            args.dir_input, suffix_mask=args.suffix_mask)
+            args.dir_input,
+            suffix_mask=args.suffix_mask,
+            precision=args.precision)
 
     # '--filenames' specified
     elif args.filenames is not None:
         data_reader = dr.MultipleImagesReader(
-            args.filenames, suffix_mask=args.suffix_mask)
+            args.filenames,
+            suffix_mask=args.suffix_mask,
+            precision=args.precision)
 
     else:
         raise IOError(
@@ -160,7 +175,8 @@ def main():
         reference = st.Stack.from_filename(
             file_path=args.reference,
             file_path_mask=args.reference_mask,
-            extract_slices=False)
+            extract_slices=False,
+            precision=args.precision)
 
     else:
         reference = st.Stack.from_stack(stacks[args.target_stack_index])
@@ -236,7 +252,8 @@ def main():
         # Scattered Data Approximation to get first estimate of HR volume
         ph.print_title("First Estimate of HR Volume")
         SDA = sda.ScatteredDataApproximation(
-            stacks, HR_volume, sigma=args.sigma)
+            stacks, HR_volume, sigma=args.sigma, n_threads=args.threads)
+        SDA.set_approach(args.sda_approach)
         SDA.run()
         HR_volume = SDA.get_reconstruction()
 
@@ -257,7 +274,15 @@ def main():
         iter_max=args.iter_max_first,
         verbose=True,
         use_masks=args.use_masks_srr,
+        use_assembled_operator=args.use_assembled_operator,
+        n_threads=args.threads,
+        use_preconditioning=args.use_preconditioning,
     )
+    SRR.set_convergence_criteria(
+        rtol_residual=args.rtol_residual,
+        rtol_x=args.rtol_x,
+        rtol_data_fit=args.rtol_data_fit,
+        iter_step=args.iter_step)
 
     if args.two_step_cycles > 0:
 
@@ -289,6 +314,7 @@ def main():
                 cycles=args.two_step_cycles,
                 alpha_range=[args.alpha_first, args.alpha],
                 verbose=args.verbose,
+                resolution_levels=args.two_step_resolution_levels,
             )
         two_step_s2v_reg_recon.run()
         HR_volume_iterations = \
@@ -327,10 +353,18 @@ def main():
             reconstruction=HR_volume,
             reg_type="TK1" if args.reconstruction_type == "TK1L2" else "TK0",
             use_masks=args.use_masks_srr,
+            use_assembled_operator=args.use_assembled_operator,
+            use_preconditioning=args.use_preconditioning,
         )
     SRR.set_alpha(args.alpha)
+    SRR.set_n_threads(args.threads)
     SRR.set_iter_max(args.iter_max)
     SRR.set_verbose(True)
+    SRR.set_convergence_criteria(
+        rtol_residual=args.rtol_residual,
+        rtol_x=args.rtol_x,
+        rtol_data_fit=args.rtol_data_fit,
+        iter_step=args.iter_step)
     SRR.run()
     time_reconstruction += SRR.get_computational_time()
 
@@ -340,7 +374,10 @@ def main():
     HR_volume_final = SRR.get_reconstruction()
     HR_volume_final.set_filename(SRR.get_setting_specific_filename())
     HR_volume_final.write(
-        args.dir_output, write_mask=True, suffix_mask=args.suffix_mask)
+        args.dir_output,
+        write_mask=True,
+        suffix_mask=args.suffix_mask,
+        pixel_type=sitk.sitkFloat64)
 
     HR_volume_iterations.insert(0, HR_volume_final)
     for stack in stacks:
@@ -11,6 +11,7 @@
 # Import libraries
 import numpy as np
 import os
+import SimpleITK as sitk
 
 # Import modules
 import niftymic.base.data_reader as dr
@@ -56,9 +57,18 @@ def main():
         # default=0.006  #TVL2, HuberL2
     )
     input_parser.add_rho(default=0.5)
+    input_parser.add_use_adaptive_rho(default=0)
     input_parser.add_tv_solver(default="PD")
     input_parser.add_pd_alg_type(default="ALG2")
     input_parser.add_iterations(default=15)
+    input_parser.add_use_assembled_operator(default=0)
+    input_parser.add_use_preconditioning(default=0)
+    input_parser.add_rtol_residual()
+    input_parser.add_rtol_x()
+    input_parser.add_rtol_data_fit()
+    input_parser.add_iter_step(default=5)
+    input_parser.add_threads(default=1)
+    input_parser.add_precision(default="double")
     input_parser.add_subfolder_comparison()
     input_parser.add_provide_comparison(default=0)
     input_parser.add_log_script_execution(default=1)
@@ -85,12 +95,15 @@ def main():
         data_reader = dr.ImageSlicesDirectoryReader(
             path_to_directory=args.dir_input,
             suffix_mask=args.suffix_mask,
-            image_selection=args.image_selection)
+            image_selection=args.image_selection,
+            precision=args.precision)
 
     # '--filenames' specified
     elif args.filenames is not None:
         data_reader = dr.MultipleImagesReader(
-            args.filenames, suffix_mask=args.suffix_mask)
+            args.filenames,
+            suffix_mask=args.suffix_mask,
+            precision=args.precision)
 
     else:
         raise IOError(
@@ -113,7 +126,8 @@ def main():
     # Reconstruction space was provided by user
     else:
         recon0 = st.Stack.from_filename(args.reconstruction_space,
-                                        extract_slices=False)
+                                        extract_slices=False,
+                                        precision=args.precision)
 
         # Change resolution for isotropic resolution if provided by user
         if args.isotropic_resolution is not None:
@@ -137,13 +151,21 @@ def main():
         minimizer=args.minimizer,
         data_loss=args.data_loss,
         data_loss_scale=args.data_loss_scale,
+        use_assembled_operator=args.use_assembled_operator,
+        n_threads=args.threads,
+        use_preconditioning=args.use_preconditioning,
         # verbose=args.verbose,
     )
+    SRR0.set_convergence_criteria(
+        rtol_residual=args.rtol_residual,
+        rtol_x=args.rtol_x,
+        rtol_data_fit=args.rtol_data_fit,
+        iter_step=args.iter_step)
     SRR0.run()
 
     recon = SRR0.get_reconstruction()
     recon.set_filename(SRR0.get_setting_specific_filename(args.prefix_output))    
-    recon.write(args.dir_output)
+    recon.write(args.dir_output, pixel_type=sitk.sitkFloat64)
 
     # List to store SRRs
     recons = []
@@ -164,14 +186,22 @@ def main():
                 data_loss=args.data_loss,
                 iterations=args.iterations,
                 verbose=args.verbose,
+                use_adaptive_rho=args.use_adaptive_rho,
             )
+            SRR.set_use_assembled_operator(args.use_assembled_operator)
+            SRR.set_n_threads(args.threads)
+            SRR.set_convergence_criteria(
+                rtol_residual=args.rtol_residual,
+                rtol_x=args.rtol_x,
+                rtol_data_fit=args.rtol_data_fit,
+                iter_step=args.iter_step)
             SRR.run()
             recon = SRR.get_reconstruction()
             recon.set_filename(
                 SRR.get_setting_specific_filename(args.prefix_output))
             recons.insert(0, recon)
 
-            recon.write(args.dir_output)
+            recon.write(args.dir_output, pixel_type=sitk.sitkFloat64)
 
         else:
 
@@ -187,13 +217,20 @@ def main():
                 data_loss=args.data_loss,
                 verbose=args.verbose,
             )
+            SRR.set_use_assembled_operator(args.use_assembled_operator)
+            SRR.set_n_threads(args.threads)
+            SRR.set_convergence_criteria(
+                rtol_residual=args.rtol_residual,
+                rtol_x=args.rtol_x,
+                rtol_data_fit=args.rtol_data_fit,
+                iter_step=args.iter_step)
             SRR.run()
             recon = SRR.get_reconstruction()
             recon.set_filename(
                 SRR.get_setting_specific_filename(args.prefix_output))
             recons.insert(0, recon)
 
-            recon.write(args.dir_output)
+            recon.write(args.dir_output, pixel_type=sitk.sitkFloat64)
 
     if args.verbose and not args.provide_comparison:
         sitkh.show_stacks(recons)
@@ -0,0 +1,306 @@
+##
+# \file reconstruct_volume_streaming.py
+# \brief      Script to reconstruct an isotropic, high-resolution volume from
+#             stacks of low-resolution 2D slices as they become available,
+#             e.g. while they are being acquired at the scanner.
+#
+# The input directory is polled for new stacks. The first stack defines the
+# reconstruction space and the initial estimate via Scattered Data
+# Approximation. Each subsequent stack is registered to the current
+# reconstruction and the reconstruction is updated warm-started from the
+# previous estimate.
+#
+# \author     Michael Ebner (michael.ebner.14@ucl.ac.uk)
+# \date       April 2018
+#
+
+# Import libraries
+import os
+import re
+import time
+import numpy as np
+import SimpleITK as sitk
+
+import pysitk.python_helper as ph
+
+import niftymic.base.stack as st
+import niftymic.reconstruction.scattered_data_approximation as sda
+import niftymic.reconstruction.tikhonov_solver as tk
+import niftymic.registration.flirt as regflirt
+import niftymic.registration.simple_itk_registration as regsitk
+import niftymic.utilities.data_preprocessing as dp
+import niftymic.utilities.volumetric_reconstruction_pipeline as pipeline
+import niftymic.utilities.joint_image_mask_builder as imb
+from niftymic.utilities.input_arparser import InputArgparser
+from niftymic.definitions import REGEX_FILENAMES
+from niftymic.definitions import REGEX_FILENAME_EXTENSIONS
+
+
+##
+# Gets the paths to all stacks (and their masks) in the input directory
+# which are complete, i.e. whose file sizes did not change since the last
+# check.
+# \date       2018-04-02 11:02:41+0100
+#
+# \param      dir_input    Input directory as string
+# \param      suffix_mask  Suffix of mask filenames as string
+# \param      file_sizes   Dictionary of file sizes at the last check; updated
+#
+# \return     Dictionary mapping stack filenames to tuples of path to image
+#             and path to mask (None if not available)
+#
+def get_complete_stacks(dir_input, suffix_mask, file_sizes):
+
+    pattern = "(" + REGEX_FILENAMES + ")[.]" + REGEX_FILENAME_EXTENSIONS
+    pattern_mask = "(" + REGEX_FILENAMES + ")" + suffix_mask + \
+        "[.]" + REGEX_FILENAME_EXTENSIONS
+    p = re.compile(pattern)
+    p_mask = re.compile(pattern_mask)
+
+    complete = {}
+    for f in os.listdir(dir_input):
+        path = os.path.join(dir_input, f)
+        size = os.path.getsize(path)
+        complete[f] = file_sizes.get(f) == size
+        file_sizes[f] = size
+
+    masks = {p_mask.match(f).group(1): f
+             for f in complete.keys() if p_mask.match(f)}
+
+    stacks = {}
+    for f in complete.keys():
+        if not p.match(f) or p_mask.match(f) or not complete[f]:
+            continue
+        filename = p.match(f).group(1)
+        f_mask = masks.get(filename)
+        if f_mask is not None and not complete[f_mask]:
+            continue
+        stacks[filename] = (
+            os.path.join(dir_input, f),
+            None if f_mask is None else os.path.join(dir_input, f_mask))
+
+    return stacks
+
+
+def main():
+
+    time_start = ph.start_timing()
+
+    # Set print options for numpy
+    np.set_printoptions(precision=3)
+
+    # Read input
+    input_parser = InputArgparser(
+        description="Volumetric MRI reconstruction framework to reconstruct "
+        "an isotropic, high-resolution 3D volume from stacks of 2D slices "
+        "as they arrive in the input directory. The first stack defines the "
+        "reconstruction space. Every new stack is registered to the current "
+        "reconstruction which is then updated warm-started from the previous "
+        "estimate.",
+    )
+    input_parser.add_dir_input(required=True)
+    input_parser.add_dir_output(required=True)
+    input_parser.add_suffix_mask(default="_mask")
+    input_parser.add_n_stacks()
+    input_parser.add_poll_interval(default=5)
+    input_parser.add_timeout(default=1800)
+    input_parser.add_search_angle(default=90)
+    input_parser.add_sigma(default=0.9)
+    input_parser.add_sda_approach(default="Shepard-YVV")
+    input_parser.add_alpha(default=0.02)
+    input_parser.add_iter_max(default=10)
+    input_parser.add_dilation_radius(default=3)
+    input_parser.add_extra_frame_target(default=10)
+    input_parser.add_bias_field_correction(default=0)
+    input_parser.add_isotropic_resolution(default=None)
+    input_parser.add_log_script_execution(default=1)
+    input_parser.add_verbose(default=0)
+    input_parser.add_use_masks_srr(default=1)
+    input_parser.add_use_assembled_operator(default=0)
+    input_parser.add_use_preconditioning(default=0)
+    input_parser.add_threads(default=1)
+    input_parser.add_precision(default="double")
+    input_parser.add_boundary_stacks(default=[10, 10, 0])
+    input_parser.add_option(
+        option_string="--s2v-registration",
+        type=int,
+        help="Turn on/off slice-to-volume registration of each new stack "
+        "to the current reconstruction.",
+        default=1)
+
+    args = input_parser.parse_args()
+    input_parser.print_arguments(args)
+
+    # Write script execution call
+    if args.log_script_execution:
+        input_parser.write_performed_script_execution(
+            os.path.abspath(__file__))
+
+    if len(args.boundary_stacks) != 3:
+        raise IOError(
+            "Provide exactly three values for '--boundary-stacks' to define "
+            "cropping in i-, j-, and k-dimension of the input stacks")
+
+    search_angles = ["-searchr%s -%d %d" %
+                     (x, args.search_angle, args.search_angle)
+                     for x in ["x", "y", "z"]]
+    search_angles = (" ").join(search_angles)
+    vol_registration = regflirt.FLIRT(
+        registration_type="Rigid",
+        use_fixed_mask=True,
+        use_moving_mask=True,
+        options=search_angles,
+        use_verbose=False,
+    )
+
+    streaming = None
+    filenames_ingested = []
+    file_sizes = {}
+    time_last_stack = time.time()
+
+    while True:
+
+        # ------------------------Wait for New Stacks-------------------------
+        stacks_complete = get_complete_stacks(
+            args.dir_input, args.suffix_mask, file_sizes)
+        filenames_new = sorted([
+            f for f in stacks_complete.keys() if f not in filenames_ingested])
+
+        if len(filenames_new) == 0:
+            if args.n_stacks is not None and \
+                    len(filenames_ingested) >= args.n_stacks:
+                break
+            if time.time() - time_last_stack > args.timeout:
+                ph.print_warning(
+                    "No new stack within %g s. Streaming reconstruction "
+                    "stopped." % args.timeout)
+                break
+            time.sleep(args.poll_interval)
+            continue
+
+        # Ingest stacks one by one in order of their filenames
+        filename = filenames_new[0]
+        time_last_stack = time.time()
+        ph.print_title("Read Stack '%s'" % filename)
+        path, path_mask = stacks_complete[filename]
+        stack = st.Stack.from_filename(
+            file_path=path,
+            file_path_mask=path_mask,
+            precision=args.precision)
+        filenames_ingested.append(filename)
+
+        # -------------------------Data Preprocessing-------------------------
+        data_preprocessing = dp.DataPreprocessing(
+            stacks=[stack],
+            use_cropping_to_mask=True,
+            use_N4BiasFieldCorrector=args.bias_field_correction,
+            boundary_i=args.boundary_stacks[0],
+            boundary_j=args.boundary_stacks[1],
+            boundary_k=args.boundary_stacks[2],
+            unit="mm",
+        )
+        data_preprocessing.run()
+        stack = data_preprocessing.get_preprocessed_stacks()[0]
+
+        if streaming is not None:
+            streaming.add_stack(stack)
+
+        else:
+            # ---------------Reconstruction Space and First Volume-------------
+            ph.print_title("Reconstruction Space Generation")
+            HR_volume = stack.get_isotropically_resampled_stack(
+                resolution=args.isotropic_resolution)
+            joint_image_mask_builder = imb.JointImageMaskBuilder(
+                stacks=[stack],
+                target=HR_volume,
+                dilation_radius=1,
+            )
+            joint_image_mask_builder.run()
+            HR_volume = joint_image_mask_builder.get_stack()
+            HR_volume = HR_volume.get_cropped_stack_based_on_mask(
+                boundary_i=args.extra_frame_target,
+                boundary_j=args.extra_frame_target,
+                boundary_k=args.extra_frame_target,
+                unit="mm",
+            )
+
+            SDA = sda.ScatteredDataApproximation(
+                [stack], HR_volume, sigma=args.sigma, n_threads=args.threads)
+            SDA.set_approach(args.sda_approach)
+            SDA.run()
+            HR_volume = SDA.get_reconstruction()
+
+            SRR = tk.TikhonovSolver(
+                stacks=[stack],
+                reconstruction=HR_volume,
+                reg_type="TK1",
+                minimizer="lsmr",
+                alpha=args.alpha,
+                iter_max=args.iter_max,
+                verbose=True,
+                use_masks=args.use_masks_srr,
+                use_assembled_operator=args.use_assembled_operator,
+                n_threads=args.threads,
+                use_preconditioning=args.use_preconditioning,
+            )
+
+            if args.s2v_registration:
+                s2v_registration = regsitk.SimpleItkRegistration(
+                    moving=HR_volume,
+                    use_fixed_mask=True,
+                    use_moving_mask=True,
+                    use_verbose=args.verbose,
+                    interpolator="Linear",
+                    metric="Correlation",
+                    use_multiresolution_framework=0,
+                    initializer_type="SelfGEOMETRY",
+                    optimizer="ConjugateGradientLineSearch",
+                    optimizer_params={
+                        "learningRate": 1,
+                        "numberOfIterations": 100,
+                        "lineSearchUpperLimit": 2,
+                    },
+                    scales_estimator="Jacobian",
+                )
+            else:
+                s2v_registration = None
+
+            streaming = pipeline.StreamingReconstruction(
+                reconstruction_method=SRR,
+                registration_method=vol_registration,
+                s2v_registration_method=s2v_registration,
+                verbose=args.verbose,
+            )
+            streaming.add_stack(stack)
+
+        # Write current reconstruction
+        HR_volume = streaming.get_iterative_reconstructions()[0]
+        HR_volume.write(
+            args.dir_output,
+            write_mask=True,
+            suffix_mask=args.suffix_mask,
+            pixel_type=sitk.sitkFloat64)
+
+    if streaming is None:
+        raise IOError("No stack found in '%s'" % args.dir_input)
+
+    elapsed_time_total = ph.stop_timing(time_start)
+
+    # Summary
+    ph.print_title("Summary")
+    print("Number of Ingested Stacks: %d" %
+          (streaming.get_number_of_ingested_stacks()))
+    print("Computational Time for Registrations: %s" %
+          (streaming.get_computational_time_registration()))
+    print("Computational Time for Reconstructions: %s" %
+          (streaming.get_computational_time_reconstruction()))
+    print("Computational Time for Entire Streaming Reconstruction: %s" %
+          (elapsed_time_total))
+
+    ph.print_line_separator()
+
+    return 0
+
+
+if __name__ == '__main__':
+    main()
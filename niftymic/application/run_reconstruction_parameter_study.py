@@ -191,7 +191,7 @@ def main():
             iterations=args.iterations,
             measures=args.measures,
             dimension=3,
-            L2=16./reconstruction_space.sitk.GetSpacing()[0]**2,
+            L2=tmp.get_gradient_norm_squared(),
             reconstruction_type=args.reconstruction_type,
             rho=args.rho,
             dir_output=args.dir_output,
@@ -89,17 +89,21 @@ class ImageDirectoryReader(ImageDataReader):
     # \param      extract_slices     Boolean to indicate whether given 3D image
     #                                shall be split into its slices along the
     #                                k-direction.
+    # \param      precision          Floating point precision of image data,
+    #                                either "double" or "single"
     #
     def __init__(self,
                  path_to_directory,
                  suffix_mask="_mask",
-                 extract_slices=True):
+                 extract_slices=True,
+                 precision="double"):
 
         super(self.__class__, self).__init__()
 
         self._path_to_directory = path_to_directory
         self._suffix_mask = suffix_mask
         self._extract_slices = extract_slices
+        self._precision = precision
 
     ##
     # Reads the image data from the given folder.
@@ -152,7 +156,8 @@ class ImageDirectoryReader(ImageDataReader):
             self._stacks[i] = st.Stack.from_filename(
                 abs_path_image,
                 abs_path_mask,
-                extract_slices=self._extract_slices)
+                extract_slices=self._extract_slices,
+                precision=self._precision)
 
 
 ##
@@ -176,8 +181,14 @@ class MultipleImagesReader(ImageDataReader):
     # \param      extract_slices  Boolean to indicate whether given 3D image
     #                             shall be split into its slices along the
     #                             k-direction.
+    # \param      precision       Floating point precision of image data,
+    #                             either "double" or "single"
     #
-    def __init__(self, file_paths, suffix_mask="_mask", extract_slices=True):
+    def __init__(self,
+                 file_paths,
+                 suffix_mask="_mask",
+                 extract_slices=True,
+                 precision="double"):
 
         super(self.__class__, self).__init__()
 
@@ -185,6 +196,7 @@ class MultipleImagesReader(ImageDataReader):
         self._file_paths = file_paths
         self._suffix_mask = suffix_mask
         self._extract_slices = extract_slices
+        self._precision = precision
 
     ##
     # Reads the data of multiple images.
@@ -232,7 +244,8 @@ class MultipleImagesReader(ImageDataReader):
             self._stacks[i] = st.Stack.from_filename(
                 file_path,
                 abs_path_mask,
-                extract_slices=self._extract_slices)
+                extract_slices=self._extract_slices,
+                precision=self._precision)
 
 
 ##
@@ -256,12 +269,15 @@ class ImageSlicesDirectoryReader(ImageDataReader):
     # \param      suffix_mask        extension of stack filename as string
     #                                indicating associated mask, e.g. "_mask"
     #                                for "A_mask.nii".
+    # \param      precision          Floating point precision of image data,
+    #                                either "double" or "single"
     #
     def __init__(self,
                  path_to_directory,
                  image_selection=None,
                  suffix_mask="_mask",
-                 prefix_slice="_slice"):
+                 prefix_slice="_slice",
+                 precision="double"):
 
         super(self.__class__, self).__init__()
 
@@ -269,6 +285,7 @@ class ImageSlicesDirectoryReader(ImageDataReader):
         self._suffix_mask = suffix_mask
         self._prefix_slice = prefix_slice
         self._image_selection = image_selection
+        self._precision = precision
         self._transforms_sitk = None
 
     def read_data(self):
@@ -318,7 +335,8 @@ class ImageSlicesDirectoryReader(ImageDataReader):
                 dir_input=self._path_to_directory,
                 prefix_stack=filename,
                 suffix_mask=self._suffix_mask,
-                dic_slice_filenames=dic_slice_filenames)
+                dic_slice_filenames=dic_slice_filenames,
+                precision=self._precision)
 
             # Read
             self._slice_transforms_sitk[i] = [
@@ -0,0 +1,137 @@
+##
+# \file precision.py
+# \brief      Helpers to represent image data in either double (float64) or
+#             single (float32) floating point precision across SimpleITK, ITK
+#             and NumPy.
+#
+# \author     Michael Ebner (michael.ebner.14@ucl.ac.uk)
+# \date       March 2018
+#
+
+
+import itk
+import SimpleITK as sitk
+import numpy as np
+
+import pysitk.simple_itk_helper as sitkh
+
+# Allowed floating point precisions
+PRECISIONS = ["double", "single"]
+
+SITK_PIXEL_TYPES = {
+    "double": sitk.sitkFloat64,
+    "single": sitk.sitkFloat32,
+}
+
+ITK_PIXEL_TYPES = {
+    "double": itk.D,
+    "single": itk.F,
+}
+
+NUMPY_DTYPES = {
+    "double": np.float64,
+    "single": np.float32,
+}
+
+
+##
+# Check whether precision is supported
+# \date       2018-03-08 10:02:11+0000
+#
+# \param      precision  Either "double" or "single"
+#
+def check_precision(precision):
+    if precision not in PRECISIONS:
+        raise ValueError("Precision must be in " + str(PRECISIONS))
+
+
+##
+# Gets the precision associated with the pixel type of an image.
+# \date       2018-03-08 10:02:37+0000
+#
+# \param      image_sitk  Image as sitk.Image object
+#
+# \return     "single" in case of sitk.sitkFloat32 pixels, "double" otherwise
+#
+def get_precision(image_sitk):
+    if image_sitk.GetPixelID() == sitk.sitkFloat32:
+        return "single"
+    return "double"
+
+
+def get_sitk_pixel_type(precision):
+    check_precision(precision)
+    return SITK_PIXEL_TYPES[precision]
+
+
+def get_itk_image_type(precision, dimension=3):
+    check_precision(precision)
+    return itk.Image[ITK_PIXEL_TYPES[precision], dimension]
+
+
+def get_numpy_dtype(precision):
+    check_precision(precision)
+    return NUMPY_DTYPES[precision]
+
+
+##
+# Convert sitk.Image object to itk.Image object of given precision.
+#
+# Images in double precision are converted via pysitk. In case of single
+# precision, the itk.Image object is created via the ITK buffer interface.
+# Masks are converted to the same precision as the image they belong to so
+# that both can be combined within the ITK filters.
+# \date       2018-03-08 10:03:14+0000
+#
+# \param      image_sitk  Image as sitk.Image object
+# \param      precision   Either "double" or "single"
+#
+# \return     Image as itk.Image object
+#
+def get_itk_from_sitk_image(image_sitk, precision="double"):
+
+    check_precision(precision)
+
+    if precision == "double":
+        return sitkh.get_itk_from_sitk_image(image_sitk)
+
+    image_type = get_itk_image_type(precision, image_sitk.GetDimension())
+    nda = sitk.GetArrayFromImage(image_sitk).astype(NUMPY_DTYPES[precision])
+
+    image_itk = itk.PyBuffer[image_type].GetImageFromArray(nda)
+    image_itk.SetOrigin(image_sitk.GetOrigin())
+    image_itk.SetSpacing(image_sitk.GetSpacing())
+    image_itk.SetDirection(
+        sitkh.get_itk_from_sitk_direction(image_sitk.GetDirection()))
+
+    return image_itk
+
+
+##
+# Convert itk.Image object of given precision to sitk.Image object
+# \date       2018-03-08 10:05:49+0000
+#
+# \param      image_itk  Image as itk.Image object
+# \param      precision  Either "double" or "single"
+#
+# \return     Image as sitk.Image object
+#
+def get_sitk_from_itk_image(image_itk, precision="double"):
+
+    check_precision(precision)
+
+    if precision == "double":
+        return sitkh.get_sitk_from_itk_image(image_itk)
+
+    image_type = get_itk_image_type(
+        precision, image_itk.GetImageDimension())
+    nda = itk.PyBuffer[image_type].GetArrayFromImage(image_itk)
+
+    image_sitk = sitk.GetImageFromArray(
+        nda.astype(NUMPY_DTYPES[precision]))
+    image_sitk.SetOrigin(tuple(image_itk.GetOrigin()))
+    image_sitk.SetSpacing(tuple(image_itk.GetSpacing()))
+    image_sitk.SetDirection(
+        sitkh.get_sitk_from_itk_direction(image_itk.GetDirection()))
+
+    return image_sitk
@@ -15,6 +15,7 @@ import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
 
 import niftymic.base.exceptions as exceptions
+import niftymic.base.precision as prec
 from niftymic.definitions import VIEWER
 
 # In addition to the nifti-image as being stored as sitk.Image for a single
@@ -22,7 +23,10 @@ from niftymic.definitions import VIEWER
 #  also contains additional variables helpful to work with the data
 
 
-class Slice:
+class Slice(object):
+
+    # Number of changes of the slice images, used to tag cached geometry data
+    _geometry_version = 0
 
     # Create Slice instance with additional information to actual slice
     #  \param[in] slice_sitk 3D slice in \R x \R x 1, sitk.Image object
@@ -45,16 +49,19 @@ class Slice:
         slice._slice_number = slice_number
 
         # Append stacks as SimpleITK and ITK Image objects
+        precision = prec.get_precision(slice_sitk)
         slice.sitk = slice_sitk
-        slice.itk = sitkh.get_itk_from_sitk_image(slice_sitk)
+        slice.itk = prec.get_itk_from_sitk_image(slice_sitk, precision)
 
         # Append masks (if provided)
         if slice_sitk_mask is not None:
             slice.sitk_mask = slice_sitk_mask
-            slice.itk_mask = sitkh.get_itk_from_sitk_image(slice_sitk_mask)
+            slice.itk_mask = prec.get_itk_from_sitk_image(
+                slice_sitk_mask, precision)
         else:
             slice.sitk_mask = slice._generate_identity_mask()
-            slice.itk_mask = sitkh.get_itk_from_sitk_image(slice.sitk_mask)
+            slice.itk_mask = prec.get_itk_from_sitk_image(
+                slice.sitk_mask, precision)
 
         # slice._sitk_upsampled = None
 
@@ -83,6 +90,9 @@ class Slice:
         slice._history_motion_corrections = []
         slice._history_motion_corrections.append(sitk.Euler3DTransform())
 
+        # Number of position updates, used to tag cached geometry data
+        slice._geometry_version = 0
+
         return slice
 
     # Create Stack instance from file and add corresponding mask. Mask is
@@ -93,9 +103,16 @@ class Slice:
     #  \param[in] stack_filename filename extension of parent stack, string
     #  \param[in] slice_number number of slice within parent stack, integer
     #  \param[in] suffix_mask extension of slice filename which indicates associated mask
+    #  \param[in] precision floating point precision of image data, either
+    #             "double" or "single"
     #  \return Stack object including its slices with corresponding masks
     @classmethod
-    def from_filename(cls, file_path, slice_number, file_path_mask=None, verbose=False):
+    def from_filename(cls,
+                      file_path,
+                      slice_number,
+                      file_path_mask=None,
+                      verbose=False,
+                      precision="double"):
 
         slice = cls()
 
@@ -107,8 +124,9 @@ class Slice:
         slice._slice_number = slice_number
 
         # Append stacks as SimpleITK and ITK Image objects
-        slice.sitk = sitk.ReadImage(file_path, sitk.sitkFloat64)
-        slice.itk = sitkh.get_itk_from_sitk_image(slice.sitk)
+        slice.sitk = sitk.ReadImage(
+            file_path, prec.get_sitk_pixel_type(precision))
+        slice.itk = prec.get_itk_from_sitk_image(slice.sitk, precision)
 
         # Append masks (if provided)
         if file_path_mask is None:
@@ -122,7 +140,8 @@ class Slice:
                 raise exceptions.FileNotExistent(file_path_mask)
             slice.sitk_mask = sitk.ReadImage(file_path_mask, sitk.sitkUInt8)
 
-        slice.itk_mask = sitkh.get_itk_from_sitk_image(slice.sitk_mask)
+        slice.itk_mask = prec.get_itk_from_sitk_image(
+            slice.sitk_mask, precision)
 
         # Store current affine transform of image
         slice._affine_transform_sitk = sitkh.get_sitk_affine_transform_from_sitk_image(
@@ -137,6 +156,9 @@ class Slice:
         slice._history_motion_corrections = []
         slice._history_motion_corrections.append(sitk.Euler3DTransform())
 
+        # Number of position updates, used to tag cached geometry data
+        slice._geometry_version = 0
+
         return slice
 
     # Copy constructor
@@ -152,11 +174,13 @@ class Slice:
                              type(slice_to_copy))
 
         # Copy image slice and mask
+        precision = prec.get_precision(slice_to_copy.sitk)
         slice.sitk = sitk.Image(slice_to_copy.sitk)
-        slice.itk = sitkh.get_itk_from_sitk_image(slice.sitk)
+        slice.itk = prec.get_itk_from_sitk_image(slice.sitk, precision)
 
         slice.sitk_mask = sitk.Image(slice_to_copy.sitk_mask)
-        slice.itk_mask = sitkh.get_itk_from_sitk_image(slice.sitk_mask)
+        slice.itk_mask = prec.get_itk_from_sitk_image(
+            slice.sitk_mask, precision)
 
         slice._filename = slice_to_copy.get_filename()
         slice._slice_number = slice_to_copy.get_slice_number()
@@ -174,6 +198,9 @@ class Slice:
 
         slice._history_affine_transforms, slice._history_motion_corrections = slice_to_copy.get_registration_history()
 
+        # Number of position updates, used to tag cached geometry data
+        slice._geometry_version = 0
+
         return slice
 
     ##
@@ -219,6 +246,66 @@ class Slice:
     #     ## Update affine transform of slice, i.e. change image origin and direction in physical space
     #     self._update_affine_transform(affine_transform)
 
+    ##
+    # Gets the geometry version of the slice. It consists of the number of
+    # position updates and image (re)assignments together with the current
+    # origin, direction and spacing of the slice image so that also in-place
+    # changes of the image geometry are captured. Data derived from the slice
+    # (e.g. PSF covariances) can be cached together with it and remains valid
+    # as long as the version does not change.
+    # \date       2018-03-09 13:58:40+0000
+    #
+    # \param      self  The object
+    #
+    # \return     The geometry version as tuple
+    #
+    def get_geometry_version(self):
+        return (self._geometry_version,
+                self._sitk.GetOrigin(),
+                self._sitk.GetDirection(),
+                self._sitk.GetSpacing())
+
+    ##
+    # Image and mask objects of the slice. Reassigning any of them
+    # invalidates data cached for the slice.
+    # \date       2018-04-03 10:12:21+0100
+    #
+    @property
+    def sitk(self):
+        return self._sitk
+
+    @sitk.setter
+    def sitk(self, slice_sitk):
+        self._sitk = slice_sitk
+        self._geometry_version += 1
+
+    @property
+    def itk(self):
+        return self._itk
+
+    @itk.setter
+    def itk(self, slice_itk):
+        self._itk = slice_itk
+        self._geometry_version += 1
+
+    @property
+    def sitk_mask(self):
+        return self._sitk_mask
+
+    @sitk_mask.setter
+    def sitk_mask(self, slice_sitk_mask):
+        self._sitk_mask = slice_sitk_mask
+        self._geometry_version += 1
+
+    @property
+    def itk_mask(self):
+        return self._itk_mask
+
+    @itk_mask.setter
+    def itk_mask(self, slice_itk_mask):
+        self._itk_mask = slice_itk_mask
+        self._geometry_version += 1
+
     # Get filename of slice, e.g. name of parent stack
     #  \return filename, string
     def get_filename(self):
@@ -354,6 +441,9 @@ class Slice:
             self.itk_mask.SetDirection(
                 sitkh.get_itk_from_sitk_direction(direction))
 
+        # Invalidate data cached for the previous position
+        self._geometry_version += 1
+
     # ## Upsample slices in k-direction to in-plane resolution.
     # #  \param[in] slice_sitk slice as sitk.Image object to be upsampled
     # #  \return upsampled slice as sitk.Image object
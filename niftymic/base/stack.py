@@ -18,6 +18,7 @@ import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
 from niftymic.definitions import ALLOWED_EXTENSIONS
 import niftymic.base.exceptions as exceptions
+import niftymic.base.precision as prec
 from niftymic.definitions import VIEWER
 
 
@@ -38,6 +39,8 @@ class Stack:
     # \param[in]  filename     string of nifti-file to read
     # \param[in]  suffix_mask  extension of stack filename which indicates
     #                          associated mask
+    # \param[in]  precision    floating point precision of image data, either
+    #                          "double" or "single"
     # \return     Stack object including its slices with corresponding masks
     #
     @classmethod
@@ -45,7 +48,8 @@ class Stack:
                       file_path,
                       file_path_mask=None,
                       extract_slices=True,
-                      verbose=False):
+                      verbose=False,
+                      precision="double"):
 
         stack = cls()
 
@@ -64,8 +68,9 @@ class Stack:
         stack._filename = filename
 
         # Append stacks as SimpleITK and ITK Image objects
-        stack.sitk = sitk.ReadImage(file_path, sitk.sitkFloat64)
-        stack.itk = sitkh.get_itk_from_sitk_image(stack.sitk)
+        stack.sitk = sitk.ReadImage(
+            file_path, prec.get_sitk_pixel_type(precision))
+        stack.itk = prec.get_itk_from_sitk_image(stack.sitk, precision)
 
         # Append masks (either provided or binary mask)
         if file_path_mask is None:
@@ -81,7 +86,8 @@ class Stack:
             stack._is_unity_mask = False
 
         # Append itk object
-        stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+        stack.itk_mask = prec.get_itk_from_sitk_image(
+            stack.sitk_mask, precision)
 
         # Extract all slices and their masks from the stack and store them
         if extract_slices:
@@ -118,6 +124,8 @@ class Stack:
     # \param      dic_slice_filenames  Dictionary linking slice number (int)
     #                                  with filename (without extension)
     # \param      prefix_slice         The prefix slice
+    # \param      precision            floating point precision of image
+    #                                  data, either "double" or "single"
     #
     # \return     Stack object including its slices with corresponding masks
     # \example    mask (suffix_mask) of slice j of stack i (prefix_stack)
@@ -130,7 +138,8 @@ class Stack:
                              prefix_stack,
                              suffix_mask=None,
                              dic_slice_filenames=None,
-                             prefix_slice="_slice"):
+                             prefix_slice="_slice",
+                             precision="double"):
 
         stack = cls()
 
@@ -142,8 +151,9 @@ class Stack:
 
         # Get 3D images
         stack.sitk = sitk.ReadImage(
-            dir_input + prefix_stack + ".nii.gz", sitk.sitkFloat64)
-        stack.itk = sitkh.get_itk_from_sitk_image(stack.sitk)
+            dir_input + prefix_stack + ".nii.gz",
+            prec.get_sitk_pixel_type(precision))
+        stack.itk = prec.get_itk_from_sitk_image(stack.sitk, precision)
 
         # Append masks (either provided or binary mask)
         if suffix_mask is not None and \
@@ -152,11 +162,13 @@ class Stack:
             stack.sitk_mask = sitk.ReadImage(
                 dir_input + prefix_stack + suffix_mask + ".nii.gz",
                 sitk.sitkUInt8)
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             stack._is_unity_mask = False
         else:
             stack.sitk_mask = stack._generate_identity_mask()
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             stack._is_unity_mask = True
 
         # Get slices
@@ -177,11 +189,13 @@ class Stack:
                     stack._slices[i] = sl.Slice.from_filename(
                         file_path=path_to_slice,
                         slice_number=i,
-                        file_path_mask=path_to_slice_mask)
+                        file_path_mask=path_to_slice_mask,
+                        precision=precision)
                 else:
                     stack._slices[i] = sl.Slice.from_filename(
                         file_path=path_to_slice,
-                        slice_number=i)
+                        slice_number=i,
+                        precision=precision)
         else:
             slice_numbers = sorted(dic_slice_filenames.keys())
             stack._N_slices = len(slice_numbers)
@@ -198,11 +212,13 @@ class Stack:
                     stack._slices[i] = sl.Slice.from_filename(
                         file_path=path_to_slice,
                         slice_number=slice_number,
-                        file_path_mask=path_to_slice_mask)
+                        file_path_mask=path_to_slice_mask,
+                        precision=precision)
                 else:
                     stack._slices[i] = sl.Slice.from_filename(
                         file_path=path_to_slice,
-                        slice_number=slice_number)
+                        slice_number=slice_number,
+                        precision=precision)
 
         return stack
 
@@ -218,13 +234,14 @@ class Stack:
 
         stack._dir = slices[0].get_directory()
         stack._filename = slices[0].get_filename()
+        precision = prec.get_precision(slices[0].sitk)
 
         if stack_sitk is None:
             stack.sitk = None
             stack.itk = None
         else:
             stack.sitk = stack_sitk
-            stack.itk = sitkh.get_itk_from_sitk_image(stack.sitk)
+            stack.itk = prec.get_itk_from_sitk_image(stack.sitk, precision)
 
         stack._N_slices = len(slices)
         stack._slices = slices
@@ -232,12 +249,19 @@ class Stack:
         # Append masks (if provided)
         if mask_sitk is not None:
             stack.sitk_mask = mask_sitk
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             stack._is_unity_mask = False
-        else:
+        elif stack.sitk is not None:
             stack.sitk_mask = stack._generate_identity_mask()
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             stack._is_unity_mask = True
+        else:
+            # Without stack image only the masks of the slices are available
+            stack.sitk_mask = None
+            stack.itk_mask = None
+            stack._is_unity_mask = False
 
         return stack
 
@@ -257,8 +281,9 @@ class Stack:
                         extract_slices=True):
         stack = cls()
 
+        precision = prec.get_precision(image_sitk)
         stack.sitk = sitk.Image(image_sitk)
-        stack.itk = sitkh.get_itk_from_sitk_image(stack.sitk)
+        stack.itk = prec.get_itk_from_sitk_image(stack.sitk, precision)
 
         stack._filename = filename
         stack._dir = None
@@ -266,14 +291,16 @@ class Stack:
         # Append masks (if provided)
         if image_sitk_mask is not None:
             stack.sitk_mask = image_sitk_mask
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             if sitk.GetArrayFromImage(stack.sitk_mask).prod() == 1:
                 stack._is_unity_mask = True
             else:
                 stack._is_unity_mask = False
         else:
             stack.sitk_mask = stack._generate_identity_mask()
-            stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+            stack.itk_mask = prec.get_itk_from_sitk_image(
+                stack.sitk_mask, precision)
             stack._is_unity_mask = True
 
         # Extract all slices and their masks from the stack and store them
@@ -299,11 +326,13 @@ class Stack:
                              type(stack_to_copy))
 
         # Copy image stack and mask
+        precision = prec.get_precision(stack_to_copy.sitk)
         stack.sitk = sitk.Image(stack_to_copy.sitk)
-        stack.itk = sitkh.get_itk_from_sitk_image(stack.sitk)
+        stack.itk = prec.get_itk_from_sitk_image(stack.sitk, precision)
 
         stack.sitk_mask = sitk.Image(stack_to_copy.sitk_mask)
-        stack.itk_mask = sitkh.get_itk_from_sitk_image(stack.sitk_mask)
+        stack.itk_mask = prec.get_itk_from_sitk_image(
+            stack.sitk_mask, precision)
         stack._is_unity_mask = stack_to_copy.is_unity_mask()
 
         if filename is None:
@@ -425,7 +454,8 @@ class Stack:
     #  \param[in] directory string specifying where the output will be written to (default="/tmp/")
     #  \param[in] filename string specifying the filename. If not given the assigned one within Stack will be chosen.
     #  \param[in] write_slices boolean indicating whether each Slice of the stack shall be written (default=False)
-    def write(self, directory, filename=None, write_mask=False, write_slices=False, write_transforms=False, suffix_mask="_mask"):
+    #  \param[in] pixel_type sitk pixel type the image is cast to before writing, e.g. sitk.sitkFloat64 (default=None, i.e. no cast)
+    def write(self, directory, filename=None, write_mask=False, write_slices=False, write_transforms=False, suffix_mask="_mask", pixel_type=None):
 
         # Create directory if not existing
         ph.create_directory(directory)
@@ -439,7 +469,11 @@ class Stack:
         # Write file to specified location
         ph.print_info("Write image stack to %s.nii.gz ... " %
                       (full_file_name), newline=False)
-        sitkh.write_nifti_image_sitk(self.sitk, full_file_name + ".nii.gz")
+        if pixel_type is None:
+            image_sitk = self.sitk
+        else:
+            image_sitk = sitk.Cast(self.sitk, pixel_type)
+        sitkh.write_nifti_image_sitk(image_sitk, full_file_name + ".nii.gz")
         print("done")
 
         # Write mask to specified location if given
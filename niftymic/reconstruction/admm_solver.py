@@ -13,9 +13,10 @@ import SimpleITK as sitk
 import numpy as np
 
 import nsol.admm_linear_solver as admm
-import nsol.linear_operators as linop
+import nsol.tikhonov_linear_solver as tk
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
+import niftymic.base.precision as prec
 from niftymic.reconstruction.solver import Solver
 
 
@@ -49,6 +50,16 @@ class ADMMSolver(Solver):
     #                                       augmented Lagrangian term, scalar
     # \param[in]     iterations             number of ADMM iterations, scalar
     # \param         verbose                The verbose
+    # \param         use_adaptive_rho       Adapt rho by residual balancing
+    #                                       and solve the x-subproblems
+    #                                       inexactly, warm-started from the
+    #                                       previous x, with a number of
+    #                                       iterations (between iter_min and
+    #                                       iter_max) growing as the primal
+    #                                       and dual residuals decrease
+    # \param         iter_min               Minimum number of iterations of
+    #                                       the x-subproblems in case of
+    #                                       use_adaptive_rho
     #
     def __init__(self,
                  stacks,
@@ -66,6 +77,8 @@ class ADMMSolver(Solver):
                  rho=0.5,
                  iterations=10,
                  verbose=1,
+                 use_adaptive_rho=False,
+                 iter_min=2,
                  ):
 
         # Run constructor of superclass
@@ -89,6 +102,13 @@ class ADMMSolver(Solver):
         self._rho = rho
         self._iterations = iterations
 
+        # Settings for residual balancing and inexact x-subproblems
+        self._use_adaptive_rho = use_adaptive_rho
+        self._iter_min = iter_min
+
+        # Current (adapted) rho, carried over between warm-started steps
+        self._rho_adapted = rho
+
     # Set regularization parameter used for augmented Lagrangian in TV-L2 regularization
     #  \[$
     #   \sum_{k=1}^K \frac{1}{2} \Vert y_k - A_k x \Vert_{\ell^2}^2 + \alpha\,\Psi(x)
@@ -117,6 +137,29 @@ class ADMMSolver(Solver):
     def get_iterations(self):
         return self._iterations
 
+    def set_use_adaptive_rho(self, use_adaptive_rho):
+        self._use_adaptive_rho = use_adaptive_rho
+
+    def get_use_adaptive_rho(self):
+        return self._use_adaptive_rho
+
+    def set_iter_min(self, iter_min):
+        self._iter_min = iter_min
+
+    def get_iter_min(self):
+        return self._iter_min
+
+    ##
+    # Gets the value of rho obtained by residual balancing in the last run.
+    # \date       2018-03-26 10:02:41+0100
+    #
+    # \param      self  The object
+    #
+    # \return     rho as scalar
+    #
+    def get_rho_adapted(self):
+        return self._rho_adapted
+
     ##
     #       Gets the setting specific filename indicating the information
     #             used for the reconstruction step
@@ -146,24 +189,32 @@ class ADMMSolver(Solver):
 
         return filename
 
-    def get_solver(self):
+    ##
+    # Gets the NSoL ADMM solver
+    # \date       2018-03-16 09:38:40+0000
+    #
+    # \param      self        The object
+    # \param      x0          initial value as 1D array. If None, the
+    #                         current reconstruction is used.
+    # \param      iterations  Number of ADMM iterations. If None, the chosen
+    #                         number of iterations is used.
+    #
+    # \return     admm.ADMMLinearSolver object
+    #
+    def get_solver(self, x0=None, iterations=None):
+
+        if x0 is None:
+            x0 = self.get_x0()
+        if iterations is None:
+            iterations = self._iterations
 
         # Get operators
         A = self.get_A()
         A_adj = self.get_A_adj()
         b = self.get_b()
-        x0 = self.get_x0()
         x_scale = self.get_x_scale()
 
-        spacing = np.array(self._reconstruction.sitk.GetSpacing())
-        linear_operators = linop.LinearOperators3D(spacing=spacing)
-        grad, grad_adj = linear_operators.get_gradient_operators()
-
-        X_shape = self._reconstruction_shape
-        Z_shape = grad(x0.reshape(*X_shape)).shape
-
-        B = lambda x: grad(x.reshape(*X_shape)).flatten()
-        B_adj = lambda x: grad_adj(x.reshape(*Z_shape)).flatten()
+        B, B_adj = self._get_gradient_operators()
 
         # Set up solver
         solver = admm.ADMMLinearSolver(
@@ -178,7 +229,7 @@ class ADMMSolver(Solver):
             minimizer=self._minimizer,
             iter_max=self._iter_max,
             rho=self._rho,
-            iterations=self._iterations,
+            iterations=iterations,
             verbose=self._verbose,
         )
 
@@ -198,21 +249,209 @@ class ADMMSolver(Solver):
     #
     def _run(self):
 
-        solver = self.get_solver()
-
         self._print_info_text()
 
-        # Run reconstruction
-        solver.run()
+        if self._use_adaptive_rho and self._data_loss != "linear":
+            raise ValueError(
+                "Adaptive rho is only available for data loss 'linear'")
+        self._rho_adapted = self._rho
 
-        # Get computational time
-        self._computational_time = solver.get_computational_time()
+        # Run reconstruction
+        x, self._computational_time = self._run_steps(
+            self._run_step, self.get_x0(), self._iterations)
 
         # Update volume
         self._reconstruction.itk = self._get_itk_image_from_array_vec(
-            solver.get_x(), self._reconstruction.itk)
-        self._reconstruction.sitk = sitkh.get_sitk_from_itk_image(
-            self._reconstruction.itk)
+            self._get_x_full(x), self._reconstruction.itk)
+        self._reconstruction.sitk = prec.get_sitk_from_itk_image(
+            self._reconstruction.itk, self._precision)
+
+    # For fixed rho, the callback is evaluated after each ADMM iteration via
+    # an observer of the NSoL solver
+    def _run_step(self, x0, iterations, callback=None):
+        if self._use_adaptive_rho:
+            return self._run_step_adaptive(x0, iterations, callback)
+        solver = self.get_solver(x0=x0, iterations=iterations)
+        return self._run_nsol_solver(solver, callback)
+
+    ##
+    # Perform ADMM iterations (scaled form) with residual balancing of rho,
+    # see Boyd, S. et al., 2011. Distributed Optimization and Statistical
+    # Learning via the Alternating Direction Method of Multipliers.
+    # Foundations and Trends in Machine Learning, 3(1), pp.1-122.
+    #
+    # The x-subproblems are solved warm-started from the previous x. Their
+    # number of iterations increases from iter_min to iter_max as the sum of
+    # primal and dual residuals decreases by two orders of magnitude; the
+    # last ADMM iteration always uses iter_max. The auxiliary and dual
+    # variables, rho and the reference residual are kept over all iterations,
+    # i.e. convergence checks via the callback do not interrupt them.
+    # \date       2018-03-26 09:31:07+0100
+    #
+    # \param      self        The object
+    # \param      x0          initial value as 1D array
+    # \param      iterations  Number of ADMM iterations
+    # \param      callback    function callback(n, x) called after the n-th
+    #                         ADMM iteration; the iterations are stopped once
+    #                         it returns True. None to perform all iterations
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_step_adaptive(self, x0, iterations, callback=None):
+
+        time_start = ph.start_timing()
+
+        A = self.get_A()
+        A_adj = self.get_A_adj()
+        b = self.get_b()
+        B, B_adj = self._get_gradient_operators()
+
+        x = np.array(x0, dtype=self._dtype)
+        v = B(x)
+        u = np.zeros_like(v)
+
+        # Parameters for residual balancing as suggested by Boyd et al.
+        mu = 10.
+        tau = 2.
+
+        residual_0 = None
+        iter_max = self._iter_min
+        for i in range(0, iterations):
+            if i == iterations - 1:
+                iter_max = self._iter_max
+
+            # x-update: argmin_x 1/2 ||Ax - b||^2 + rho/2 ||Bx - (v - u)||^2
+            x = self._get_x_update(
+                A, A_adj, B, B_adj, b, v - u, self._rho_adapted, x, iter_max)
+
+            # v-update: isotropic shrinkage
+            B_x = B(x)
+            v_prev = v
+            v = self._get_shrinkage(B_x + u, self._alpha / self._rho_adapted)
+
+            # Update of scaled dual variable
+            u += B_x - v
+
+            residual_primal = np.linalg.norm(B_x - v)
+            residual_dual = self._rho_adapted * np.linalg.norm(
+                B_adj(v - v_prev))
+
+            if self._verbose:
+                ph.print_info(
+                    "ADMM iteration %d: rho = %g, primal residual = %g, "
+                    "dual residual = %g (%d inner iterations)" % (
+                        i + 1, self._rho_adapted, residual_primal,
+                        residual_dual, iter_max))
+
+            # Residual balancing. The scaled dual variable u = mu / rho is
+            # rescaled accordingly
+            if residual_primal > mu * residual_dual:
+                self._rho_adapted *= tau
+                u /= tau
+            elif residual_dual > mu * residual_primal:
+                self._rho_adapted /= tau
+                u *= tau
+
+            # Inexact x-subproblems while far from convergence
+            residual = residual_primal + residual_dual
+            if residual_0 is None:
+                residual_0 = residual
+            if residual_0 > 0 and residual > 0:
+                progress = min(1., np.log10(residual_0 / residual) / 2.)
+            else:
+                progress = 1.
+            iter_max = int(np.ceil(
+                self._iter_min +
+                max(0., progress) * (self._iter_max - self._iter_min)))
+
+            if callback is not None and callback(i + 1, x):
+                break
+
+        return x, ph.stop_timing(time_start)
+
+    ##
+    # Solve the x-subproblem of ADMM
+    # \f$ \min_x \frac{1}{2} \Vert A\vec{x} - \vec{b} \Vert_{\ell^2}^2 +
+    # \frac{\rho}{2} \Vert B\vec{x} - \vec{z} \Vert_{\ell^2}^2
+    # \f$ as linear least-squares problem with stacked operator
+    # \f$ [A; \sqrt{\rho} B] \f$. The lsmr minimizer is warm-started from
+    # x0, i.e. run for the correction of x0.
+    # \date       2018-03-26 09:40:55+0100
+    #
+    # \param      self      The object
+    # \param      A         Function call of forward operator
+    # \param      A_adj     Function call of adjoint operator
+    # \param      B         Function call of gradient operator
+    # \param      B_adj     Function call of adjoint gradient operator
+    # \param      b         right hand-side of data term as 1D array
+    # \param      z         right hand-side of augmented term as 1D array
+    # \param      rho       augmented Lagrangian parameter, scalar
+    # \param      x0        initial value as 1D array
+    # \param      iter_max  Maximum number of iterations
+    #
+    # \return     x as 1D array
+    #
+    def _get_x_update(self, A, A_adj, B, B_adj, b, z, rho, x0, iter_max):
+
+        sqrt_rho = np.sqrt(rho)
+        N_b = b.size
+
+        A_aug = lambda x: np.concatenate((A(x), sqrt_rho * B(x)))
+        A_aug_adj = lambda y: \
+            A_adj(y[0:N_b]) + sqrt_rho * B_adj(y[N_b:])
+        b_aug = np.concatenate((b, sqrt_rho * z))
+
+        if self._minimizer == "lsmr":
+            x_scale = self.get_x_scale()
+            x = self._run_lsmr_from_x0(
+                A_aug, A_aug_adj, b_aug / x_scale,
+                np.clip(x0 / x_scale, 0, np.inf), iter_max)[0]
+            return x * x_scale
+
+        I = lambda x: x
+
+        solver = tk.TikhonovLinearSolver(
+            A=A_aug,
+            A_adj=A_aug_adj,
+            B=I,
+            B_adj=I,
+            b=b_aug,
+            x0=x0,
+            x_scale=self.get_x_scale(),
+            alpha=0,
+            data_loss="linear",
+            minimizer=self._minimizer,
+            iter_max=iter_max,
+            verbose=0,
+        )
+        solver.run()
+
+        return solver.get_x()
+
+    ##
+    # Isotropic shrinkage, i.e. the proximal operator of tau times the
+    # isotropic TV norm applied to stacked gradient components
+    # \date       2018-03-26 09:45:13+0100
+    #
+    # \param      self  The object
+    # \param      z     stacked gradient components as 1D array
+    # \param      tau   threshold, scalar
+    #
+    # \return     shrunk components as 1D array
+    #
+    def _get_shrinkage(self, z, tau):
+
+        dimension = len(self._reconstruction_shape)
+        z = z.reshape(dimension, -1)
+        norms = np.sqrt(np.sum(z**2, axis=0))
+
+        scale = np.zeros_like(norms)
+        scale[norms > tau] = 1. - tau / norms[norms > tau]
+
+        return (z * scale).flatten()
+
+    def _get_regularizer_value(self, x):
+        return self._get_total_variation(x)
 
     def _print_info_text(self):
         ph.print_subtitle("ADMM Solver:")
@@ -220,6 +459,8 @@ class ADMMSolver(Solver):
         ph.print_info("Regularization parameter alpha: " + str(self._alpha))
         ph.print_info(
             "Regularization parameter of augmented Lagrangian term rho: " + str(self._rho))
+        if self._use_adaptive_rho:
+            ph.print_info("Adaptive rho by residual balancing: yes")
         ph.print_info("Number of ADMM iterations: " + str(self._iterations))
         ph.print_info(
             "Maximum number of TK1 solver iterations: " + str(self._iter_max))
@@ -0,0 +1,456 @@
+##
+# \file block_reconstruction.py
+# \brief      Domain-decomposed Tikhonov reconstruction for very large
+#             reconstruction grids.
+#
+# The reconstruction space is split into overlapping blocks (sub-volumes).
+# Each block is reconstructed independently by a TikhonovSolver using only
+# the slices whose footprint intersects the block. The block solutions are
+# blended by linear ramps across the overlaps. Hence, the memory required
+# per block solve is bounded by the block size and the blocks can be solved
+# in parallel processes.
+#
+# \author     Michael Ebner (michael.ebner.14@ucl.ac.uk)
+# \date       March 2018
+#
+
+# Import libraries
+import os
+import multiprocessing
+import SimpleITK as sitk
+import numpy as np
+
+import pysitk.python_helper as ph
+
+import niftymic.base.precision as prec
+import niftymic.base.stack as st
+import niftymic.reconstruction.slice_footprint_index as sfi
+import niftymic.reconstruction.tikhonov_solver as tk
+
+# Block reconstruction object accessed by the forked worker processes. ITK
+# images cannot be pickled, i.e. the workers inherit all data via fork.
+# Hence, the worker processes are always started by fork, independent of the
+# platform's default start method.
+_BLOCK_RECONSTRUCTION = None
+
+
+def _run_block_process(i):
+    return i, _BLOCK_RECONSTRUCTION._run_block(i)
+
+
+##
+# Gets the multiprocessing context starting processes by fork, or None if
+# fork is not available on this platform. Python 2 always forks on POSIX
+# platforms.
+# \date       2018-03-30 10:08:42+0100
+#
+# \return     multiprocessing context or module, or None
+#
+def _get_fork_context():
+    if not hasattr(multiprocessing, "get_context"):
+        return multiprocessing if hasattr(os, "fork") else None
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+class BlockReconstruction(object):
+
+    ##
+    # Constructor
+    # \date          2018-03-30 10:12:05+0100
+    #
+    # \param         self                   The object
+    # \param         stacks                 list of Stack objects containing
+    #                                       all stacks used for the
+    #                                       reconstruction
+    # \param[in,out] reconstruction         Stack object containing the current
+    #                                       estimate of the reconstruction
+    #                                       volume (used as initial value +
+    #                                       space definition)
+    # \param         block_size             Size of the blocks in voxels,
+    #                                       either scalar or in itk.Image index
+    #                                       order (i, j, k)
+    # \param         overlap                Overlap of neighbouring blocks in
+    #                                       voxels, either scalar or in
+    #                                       itk.Image index order (i, j, k)
+    # \param         n_processes            Number of (forked) processes
+    #                                       solving the blocks in parallel.
+    #                                       Blocks are solved sequentially on
+    #                                       platforms without fork.
+    # \param         alpha_cut              Cut-off distance for Gaussian
+    #                                       blurring filter
+    # \param         alpha                  regularization parameter, scalar
+    # \param         iter_max               number of maximum iterations,
+    #                                       scalar
+    # \param         reg_type               Type of Tikhonov regualrization,
+    #                                       i.e. TK0 or TK1 for either zeroth-
+    #                                       or first order Tikhonov
+    # \param         minimizer              Type of minimizer used to solve
+    #                                       minimization problem
+    # \param         deconvolution_mode     Either "full_3D" or
+    #                                       "only_in_plane". Indicates whether
+    #                                       full 3D or only in-plane
+    #                                       deconvolution is considered
+    # \param         predefined_covariance  The predefined covariance
+    # \param         use_masks              Use masks in the data fidelity
+    #                                       term
+    # \param         n_threads              Number of threads per block solve
+    # \param         verbose                The verbose
+    #
+    def __init__(self,
+                 stacks,
+                 reconstruction,
+                 block_size=64,
+                 overlap=8,
+                 n_processes=1,
+                 alpha_cut=3,
+                 alpha=0.03,
+                 iter_max=10,
+                 reg_type="TK1",
+                 minimizer="lsmr",
+                 deconvolution_mode="full_3D",
+                 predefined_covariance=None,
+                 use_masks=True,
+                 n_threads=1,
+                 verbose=0,
+                 ):
+
+        self._stacks = stacks
+        self._reconstruction = reconstruction
+        self._block_size = block_size
+        self._overlap = overlap
+        self._n_processes = n_processes
+
+        self._alpha_cut = alpha_cut
+        self._alpha = alpha
+        self._iter_max = iter_max
+        self._reg_type = reg_type
+        self._minimizer = minimizer
+        self._deconvolution_mode = deconvolution_mode
+        self._predefined_covariance = predefined_covariance
+        self._use_masks = use_masks
+        self._n_threads = n_threads
+        self._verbose = verbose
+
+        self._computational_time = None
+        self._footprint_index = None
+
+    def set_block_size(self, block_size):
+        self._block_size = block_size
+
+    def get_block_size(self):
+        return self._block_size
+
+    def set_overlap(self, overlap):
+        self._overlap = overlap
+
+    def get_overlap(self):
+        return self._overlap
+
+    def set_n_processes(self, n_processes):
+        self._n_processes = n_processes
+
+    def get_n_processes(self):
+        return self._n_processes
+
+    def set_alpha(self, alpha):
+        self._alpha = alpha
+
+    def get_alpha(self):
+        return self._alpha
+
+    def get_reconstruction(self):
+        return self._reconstruction
+
+    def get_computational_time(self):
+        return self._computational_time
+
+    ##
+    #       Gets the setting specific filename indicating the information
+    #             used for the reconstruction step
+    # \date       2018-03-30 10:14:21+0100
+    #
+    # \param      self    The object
+    # \param      prefix  The prefix as string
+    #
+    # \return     The setting specific filename as string.
+    #
+    def get_setting_specific_filename(self, prefix="SRR_"):
+
+        # Build filename
+        filename = prefix
+        filename += "stacks" + str(len(self._stacks))
+        if self._alpha > 0:
+            filename += "_" + self._reg_type
+        filename += "_" + self._minimizer
+        filename += "_alpha" + str(self._alpha)
+        filename += "_itermax" + str(self._iter_max)
+        filename += "_blocks" + str(len(self.get_blocks()))
+
+        # Replace dots by 'p'
+        filename = filename.replace(".", "p")
+
+        return filename
+
+    ##
+    # Gets the overlapping blocks covering the reconstruction space. Blocks
+    # along each axis are shifted by block_size - overlap; the last block is
+    # aligned with the end of the reconstruction space.
+    # \date       2018-03-30 10:16:40+0100
+    #
+    # \param      self  The object
+    #
+    # \return     list of tuples (index, size) of integer numpy arrays in
+    #             itk.Image index order (i, j, k)
+    #
+    def get_blocks(self):
+
+        size_r = np.array(self._reconstruction.sitk.GetSize())
+        block_size = np.minimum(
+            np.ones(3, dtype=int) * self._block_size, size_r).astype(int)
+        overlap = np.ones(3, dtype=int) * self._overlap
+
+        if np.any((overlap >= block_size) & (block_size < size_r)):
+            raise ValueError("Overlap must be smaller than the block size")
+
+        starts = []
+        for i in range(0, 3):
+            step = max(1, block_size[i] - overlap[i])
+            starts_i = list(range(0, size_r[i] - block_size[i] + 1, step))
+            if starts_i[-1] + block_size[i] < size_r[i]:
+                starts_i.append(size_r[i] - block_size[i])
+            starts.append(starts_i)
+
+        blocks = []
+        for k in starts[2]:
+            for j in starts[1]:
+                for i in starts[0]:
+                    blocks.append((np.array([i, j, k]), block_size))
+
+        return blocks
+
+    ##
+    # Reconstruct all blocks and blend them into the reconstruction
+    # \date       2018-03-30 10:19:02+0100
+    #
+    # \param      self  The object
+    #
+    def run(self):
+
+        global _BLOCK_RECONSTRUCTION
+
+        time_start = ph.start_timing()
+
+        # Footprints of all slices are computed once before the blocks get
+        # distributed to the workers
+        self._footprint_index = sfi.SliceFootprintIndex(
+            slices=[s for stack in self._stacks for s in stack.get_slices()],
+            reconstruction=self._reconstruction,
+            alpha_cut=self._alpha_cut,
+            deconvolution_mode=self._deconvolution_mode,
+            predefined_covariance=self._predefined_covariance,
+        )
+        self._footprint_index.update()
+
+        blocks = self.get_blocks()
+        ph.print_info("Block reconstruction: %d blocks of size %s "
+                      "(overlap %s voxels)" % (
+                          len(blocks), str(blocks[0][1]), str(self._overlap)))
+
+        # Block solutions are blended by weighted averaging as soon as they
+        # arrive so that only one block result is held at a time
+        nda = sitk.GetArrayFromImage(self._reconstruction.sitk)
+        nda_sum = np.zeros(nda.shape)
+        weight_sum = np.zeros(nda.shape)
+
+        context = None
+        if self._n_processes > 1:
+            context = _get_fork_context()
+            if context is None:
+                ph.print_warning(
+                    "Start method 'fork' is not available on this platform. "
+                    "Blocks are reconstructed sequentially.")
+
+        if context is not None:
+            _BLOCK_RECONSTRUCTION = self
+            pool = context.Pool(self._n_processes)
+            try:
+                for i, nda_block in pool.imap_unordered(
+                        _run_block_process, range(len(blocks))):
+                    self._add_block(
+                        blocks[i], nda_block, nda_sum, weight_sum)
+            finally:
+                pool.close()
+                pool.join()
+                _BLOCK_RECONSTRUCTION = None
+        else:
+            for i in range(len(blocks)):
+                self._add_block(
+                    blocks[i], self._run_block(i), nda_sum, weight_sum)
+
+        # Voxels not covered by any slice keep their initial value
+        ind = weight_sum > 0
+        nda = nda.astype(np.float64)
+        nda[ind] = nda_sum[ind] / weight_sum[ind]
+
+        precision = prec.get_precision(self._reconstruction.sitk)
+        reconstruction_sitk = sitk.GetImageFromArray(
+            nda.astype(prec.get_numpy_dtype(precision)))
+        reconstruction_sitk.CopyInformation(self._reconstruction.sitk)
+        self._reconstruction.sitk = reconstruction_sitk
+        self._reconstruction.itk = prec.get_itk_from_sitk_image(
+            reconstruction_sitk, precision)
+
+        self._computational_time = ph.stop_timing(time_start)
+
+    ##
+    # Add weighted block solution to the blending accumulators
+    # \date       2018-03-30 10:20:12+0100
+    #
+    # \param      self        The object
+    # \param      block       tuple (index, size) of the block
+    # \param      nda_block   Block data array in numpy index order or None
+    # \param      nda_sum     Accumulator of weighted block solutions
+    # \param      weight_sum  Accumulator of blending weights
+    #
+    def _add_block(self, block, nda_block, nda_sum, weight_sum):
+        if nda_block is None:
+            return
+        index, size = block
+        region = tuple(slice(index[i], index[i] + size[i])
+                       for i in range(2, -1, -1))
+        weights = self._get_blending_weights(index, size)
+        nda_sum[region] += weights * nda_block
+        weight_sum[region] += weights
+
+    ##
+    # Reconstruct a single block
+    # \date       2018-03-30 10:21:33+0100
+    #
+    # \param      self  The object
+    # \param      i     Index of the block
+    #
+    # \return     Reconstructed block data array in numpy index order or None
+    #             in case no slice intersects the block
+    #
+    def _run_block(self, i):
+
+        index, size = self.get_blocks()[i]
+
+        reconstruction_block = self._get_block_stack(index, size)
+        stacks_block = self._get_block_stacks(index, size)
+        if len(stacks_block) == 0:
+            return None
+
+        if self._verbose:
+            ph.print_info("Block %d: %d slices" % (
+                i + 1, sum([s.get_number_of_slices() for s in stacks_block])))
+
+        solver = tk.TikhonovSolver(
+            stacks=stacks_block,
+            reconstruction=reconstruction_block,
+            alpha_cut=self._alpha_cut,
+            alpha=self._alpha,
+            iter_max=self._iter_max,
+            reg_type=self._reg_type,
+            minimizer=self._minimizer,
+            deconvolution_mode=self._deconvolution_mode,
+            predefined_covariance=self._predefined_covariance,
+            use_masks=self._use_masks,
+            n_threads=self._n_threads,
+            verbose=0,
+        )
+        solver.run()
+
+        return sitk.GetArrayFromImage(solver.get_reconstruction().sitk)
+
+    ##
+    # Gets the reconstruction restricted to a block as Stack object
+    # \date       2018-03-30 10:23:12+0100
+    #
+    # \param      self   The object
+    # \param      index  Start index of block in (i, j, k), numpy array
+    # \param      size   Size of block in (i, j, k), numpy array
+    #
+    # \return     Stack object
+    #
+    def _get_block_stack(self, index, size):
+
+        index = [int(i) for i in index]
+        size = [int(s) for s in size]
+
+        block_sitk = sitk.RegionOfInterest(
+            self._reconstruction.sitk, size, index)
+        block_sitk_mask = sitk.RegionOfInterest(
+            self._reconstruction.sitk_mask, size, index)
+
+        return st.Stack.from_sitk_image(
+            block_sitk,
+            filename=self._reconstruction.get_filename(),
+            image_sitk_mask=block_sitk_mask,
+            extract_slices=False)
+
+    ##
+    # Gets the stacks consisting of the slices whose footprint intersects the
+    # block
+    # \date       2018-03-30 10:24:50+0100
+    #
+    # \param      self   The object
+    # \param      index  Start index of block in (i, j, k), numpy array
+    # \param      size   Size of block in (i, j, k), numpy array
+    #
+    # \return     list of Stack objects
+    #
+    def _get_block_stacks(self, index, size):
+
+        slices_block = set(
+            self._footprint_index.get_slices_in_region(index, size))
+
+        stacks_block = []
+        for stack in self._stacks:
+            slices = [slice_k for slice_k in stack.get_slices()
+                      if slice_k in slices_block]
+            if len(slices) > 0:
+                # The parent stack image is kept as header; block stacks with
+                # a subset of slices are never treated as rigid stacks by the
+                # solver
+                stacks_block.append(st.Stack.from_slices(
+                    slices,
+                    stack_sitk=stack.sitk,
+                    mask_sitk=stack.sitk_mask))
+
+        return stacks_block
+
+    ##
+    # Gets the weights for blending a block. Weights decrease linearly across
+    # the overlap towards block faces which are shared with neighbouring
+    # blocks and are one elsewhere.
+    # \date       2018-03-30 10:26:31+0100
+    #
+    # \param      self   The object
+    # \param      index  Start index of block in (i, j, k), numpy array
+    # \param      size   Size of block in (i, j, k), numpy array
+    #
+    # \return     Weights as numpy array in numpy index order
+    #
+    def _get_blending_weights(self, index, size):
+
+        size_r = np.array(self._reconstruction.sitk.GetSize())
+        overlap = np.ones(3, dtype=int) * self._overlap
+
+        weights_1d = []
+        for i in range(0, 3):
+            w = np.ones(size[i])
+            ramp = (np.arange(0, overlap[i]) + 1.) / (overlap[i] + 1.)
+            n = min(overlap[i], size[i])
+            if index[i] > 0:
+                w[0:n] = np.minimum(w[0:n], ramp[0:n])
+            if index[i] + size[i] < size_r[i]:
+                w[size[i] - n:] = np.minimum(
+                    w[size[i] - n:], ramp[0:n][::-1])
+            weights_1d.append(w)
+
+        return weights_1d[2][:, np.newaxis, np.newaxis] * \
+            weights_1d[1][np.newaxis, :, np.newaxis] * \
+            weights_1d[0][np.newaxis, np.newaxis, :]
@@ -0,0 +1,190 @@
+##
+# \file gradient_operators.py
+# \brief      Implementation of the gradient and its adjoint (negative
+#             divergence) on the reconstruction grid using forward differences
+#             with zero extension beyond the grid, consistent with the
+#             gradient operators of NSoL.
+#
+# All differences are computed via in-place NumPy slicing on preallocated
+# work buffers, i.e. an evaluation allocates at most its output array. The
+# operators can act on the full reconstruction grid or on the unknowns
+# restricted to a set of voxels (e.g. a dilated reconstruction mask) whereby
+# all remaining voxels are considered zero.
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+# Import libraries
+import numpy as np
+
+
+##
+# Class implementing the gradient and its adjoint on a regular grid
+# \date       2018-03-27 09:12:30+0100
+#
+class GradientOperators(object):
+
+    ##
+    # Store relevant information and allocate work buffers
+    # \date       2018-03-27 09:13:05+0100
+    #
+    # \param      self     The object
+    # \param      shape    Shape of the grid in numpy index order (k, j, i)
+    # \param      spacing  Spacing of the grid in itk.Image index order
+    #                      (i, j, k)
+    # \param      dtype    Data type of the evaluations
+    # \param      indices  Sorted flat indices of the grid voxels forming the
+    #                      unknowns. If None, the full grid is used.
+    #
+    def __init__(self, shape, spacing, dtype=np.float64, indices=None):
+
+        self._shape = tuple(shape)
+        self._dimension = len(self._shape)
+        self._dtype = dtype
+        self._indices = indices
+
+        # Gradient components are ordered as (i, j, k), i.e. the first
+        # component refers to the last numpy axis
+        self._axes = list(range(self._dimension))[::-1]
+        self._spacing = np.array(spacing, dtype=np.float64)
+
+        # Grid data in case of restricted unknowns. Voxels outside the
+        # restricted domain are never written and hence remain zero
+        if self._indices is not None:
+            self._x_full = np.zeros(self._shape, dtype=self._dtype)
+            self._z_full = np.zeros(self._shape, dtype=self._dtype)
+        else:
+            self._x_full = None
+            self._z_full = None
+
+        # Work buffer for scaled gradient components
+        self._work = np.zeros(self._shape, dtype=self._dtype)
+
+    ##
+    # Gets the number of elements of the gradient
+    # \date       2018-03-27 09:14:10+0100
+    #
+    # \param      self  The object
+    #
+    # \return     number of elements as integer
+    #
+    def get_gradient_size(self):
+        return self._dimension * int(np.prod(self._shape))
+
+    ##
+    # Gets the function calls of gradient and adjoint gradient mapping from
+    # and to 1D arrays
+    # \date       2018-03-27 09:14:45+0100
+    #
+    # \param      self  The object
+    #
+    # \return     Function calls B and B_adj
+    #
+    def get_gradient_operators(self):
+        return self.grad, self.grad_adj
+
+    ##
+    # Evaluate the gradient using forward differences with zero extension,
+    # i.e. the difference at the last voxel along each axis is the negative
+    # voxel value.
+    # \date       2018-03-27 09:16:21+0100
+    #
+    # \param      self   The object
+    # \param      x_vec  Unknowns as 1D array
+    # \param      out    Optional 1D output array of size get_gradient_size()
+    #
+    # \return     Stacked gradient components as 1D array
+    #
+    def grad(self, x_vec, out=None):
+
+        x = self._get_x_full(x_vec)
+
+        if out is None:
+            out = np.empty(self.get_gradient_size(), dtype=self._dtype)
+        z = out.reshape((self._dimension,) + self._shape)
+
+        for c, axis in enumerate(self._axes):
+            upper = self._get_slicing(axis, 1, None)
+            lower = self._get_slicing(axis, None, -1)
+            last = self._get_slicing(axis, -1, None)
+
+            np.subtract(x[upper], x[lower], out=z[c][lower])
+            np.negative(x[last], out=z[c][last])
+            z[c] *= 1. / self._spacing[c]
+
+        return out
+
+    ##
+    # Evaluate the adjoint of the gradient, i.e. the negative divergence
+    # using backward differences.
+    # \date       2018-03-27 09:18:40+0100
+    #
+    # \param      self   The object
+    # \param      z_vec  Stacked gradient components as 1D array
+    # \param      out    Optional 1D output array of the size of the unknowns
+    #
+    # \return     Adjoint gradient as 1D array
+    #
+    def grad_adj(self, z_vec, out=None):
+
+        z = z_vec.reshape((self._dimension,) + self._shape)
+
+        if self._indices is None:
+            if out is None:
+                out = np.empty(int(np.prod(self._shape)), dtype=self._dtype)
+            x = out.reshape(self._shape)
+        else:
+            x = self._z_full
+        x[:] = 0
+
+        for c, axis in enumerate(self._axes):
+            upper = self._get_slicing(axis, 1, None)
+            lower = self._get_slicing(axis, None, -1)
+
+            np.multiply(z[c], 1. / self._spacing[c], out=self._work)
+            x -= self._work
+            x[upper] += self._work[lower]
+
+        if self._indices is None:
+            return out
+
+        if out is None:
+            out = np.empty(self._indices.size, dtype=self._dtype)
+        np.take(x.ravel(), self._indices, out=out)
+
+        return out
+
+    ##
+    # Gets the unknowns as array on the full grid
+    # \date       2018-03-27 09:20:02+0100
+    #
+    # \param      self   The object
+    # \param      x_vec  Unknowns as 1D array
+    #
+    # \return     Grid data as numpy array of given shape
+    #
+    def _get_x_full(self, x_vec):
+
+        if self._indices is None:
+            return x_vec.reshape(self._shape)
+
+        self._x_full.ravel()[self._indices] = x_vec
+
+        return self._x_full
+
+    ##
+    # Gets the tuple of slices selecting a range along one axis
+    # \date       2018-03-27 09:20:45+0100
+    #
+    # \param      self   The object
+    # \param      axis   The axis
+    # \param      start  Start index of range
+    # \param      stop   Stop index of range
+    #
+    # \return     tuple of slice objects
+    #
+    def _get_slicing(self, axis, start, stop):
+        slicing = [slice(None)] * self._dimension
+        slicing[axis] = slice(start, stop)
+        return tuple(slicing)
@@ -9,7 +9,9 @@
 
 # Import libraries
 import itk
+import weakref
 import numpy as np
+import scipy.sparse
 
 import pysitk.simple_itk_helper as sitkh
 
@@ -49,6 +51,7 @@ class LinearOperators(object):
                  default_pixel_type=0.0):
 
         self._deconvolution_mode = deconvolution_mode
+        self._alpha_cut = alpha_cut
 
         # In case only diagonal entries are given, create diagonal matrix
         if predefined_covariance is not None:
@@ -80,12 +83,27 @@ class LinearOperators(object):
         self._masking = itk.MultiplyImageFilter[
             image_type, image_type, image_type].New()
 
+        # Create PyBuffer object for conversion between NumPy arrays and ITK
+        # images
+        self._itk2np = itk.PyBuffer[image_type]
+
         self._get_covariance = {
             "full_3D": self._get_covariance_full_3d,
             "only_in_plane": self._get_covariance_only_in_plane,
             "predefined_covariance": self._get_covariance_predefined,
         }
 
+        # Caches of PSF covariances and separable operators keyed by the Slice
+        # objects. Entries are tagged with the geometry version of the slice,
+        # i.e. they are recomputed once the slice has been moved by
+        # update_motion_correction, and dropped together with the slice.
+        self._covariance_cache = weakref.WeakKeyDictionary()
+        self._separable_operators_cache = weakref.WeakKeyDictionary()
+
+        # Geometry (origin, spacing, direction, size) of the reconstruction
+        # space the cached data refers to (see set_reconstruction_space)
+        self._reconstruction_geometry = None
+
     ##
     # Perform forward operation on reconstruction image, i.e.
     # \f$y = D B x =: A(x)
@@ -100,15 +118,17 @@ class LinearOperators(object):
     # \param      slice_itk           Slice image as itk.Image object. Required
     #                                 to define output space and orientation
     #                                 for PSF.
+    # \param      slice_k             Slice object the slice image belongs to.
+    #                                 If given, the PSF covariance is cached
+    #                                 for it (see get_covariance)
     #
     # \return     Image A(x) as itk.Image object in slice_itk image space
     #
-    def A_itk(self, reconstruction_itk, slice_itk):
+    def A_itk(self, reconstruction_itk, slice_itk, slice_k=None):
 
         # Get covariance describing PSF orientation of slice in reconstruction
         # space
-        cov = self._get_covariance[self._deconvolution_mode](
-            reconstruction_itk, slice_itk)
+        cov = self.get_covariance(reconstruction_itk, slice_itk, slice_k)
 
         reconstruction_itk.Update()
         self._filter_oriented_gaussian.SetCovariance(cov.flatten())
@@ -192,16 +212,18 @@ class LinearOperators(object):
     # \param      reconstruction_itk  Reconstruction image as itk.Image object.
     #                                 Required to define output space and
     #                                 orientation for PSF
+    # \param      slice_k             Slice object the slice image belongs to.
+    #                                 If given, the PSF covariance is cached
+    #                                 for it (see get_covariance)
     #
     # \return     Image A^*(y) as itk.Image object in reconstruction_itk image
     #             space
     #
-    def A_adj_itk(self, slice_itk, reconstruction_itk):
+    def A_adj_itk(self, slice_itk, reconstruction_itk, slice_k=None):
 
         # Get covariance describing PSF orientation of slice in reconstruction
         # space
-        cov = self._get_covariance[self._deconvolution_mode](
-            reconstruction_itk, slice_itk)
+        cov = self.get_covariance(reconstruction_itk, slice_itk, slice_k)
 
         reconstruction_itk.Update()
         self._filter_adjoint_oriented_gaussian.SetCovariance(cov.flatten())
@@ -238,6 +260,492 @@ class LinearOperators(object):
 
         return Mk_slice_itk
 
+    ##
+    # Get the forward operation A as sparse matrix, i.e.
+    # \f$ A \in \mathbb{R}^{N_k \times N} \f$ mapping the flattened
+    # reconstruction data array onto the flattened slice data array.
+    #
+    # The weights are given by the oriented Gaussian PSF evaluated at the
+    # reconstruction voxel centres within the cut-off bounding box around each
+    # slice voxel centre and normalized to sum up to one. This mirrors the
+    # computation of the OrientedGaussianInterpolateImageFilter used in
+    # A_itk. If a slice mask is provided, the masking operation is
+    # incorporated, i.e. the matrix representation of M_k A_k is returned.
+    # \date       2018-03-05 10:12:47+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object. Required
+    #                                 to define output space and orientation
+    #                                 for PSF.
+    # \param      slice_itk_mask      Slice image mask as itk.Image object
+    #                                 (optional)
+    # \param      max_chunk_size      Maximum number of evaluated weights
+    #                                 held in memory at once, integer
+    # \param      slice_k             Slice object the slice image belongs to.
+    #                                 If given, the PSF covariance is cached
+    #                                 for it (see get_covariance)
+    #
+    # \return     Sparse matrix of shape (N_k, N) as scipy.sparse.csr_matrix
+    #
+    def get_A_sparse(self,
+                     reconstruction_itk,
+                     slice_itk,
+                     slice_itk_mask=None,
+                     max_chunk_size=int(5e6),
+                     slice_k=None):
+
+        # Get covariance describing PSF orientation of slice in reconstruction
+        # space
+        cov = self.get_covariance(reconstruction_itk, slice_itk, slice_k)
+        cov_inv = np.linalg.inv(cov)
+
+        spacing_r = np.array(reconstruction_itk.GetSpacing())
+        size_r = np.array(
+            reconstruction_itk.GetLargestPossibleRegion().GetSize())
+        size_s = np.array(slice_itk.GetLargestPossibleRegion().GetSize())
+
+        N_slice_voxels = size_s.prod()
+        N_voxels = size_r.prod()
+
+        # Affine map from slice voxel index to continuous reconstruction index
+        M, t = self._get_slice_to_reconstruction_index_map(
+            reconstruction_itk, slice_itk)
+
+        # Slice voxel indices (i, j, k) in order of the flattened data array
+        indices_s = np.indices(size_s[::-1]).reshape(3, -1)[::-1]
+        rows = np.arange(N_slice_voxels)
+
+        # Only consider voxels within the slice mask (M_k A_k)
+        if slice_itk_mask is not None:
+            nda_mask = self._itk2np.GetArrayFromImage(slice_itk_mask).flatten()
+            rows = rows[nda_mask[rows] != 0]
+
+        # Slice voxel centres outside the reconstruction space are assigned
+        # the default pixel value zero
+        cindices = M.dot(indices_s[:, rows]) + t[:, np.newaxis]
+        is_inside = np.all(
+            (cindices >= -0.5) &
+            (cindices < size_r[:, np.newaxis] - 0.5), axis=0)
+        rows = rows[is_inside]
+        cindices = cindices[:, is_inside]
+
+        # Cut-off distance in reconstruction voxel units
+        cutoff = self._alpha_cut * np.sqrt(np.diag(cov)) / spacing_r
+
+        # Candidate offsets within the bounding box of the cut-off region
+        # [floor(c + 0.5 - cutoff), ceil(c + 0.5 + cutoff))
+        box_size = np.ceil(2 * cutoff).astype(int) + 1
+        offsets = np.indices(box_size).reshape(3, -1)
+
+        N_rows_chunk = max(1, max_chunk_size // offsets.shape[1])
+
+        data_list = []
+        rows_list = []
+        cols_list = []
+        for i in range(0, len(rows), N_rows_chunk):
+            rows_chunk = rows[i:i + N_rows_chunk]
+            cindices_chunk = cindices[:, i:i + N_rows_chunk]
+
+            begin = np.floor(cindices_chunk + 0.5 - cutoff[:, np.newaxis])
+            end = np.ceil(cindices_chunk + 0.5 + cutoff[:, np.newaxis])
+
+            # Reconstruction voxel indices of shape (3, N_rows, N_offsets)
+            voxels = begin[:, :, np.newaxis] + offsets[:, np.newaxis, :]
+            is_valid = np.all(
+                (voxels < end[:, :, np.newaxis]) &
+                (voxels >= 0) &
+                (voxels < size_r[:, np.newaxis, np.newaxis]), axis=0)
+
+            # Distance to slice voxel centre in mm, expressed in the
+            # coordinate system of the reconstruction space
+            diff = (voxels - cindices_chunk[:, :, np.newaxis]) * \
+                spacing_r[:, np.newaxis, np.newaxis]
+            exponent = np.einsum("inm,ij,jnm->nm", diff, cov_inv, diff)
+            weights = np.exp(-0.5 * exponent) * is_valid
+
+            # Normalize weights to sum up to one for each slice voxel
+            weights_sum = weights.sum(axis=1)
+            weights_sum[weights_sum == 0] = 1
+            weights /= weights_sum[:, np.newaxis]
+
+            voxels = voxels.astype(int)
+            cols = (voxels[2] * size_r[1] + voxels[1]) * size_r[0] + voxels[0]
+
+            data_list.append(weights[is_valid])
+            cols_list.append(cols[is_valid])
+            rows_list.append(np.repeat(rows_chunk, is_valid.sum(axis=1)))
+
+        if len(data_list) > 0:
+            data = np.concatenate(data_list)
+            rows = np.concatenate(rows_list)
+            cols = np.concatenate(cols_list)
+        else:
+            data = rows = cols = []
+
+        A_sparse = scipy.sparse.csr_matrix(
+            (data, (rows, cols)), shape=(N_slice_voxels, N_voxels))
+
+        return A_sparse
+
+    ##
+    # Get the forward operation A as separable operator in case the slice and
+    # reconstruction grids are axis-aligned, i.e. each slice axis is parallel
+    # to one reconstruction axis with the same index and the PSF covariance
+    # is diagonal in the reconstruction space.
+    #
+    # In this case, the oriented Gaussian weights (including their cut-off box
+    # and normalization) factorize along the axes so that
+    # \f$ A = A_z \otimes A_y \otimes A_x \f$ with small one-dimensional
+    # blurring-and-sampling matrices. This holds, e.g., for stacks prior to any
+    # motion correction and a reconstruction space obtained by resampling one
+    # of them. The weights mirror the ones of get_A_sparse.
+    #
+    # If a Slice object is given, the result is cached for it until the slice
+    # is moved. As for the covariances, cached entries refer to the
+    # reconstruction grid they were computed for.
+    # \date       2018-03-20 09:11:37+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object
+    # \param      tolerance           Relative tolerance to decide whether the
+    #                                 grids are axis-aligned
+    # \param      slice_k             Slice object the slice image belongs to
+    #                                 (optional)
+    #
+    # \return     List of scipy.sparse.csr_matrix objects [A_x, A_y, A_z] of
+    #             shapes (N_k_i, N_i) in itk.Image index order (i, j, k), or
+    #             None if the grids are not axis-aligned
+    #
+    def get_separable_operators(self,
+                                reconstruction_itk,
+                                slice_itk,
+                                tolerance=1e-6,
+                                slice_k=None):
+
+        if slice_k is None:
+            return self._get_separable_operators(
+                reconstruction_itk, slice_itk, tolerance)
+
+        return self._get_cached(
+            self._separable_operators_cache, slice_k,
+            lambda: self._get_separable_operators(
+                reconstruction_itk, slice_itk, tolerance, slice_k))
+
+    def _get_separable_operators(self,
+                                 reconstruction_itk,
+                                 slice_itk,
+                                 tolerance,
+                                 slice_k=None):
+
+        spacing_r = np.array(reconstruction_itk.GetSpacing())
+        size_r = np.array(
+            reconstruction_itk.GetLargestPossibleRegion().GetSize())
+        size_s = np.array(slice_itk.GetLargestPossibleRegion().GetSize())
+
+        cov = self.get_covariance(reconstruction_itk, slice_itk, slice_k)
+        M, t = self._get_slice_to_reconstruction_index_map(
+            reconstruction_itk, slice_itk)
+
+        is_separable = \
+            np.all(np.abs(M - np.diag(np.diag(M))) <=
+                   tolerance * np.abs(M).max()) and \
+            np.all(np.abs(cov - np.diag(np.diag(cov))) <=
+                   tolerance * np.abs(cov).max())
+
+        if is_separable:
+            cutoff = self._alpha_cut * np.sqrt(np.diag(cov)) / spacing_r
+            operators = [
+                self._get_separable_operator_1d(
+                    M[i, i], t[i], size_s[i], size_r[i], spacing_r[i],
+                    cov[i, i], cutoff[i])
+                for i in range(0, 3)]
+        else:
+            operators = None
+
+        return operators
+
+    ##
+    # Gets the one-dimensional blurring-and-sampling matrix along one axis
+    # \date       2018-03-20 09:14:02+0000
+    #
+    # \param      m          Scaling of the map from slice to continuous
+    #                        reconstruction index
+    # \param      t          Translation of the map from slice to continuous
+    #                        reconstruction index
+    # \param      size_s     Number of slice voxels along the axis
+    # \param      size_r     Number of reconstruction voxels along the axis
+    # \param      spacing_r  Reconstruction spacing along the axis
+    # \param      variance   Variance of PSF along the axis
+    # \param      cutoff     Cut-off distance in reconstruction voxel units
+    #
+    # \return     scipy.sparse.csr_matrix of shape (size_s, size_r)
+    #
+    @staticmethod
+    def _get_separable_operator_1d(m, t, size_s, size_r, spacing_r, variance,
+                                   cutoff):
+
+        cindices = m * np.arange(size_s) + t
+
+        # Slice voxel centres outside the reconstruction space are assigned
+        # the default pixel value zero
+        is_inside = (cindices >= -0.5) & (cindices < size_r - 0.5)
+
+        begin = np.floor(cindices + 0.5 - cutoff)
+        end = np.ceil(cindices + 0.5 + cutoff)
+        offsets = np.arange(int(np.ceil(2 * cutoff)) + 1)
+
+        voxels = begin[:, np.newaxis] + offsets[np.newaxis, :]
+        is_valid = (voxels < end[:, np.newaxis]) & \
+            (voxels >= 0) & (voxels < size_r) & is_inside[:, np.newaxis]
+
+        diff = (voxels - cindices[:, np.newaxis]) * spacing_r
+        weights = np.exp(-0.5 * diff**2 / variance) * is_valid
+
+        # Normalize weights to sum up to one for each slice voxel
+        weights_sum = weights.sum(axis=1)
+        weights_sum[weights_sum == 0] = 1
+        weights /= weights_sum[:, np.newaxis]
+
+        rows = np.repeat(np.arange(size_s), is_valid.sum(axis=1))
+
+        return scipy.sparse.csr_matrix(
+            (weights[is_valid], (rows, voxels[is_valid].astype(int))),
+            shape=(size_s, size_r))
+
+    ##
+    # Apply separable operators to an image data array
+    # \date       2018-03-20 09:16:48+0000
+    #
+    # \param      operators  List of sparse matrices [A_x, A_y, A_z] as
+    #                        returned by get_separable_operators (or their
+    #                        transposes)
+    # \param      nda        Image data array in numpy order (z, y, x)
+    #
+    # \return     Resulting data array in numpy order (z, y, x)
+    #
+    @staticmethod
+    def apply_separable_operators(operators, nda):
+
+        for i, operator in enumerate(operators):
+            axis = nda.ndim - 1 - i
+            nda = np.moveaxis(nda, axis, 0)
+            shape = nda.shape
+            nda = operator.dot(nda.reshape(shape[0], -1))
+            nda = np.moveaxis(
+                nda.reshape((operator.shape[0],) + shape[1:]), 0, axis)
+
+        return nda
+
+    ##
+    # Get the region of the reconstruction space affected by the adjoint
+    # operation A^* of a slice, i.e. the bounding box of all reconstruction
+    # voxels within the cut-off distance of the PSF of any slice voxel.
+    #
+    # The region includes the complete PSF support of every slice voxel centre
+    # (unless cropped by the reconstruction space itself). Hence, evaluating
+    # A_adj_itk on the respective sub-region yields identical values to the
+    # evaluation on the entire reconstruction space.
+    # \date       2018-03-06 14:21:35+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object
+    # \param      slice_k             Slice object the slice image belongs to.
+    #                                 If given, the PSF covariance is cached
+    #                                 for it (see get_covariance)
+    #
+    # \return     Start index and size of region as integer numpy arrays in
+    #             itk.Image index order (i, j, k). The size is zero in case the
+    #             slice does not affect the reconstruction space.
+    #
+    def get_footprint_region(self, reconstruction_itk, slice_itk,
+                             slice_k=None):
+
+        size_r = np.array(
+            reconstruction_itk.GetLargestPossibleRegion().GetSize())
+        size_s = np.array(slice_itk.GetLargestPossibleRegion().GetSize())
+
+        # Map corner voxel centres of slice to continuous reconstruction
+        # indices. Their bounding box comprises all slice voxel centres
+        M, t = self._get_slice_to_reconstruction_index_map(
+            reconstruction_itk, slice_itk)
+        corners = np.indices((2, 2, 2)).reshape(3, -1) * \
+            (size_s[:, np.newaxis] - 1)
+        cindices = M.dot(corners) + t[:, np.newaxis]
+
+        # Extend by cut-off distance and safety margin of one voxel
+        cutoff = self.get_psf_halo(reconstruction_itk, slice_itk, slice_k)
+        lower = np.floor(cindices.min(axis=1) - cutoff).astype(int) - 1
+        upper = np.ceil(cindices.max(axis=1) + cutoff).astype(int) + 2
+
+        index = np.clip(lower, 0, size_r)
+        size = np.maximum(np.clip(upper, 0, size_r) - index, 0)
+
+        if size.prod() == 0:
+            size[:] = 0
+
+        return index, size
+
+    ##
+    # Gets the cut-off distance of the PSF of a slice in units of
+    # reconstruction voxels along each reconstruction axis.
+    # \date       2018-03-13 09:42:18+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object
+    # \param      slice_k             Slice object the slice image belongs to.
+    #                                 If given, the PSF covariance is cached
+    #                                 for it (see get_covariance)
+    #
+    # \return     Cut-off distance as numpy array in itk.Image index order
+    #             (i, j, k)
+    #
+    def get_psf_halo(self, reconstruction_itk, slice_itk, slice_k=None):
+
+        cov = self.get_covariance(reconstruction_itk, slice_itk, slice_k)
+        spacing_r = np.array(reconstruction_itk.GetSpacing())
+
+        return self._alpha_cut * np.sqrt(np.diag(cov)) / spacing_r
+
+    ##
+    # Gets the affine map x -> Mx + t from slice voxel indices to continuous
+    # reconstruction voxel indices.
+    # \date       2018-03-06 14:19:02+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object
+    #
+    # \return     3x3 matrix M and translation t as numpy arrays
+    #
+    def _get_slice_to_reconstruction_index_map(self,
+                                               reconstruction_itk,
+                                               slice_itk):
+        origin_r, spacing_r, direction_r = \
+            self._get_image_geometry(reconstruction_itk)[0:3]
+        origin_s, spacing_s, direction_s = \
+            self._get_image_geometry(slice_itk)[0:3]
+
+        M = direction_r.transpose().dot(direction_s).dot(np.diag(spacing_s))
+        M = M / spacing_r[:, np.newaxis]
+        t = direction_r.transpose().dot(origin_s - origin_r) / spacing_r
+
+        return M, t
+
+    ##
+    # Gets the image geometry of an itk.Image object as numpy arrays.
+    # \date       2018-03-05 10:14:02+0000
+    #
+    # \param      image_itk  Image as itk.Image object
+    #
+    # \return     origin, spacing, direction (3x3) and size as numpy arrays
+    #
+    @staticmethod
+    def _get_image_geometry(image_itk):
+        origin = np.array(image_itk.GetOrigin())
+        spacing = np.array(image_itk.GetSpacing())
+        direction = np.array(sitkh.get_sitk_from_itk_direction(
+            image_itk.GetDirection())).reshape(3, 3)
+        size = np.array(image_itk.GetLargestPossibleRegion().GetSize())
+
+        return origin, spacing, direction, size
+
+    ##
+    # Gets the covariance describing the PSF orientation of the slice in
+    # reconstruction space.
+    #
+    # If the Slice object the slice image belongs to is given, the covariance
+    # is cached for it. A cached covariance is reused as long as the slice
+    # has not been moved, i.e. until Slice.update_motion_correction changes
+    # its geometry version. Hence, cache hits only require a dictionary
+    # lookup. Cached covariances refer to the reconstruction orientation they
+    # were computed for; set_reconstruction_space needs to be called if the
+    # reconstruction space changes.
+    # \date       2018-03-09 14:07:26+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    # \param      slice_itk           Slice image as itk.Image object
+    # \param      slice_k             Slice object the slice image belongs to
+    #                                 (or any object providing
+    #                                 get_geometry_version). If None, the
+    #                                 covariance is computed without caching
+    #
+    # \return     The covariance as 3x3 numpy array
+    #
+    def get_covariance(self, reconstruction_itk, slice_itk, slice_k=None):
+
+        if slice_k is None:
+            return self._get_covariance[self._deconvolution_mode](
+                reconstruction_itk, slice_itk)
+
+        return self._get_cached(
+            self._covariance_cache, slice_k,
+            lambda: self._get_covariance[self._deconvolution_mode](
+                reconstruction_itk, slice_itk))
+
+    ##
+    # Clear cached covariances and separable operators, e.g. after the
+    # reconstruction space has been changed.
+    # \date       2018-03-09 14:08:03+0000
+    #
+    # \param      self  The object
+    #
+    def clear_covariance_cache(self):
+        self._covariance_cache.clear()
+        self._separable_operators_cache.clear()
+
+    ##
+    # Sets the reconstruction space the cached data refers to. Cached
+    # covariances only depend on the reconstruction orientation and are kept
+    # if it remains the same (e.g. for a resampled reconstruction grid);
+    # cached separable operators are cleared whenever the grid changes.
+    # \date       2018-03-14 09:20:41+0000
+    #
+    # \param      self                The object
+    # \param      reconstruction_itk  Reconstruction image as itk.Image object
+    #
+    def set_reconstruction_space(self, reconstruction_itk):
+
+        geometry = self._get_image_geometry(reconstruction_itk)
+        geometry_previous = self._reconstruction_geometry
+
+        if geometry_previous is None or \
+                not np.array_equal(geometry[2], geometry_previous[2]):
+            self._covariance_cache.clear()
+
+        if geometry_previous is None or \
+                not all([np.array_equal(g, g_previous) for g, g_previous
+                         in zip(geometry, geometry_previous)]):
+            self._separable_operators_cache.clear()
+
+        self._reconstruction_geometry = geometry
+
+    ##
+    # Gets the cache entry of a slice or computes and stores it in case the
+    # slice has been moved since.
+    # \date       2018-03-09 14:09:12+0000
+    #
+    # \param      cache    cache as weakref.WeakKeyDictionary
+    # \param      slice_k  Slice object
+    # \param      compute  function computing the value to be cached
+    #
+    # \return     cached value
+    #
+    @staticmethod
+    def _get_cached(cache, slice_k, compute):
+
+        version = slice_k.get_geometry_version()
+        entry = cache.get(slice_k)
+        if entry is None or entry[0] != version:
+            entry = (version, compute())
+            cache[slice_k] = entry
+
+        return entry[1]
+
     def _get_covariance_full_3d(self,
                                 reconstruction_itk,
                                 slice_itk):
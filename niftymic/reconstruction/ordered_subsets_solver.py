@@ -0,0 +1,468 @@
+##
+# \file ordered_subsets_solver.py
+# \brief      Solve the SRR problem by cycling through subsets of slices
+#             (ordered subsets) with Tikhonov regularization.
+#
+# Every subset S of slices defines an approximation of the gradient of the
+# full objective
+# \f$ \frac{1}{2} \Vert MA \vec{x} - M\vec{y} \Vert_{\ell^2}^2 +
+#     \frac{\alpha}{2} \Vert G\vec{x} \Vert_{\ell^2}^2
+# \f$
+# by scaling the gradient of the subset data term by the number of subsets.
+# Each subset step is scaled by a SIRT-type diagonal preconditioner and
+# followed by a projection onto the non-negative orthant. Hence, one pass
+# through all slices yields as many image updates as there are subsets.
+#
+# \author     Michael Ebner (michael.ebner.14@ucl.ac.uk)
+# \date       March 2018
+#
+
+# Import libraries
+import numpy as np
+
+import pysitk.python_helper as ph
+
+import niftymic.base.precision as prec
+from niftymic.reconstruction.solver import Solver
+
+# Allowed ways to split the slices into subsets
+SUBSET_TYPES = ["stack", "package", "random"]
+
+
+class OrderedSubsetsSolver(Solver):
+
+    ##
+    # Constructor
+    # \date          2018-03-19 09:02:11+0000
+    #
+    # \param         self                   The object
+    # \param         stacks                 list of Stack objects containing
+    #                                       all stacks used for the
+    #                                       reconstruction
+    # \param[in,out] reconstruction         Stack object containing the current
+    #                                       estimate of the reconstruction
+    #                                       volume (used as initial value +
+    #                                       space definition)
+    # \param         alpha_cut              Cut-off distance for Gaussian
+    #                                       blurring filter
+    # \param         alpha                  regularization parameter, scalar
+    # \param         iter_max               number of passes through all
+    #                                       subsets, scalar
+    # \param         reg_type               Either 'TK0' or 'TK1'
+    # \param         subset_type            Split of the slices into subsets:
+    #                                       'stack' (one subset per stack),
+    #                                       'package' (one subset per
+    #                                       interleave package of all stacks)
+    #                                       or 'random' (random blocks)
+    # \param         n_subsets              Number of subsets; only used for
+    #                                       'random'
+    # \param         interleave             Interleave of the slice
+    #                                       acquisitions; only used for
+    #                                       'package'
+    # \param         relaxation             Relaxation parameter of the
+    #                                       subset steps, scalar in (0, 2)
+    # \param         seed                   Seed for the random subsets
+    # \param         deconvolution_mode     Either "full_3D" or
+    #                                       "only_in_plane". Indicates whether
+    #                                       full 3D or only in-plane
+    #                                       deconvolution is considered
+    # \param         predefined_covariance  The predefined covariance
+    # \param         verbose                The verbose
+    # \param         use_masks              Use masks in the data fidelity
+    #                                       term
+    # \param         use_assembled_operator Evaluate MA and its adjoint via
+    #                                       a once assembled sparse matrix
+    #                                       instead of the ITK filters
+    # \param         n_threads              Number of threads for slice-wise
+    #                                       operator evaluations
+    #
+    def __init__(self,
+                 stacks,
+                 reconstruction,
+                 alpha_cut=3,
+                 alpha=0.03,
+                 iter_max=10,
+                 reg_type="TK1",
+                 subset_type="stack",
+                 n_subsets=4,
+                 interleave=2,
+                 relaxation=1.,
+                 seed=0,
+                 deconvolution_mode="full_3D",
+                 predefined_covariance=None,
+                 verbose=1,
+                 use_masks=True,
+                 use_assembled_operator=False,
+                 n_threads=1,
+                 ):
+
+        Solver.__init__(self,
+                        stacks=stacks,
+                        reconstruction=reconstruction,
+                        alpha_cut=alpha_cut,
+                        alpha=alpha,
+                        iter_max=iter_max,
+                        minimizer="ordered_subsets",
+                        deconvolution_mode=deconvolution_mode,
+                        x_scale="max",
+                        data_loss="linear",
+                        data_loss_scale=1,
+                        huber_gamma=1.345,
+                        predefined_covariance=predefined_covariance,
+                        verbose=verbose,
+                        use_masks=use_masks,
+                        use_assembled_operator=use_assembled_operator,
+                        n_threads=n_threads,
+                        )
+
+        if subset_type not in SUBSET_TYPES:
+            raise ValueError("Subset type must be in " + str(SUBSET_TYPES))
+
+        self._reg_type = reg_type
+        self._subset_type = subset_type
+        self._n_subsets = n_subsets
+        self._interleave = interleave
+        self._relaxation = relaxation
+        self._seed = seed
+
+        # Subsets and their step scalings for the current geometry
+        self._subsets = None
+        self._subset_steps = None
+
+    def set_regularization_type(self, reg_type):
+        self._reg_type = reg_type
+
+    def get_regularization_type(self):
+        return self._reg_type
+
+    def set_subset_type(self, subset_type):
+        if subset_type not in SUBSET_TYPES:
+            raise ValueError("Subset type must be in " + str(SUBSET_TYPES))
+        self._subset_type = subset_type
+
+    def get_subset_type(self):
+        return self._subset_type
+
+    def set_relaxation(self, relaxation):
+        self._relaxation = relaxation
+
+    def get_relaxation(self):
+        return self._relaxation
+
+    ##
+    #       Gets the setting specific filename indicating the information
+    #             used for the reconstruction step
+    # \date       2018-03-19 09:05:40+0000
+    #
+    # \param      self    The object
+    # \param      prefix  The prefix as string
+    #
+    # \return     The setting specific filename as string.
+    #
+    def get_setting_specific_filename(self, prefix="SRR_"):
+
+        # Build filename
+        filename = prefix
+        filename += "stacks" + str(len(self._stacks))
+        if self._alpha > 0:
+            filename += "_" + self._reg_type
+        filename += "_OS" + self._subset_type
+        filename += "_alpha" + str(self._alpha)
+        filename += "_itermax" + str(self._iter_max)
+
+        # Replace dots by 'p'
+        filename = filename.replace(".", "p")
+
+        return filename
+
+    ##
+    # Gets the ordered subsets iterations. In contrast to the other solvers,
+    # no NSoL solver is used but an object providing the same interface.
+    # \date       2018-03-19 09:06:12+0000
+    #
+    # \param      self      The object
+    # \param      x0        initial value as 1D array. If None, the current
+    #                       reconstruction is used.
+    # \param      n_passes  Number of passes through all subsets. If None,
+    #                       the chosen iter_max is used.
+    # \param      callback  function callback(n, x) called after the n-th
+    #                       pass; the passes are stopped once it returns True.
+    #                       None to perform all passes
+    #
+    # \return     OrderedSubsetsIterations object
+    #
+    def get_solver(self, x0=None, n_passes=None, callback=None):
+
+        if x0 is None:
+            x0 = self.get_x0()
+        if n_passes is None:
+            n_passes = self._iter_max
+
+        if self._reg_type == "TK0":
+            B = lambda x: x
+            B_adj = lambda x: x
+        else:
+            B, B_adj = self._get_gradient_operators()
+
+        if self._subsets is None:
+            subsets, subset_steps = self._get_subsets_and_steps()
+        else:
+            subsets, subset_steps = self._subsets, self._subset_steps
+
+        return OrderedSubsetsIterations(
+            MA=self._MA,
+            A_adj_M=self._A_adj_M,
+            B=B,
+            B_adj=B_adj,
+            b=self.get_b(),
+            x0=x0,
+            subsets=subsets,
+            subset_steps=subset_steps,
+            alpha=self._alpha,
+            relaxation=self._relaxation,
+            n_passes=n_passes,
+            dtype=self._dtype,
+            callback=callback,
+        )
+
+    ##
+    # Gets the subsets of slices.
+    #
+    # Stack subsets are formed by the (possibly stack-batched) operator
+    # ranges, package and random subsets consist of individual slices.
+    # \date       2018-03-19 09:08:52+0000
+    #
+    # \param      self  The object
+    #
+    # \return     list of subsets, each given as list of tuples (slice_k,
+    #             i_min, i_max)
+    #
+    def get_subsets(self):
+
+        if self._subset_type == "stack":
+            # Assign operator ranges to stacks via stacked slice data offsets
+            offsets = np.cumsum([0] + [
+                sum([np.array(slice_k.sitk.GetSize()).prod()
+                     for slice_k in stack.get_slices()])
+                for stack in self._stacks])
+            subsets = [[] for i in range(0, self._N_stacks)]
+            for item in self._get_operator_ranges():
+                i = np.searchsorted(offsets, item[1], side="right") - 1
+                subsets[i].append(item)
+
+        elif self._subset_type == "package":
+            subsets = [[] for i in range(0, self._interleave)]
+            slice_ranges = self._get_slice_ranges()
+            for slice_k, i_min, i_max in slice_ranges:
+                package = slice_k.get_slice_number() % self._interleave
+                subsets[package].append((slice_k, i_min, i_max))
+
+        else:
+            slice_ranges = self._get_slice_ranges()
+            permutation = np.random.RandomState(self._seed).permutation(
+                len(slice_ranges))
+            subsets = [
+                [slice_ranges[j] for j in sorted(indices)]
+                for indices in np.array_split(permutation, self._n_subsets)]
+
+        return [subset for subset in subsets if len(subset) > 0]
+
+    def _run(self):
+
+        self._print_info_text()
+
+        time_start = ph.start_timing()
+        self._subsets, self._subset_steps = self._get_subsets_and_steps()
+        time_setup = ph.stop_timing(time_start)
+
+        x, self._computational_time = self._run_steps(
+            self._run_step, self.get_x0(), self._iter_max)
+        self._computational_time += time_setup
+
+        self._subsets = None
+        self._subset_steps = None
+
+        # Update volume
+        self._reconstruction.itk = self._get_itk_image_from_array_vec(
+            self._get_x_full(x), self._reconstruction.itk)
+        self._reconstruction.sitk = prec.get_sitk_from_itk_image(
+            self._reconstruction.itk, self._precision)
+
+    ##
+    # Perform a given number of passes through all subsets
+    # \date       2018-03-19 09:12:27+0000
+    #
+    # \param      self      The object
+    # \param      x0        initial value as 1D array
+    # \param      n_passes  Number of passes through all subsets
+    # \param      callback  function callback(n, x) called after the n-th
+    #                       pass; the passes are stopped once it returns True.
+    #                       None to perform all passes
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_step(self, x0, n_passes, callback=None):
+        solver = self.get_solver(
+            x0=x0, n_passes=n_passes, callback=callback)
+        solver.run()
+        return solver.get_x(), solver.get_computational_time()
+
+    ##
+    # Gets the subsets of slices together with their step scalings
+    # \date       2018-03-19 09:10:04+0000
+    #
+    # \param      self  The object
+    #
+    # \return     list of subsets (see get_subsets) and list of step scalings
+    #             as 1D arrays
+    #
+    def _get_subsets_and_steps(self):
+        subsets = self.get_subsets()
+        subset_steps = [
+            self._get_step_scaling(subset, len(subsets))
+            for subset in subsets]
+        return subsets, subset_steps
+
+    ##
+    # Gets the SIRT-type step scaling of a subset, i.e. the inverse of the
+    # absolute row sums of n_subsets (M_S A_S)^T M_S A_S + alpha G^T G. This
+    # diagonal majorizes the subset Hessian so that the scaled gradient steps
+    # are stable.
+    # \date       2018-03-19 09:15:38+0000
+    #
+    # \param      self       The object
+    # \param      subset     list of tuples (slice_k, i_min, i_max)
+    # \param      n_subsets  Number of subsets
+    #
+    # \return     step scaling as 1D array
+    #
+    def _get_step_scaling(self, subset, n_subsets):
+
+        ones = np.ones_like(self.get_x0())
+        D = n_subsets * self._A_adj_M(self._MA(ones, subset), subset)
+        D = D.astype(np.float64)
+
+        # Absolute row sums of G^T G are bounded by sum_i 4/h_i^2
+        if self._reg_type == "TK0":
+            D += self._alpha
+        else:
+            spacing = np.array(self._reconstruction.sitk.GetSpacing())
+            D += self._alpha * np.sum(4. / spacing**2)
+
+        step = np.zeros_like(D)
+        step[D > 0] = 1. / D[D > 0]
+
+        return step.astype(self._dtype)
+
+    def _get_regularizer_value(self, x):
+        if self._reg_type == "TK0":
+            return 0.5 * np.sum(x**2)
+        B = self._get_gradient_operators()[0]
+        return 0.5 * np.sum(B(x)**2)
+
+    def _print_info_text(self):
+
+        ph.print_subtitle("Ordered Subsets Solver:")
+        ph.print_info("Chosen regularization type: %s" % self._reg_type)
+        ph.print_info("Subsets: %s (%d subsets)" % (
+            self._subset_type, len(self.get_subsets())))
+        ph.print_info("Regularization parameter: " + str(self._alpha))
+        ph.print_info("Relaxation parameter: " + str(self._relaxation))
+        ph.print_info(
+            "Maximum number of passes: " + str(self._iter_max))
+
+
+##
+# Ordered subsets iterations for given operators. It provides the interface
+# of the NSoL solvers used by the other solvers, i.e. run, get_x and
+# get_computational_time.
+# \date       2018-03-19 09:20:14+0000
+#
+class OrderedSubsetsIterations(object):
+
+    ##
+    # Store all information for the ordered subsets iterations
+    # \date       2018-03-19 09:21:40+0000
+    #
+    # \param      self          The object
+    # \param      MA            function MA(x, subset) evaluating the forward
+    #                           operator for the slices of a subset
+    # \param      A_adj_M       function A_adj_M(y, subset) evaluating the
+    #                           adjoint operator for the slices of a subset
+    # \param      B             Function call of regularization operator
+    # \param      B_adj         Function call of adjoint regularization
+    #                           operator
+    # \param      b             right hand-side My as 1D array
+    # \param      x0            initial value as 1D array
+    # \param      subsets       list of subsets, each given as list of tuples
+    #                           (slice_k, i_min, i_max)
+    # \param      subset_steps  list of step scalings of the subsets as 1D
+    #                           arrays
+    # \param      alpha         regularization parameter, scalar
+    # \param      relaxation    Relaxation parameter of the subset steps
+    # \param      n_passes      Number of passes through all subsets
+    # \param      dtype         data type of x
+    # \param      callback      function callback(n, x) called after the n-th
+    #                           pass; the passes are stopped once it returns
+    #                           True. None to perform all passes
+    #
+    def __init__(self,
+                 MA,
+                 A_adj_M,
+                 B,
+                 B_adj,
+                 b,
+                 x0,
+                 subsets,
+                 subset_steps,
+                 alpha,
+                 relaxation,
+                 n_passes,
+                 dtype=np.float64,
+                 callback=None,
+                 ):
+        self._MA = MA
+        self._A_adj_M = A_adj_M
+        self._B = B
+        self._B_adj = B_adj
+        self._b = b
+        self._x0 = x0
+        self._subsets = subsets
+        self._subset_steps = subset_steps
+        self._alpha = alpha
+        self._relaxation = relaxation
+        self._n_passes = n_passes
+        self._dtype = dtype
+        self._callback = callback
+
+        self._x = None
+        self._computational_time = None
+
+    def get_x(self):
+        return self._x
+
+    def get_computational_time(self):
+        return self._computational_time
+
+    def run(self):
+
+        time_start = ph.start_timing()
+
+        n_subsets = len(self._subsets)
+
+        x = np.array(self._x0, dtype=self._dtype)
+        for i in range(0, self._n_passes):
+            for subset, step in zip(self._subsets, self._subset_steps):
+                residual = self._MA(x, subset) - self._b
+                gradient = n_subsets * self._A_adj_M(residual, subset)
+                if self._alpha > 0:
+                    gradient += self._alpha * self._B_adj(self._B(x))
+
+                x -= self._relaxation * step * gradient
+                np.maximum(x, 0, out=x)
+
+            if self._callback is not None and self._callback(i + 1, x):
+                break
+
+        self._x = x
+        self._computational_time = ph.stop_timing(time_start)
@@ -19,10 +19,10 @@
 # Import libraries
 import numpy as np
 
-import nsol.linear_operators as linop
 import nsol.primal_dual_solver as pd
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
+import niftymic.base.precision as prec
 from niftymic.reconstruction.solver import Solver
 from nsol.proximal_operators import ProximalOperators as prox
 
@@ -106,33 +106,40 @@ class PrimalDualSolver(Solver):
 
         return filename
 
-    def get_solver(self):
+    ##
+    # Gets the NSoL primal-dual solver
+    # \date       2018-03-16 09:36:12+0000
+    #
+    # \param      self        The object
+    # \param      x0          initial value as 1D array. If None, the
+    #                         current reconstruction is used.
+    # \param      iterations  Number of primal-dual iterations. If None, the
+    #                         chosen number of iterations is used.
+    #
+    # \return     pd.PrimalDualSolver object
+    #
+    def get_solver(self, x0=None, iterations=None):
+
+        if x0 is None:
+            x0 = self.get_x0()
+        if iterations is None:
+            iterations = self._iterations
 
         if self._reg_type not in ["TV", "huber"]:
             raise ValueError("Error: regularization type can only be either "
                              "'TV' or 'huber'")
 
-        # L^2 = ||K||^2 = ||\nabla||^2 = ||div||^2 <= 16/h^2 in 3D
-        # However, it seems that the smaller L2 the bigger the effect of TV
-        # regularization. Try, e.g. L2 = 1.
-        L2 = 16. / self._reconstruction.sitk.GetSpacing()[0]**2
+        # L^2 = ||K||^2 = ||\nabla||^2 = ||div||^2 <= 16/h^2 in 3D. A tighter
+        # estimate allows for larger primal-dual step sizes
+        L2 = self.get_gradient_norm_squared()
 
         # Get operators
         A = self.get_A()
         A_adj = self.get_A_adj()
         b = self.get_b()
-        x0 = self.get_x0()
         x_scale = self.get_x_scale()
 
-        spacing = np.array(self._reconstruction.sitk.GetSpacing())
-        linear_operators = linop.LinearOperators3D(spacing=spacing)
-        grad, grad_adj = linear_operators.get_gradient_operators()
-
-        X_shape = self._reconstruction_shape
-        Z_shape = grad(x0.reshape(*X_shape)).shape
-
-        B = lambda x: grad(x.reshape(*X_shape)).flatten()
-        B_adj = lambda x: grad_adj(x.reshape(*Z_shape)).flatten()
+        B, B_adj = self._get_gradient_operators()
 
         prox_f = lambda x, tau: prox.prox_linear_least_squares(
             x=x, tau=tau,
@@ -160,7 +167,7 @@ class PrimalDualSolver(Solver):
             x0=x0,
             x_scale=x_scale,
             alpha=self._alpha,
-            iterations=self._iterations,
+            iterations=iterations,
             verbose=self._verbose,
             alg_type=self._alg_type,
         )
@@ -169,21 +176,28 @@ class PrimalDualSolver(Solver):
 
     def _run(self, verbose=0):
 
-        solver = self.get_solver()
-
         self._print_info_text()
 
         # Run reconstruction
-        solver.run()
-
-        # Get computational time
-        self._computational_time = solver.get_computational_time()
+        x, self._computational_time = self._run_steps(
+            self._run_step, self.get_x0(), self._iterations)
 
         # Update volume
         self._reconstruction.itk = self._get_itk_image_from_array_vec(
-            solver.get_x(), self._reconstruction.itk)
-        self._reconstruction.sitk = sitkh.get_sitk_from_itk_image(
-            self._reconstruction.itk)
+            self._get_x_full(x), self._reconstruction.itk)
+        self._reconstruction.sitk = prec.get_sitk_from_itk_image(
+            self._reconstruction.itk, self._precision)
+
+    # The callback is evaluated after each primal-dual iteration via an
+    # observer of the NSoL solver
+    def _run_step(self, x0, iterations, callback=None):
+        solver = self.get_solver(x0=x0, iterations=iterations)
+        return self._run_nsol_solver(solver, callback)
+
+    def _get_regularizer_value(self, x):
+        if self._reg_type == "huber":
+            return self._get_total_variation(x, self._reg_huber_gamma)
+        return self._get_total_variation(x)
 
     def _print_info_text(self):
         ph.print_subtitle("Primal-Dual Solver:")
@@ -15,12 +15,18 @@ import itk
 import SimpleITK as sitk
 import numpy as np
 import time
+from multiprocessing.pool import ThreadPool
 
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
 
 # Import modules from src-folder
+import niftymic.base.precision as prec
 import niftymic.base.stack as st
+import niftymic.reconstruction.tikhonov_solver as tk
+
+# Available approaches for SDA
+SDA_APPROACHES = ["Shepard-YVV", "Shepard-Deriche", "Shepard-PSF"]
 
 
 # Class implementing Scattered Data Approximation
@@ -38,9 +44,22 @@ class ScatteredDataApproximation:
     #                             space)
     # \param         sigma        The sigma
     # \param         sigma_array  The sigma array
+    # \param         alpha_cut    Cut-off distance of the PSF kernel for the
+    #                             'Shepard-PSF' approach
+    # \param         n_threads    Number of threads. Stacks are distributed
+    #                             across threads, each accumulating into
+    #                             private arrays, and numerator and
+    #                             denominator are smoothed concurrently
     # \post          HR_volume is updated with current volumetric estimate
     #
-    def __init__(self, stacks, HR_volume, sigma=1, sigma_array=None):
+    def __init__(self,
+                 stacks,
+                 HR_volume,
+                 sigma=1,
+                 sigma_array=None,
+                 alpha_cut=3,
+                 n_threads=1,
+                 ):
 
         # Initialize variables
         self._stacks = stacks
@@ -55,10 +74,14 @@ class ScatteredDataApproximation:
         else:
             self._sigma_array = np.array(sigma_array)
 
+        self._alpha_cut = alpha_cut
+        self._n_threads = n_threads
+
         # Define dictionary to choose computational approach for SDA
         self._run = {
             "Shepard-YVV":   self._run_discrete_shepard_reconstruction,
             "Shepard-Deriche":   self._run_discrete_shepard_based_on_Deriche_reconstruction,
+            "Shepard-PSF":   self._run_discrete_shepard_based_on_PSF_reconstruction,
         }
         self._sda_approach = "Shepard-YVV"    # default approximation approach
 
@@ -85,6 +108,15 @@ class ScatteredDataApproximation:
 
         self._sigma_array = np.array(sigma_array)
 
+    # Set number of threads used for the accumulation over stacks and the
+    #  smoothing
+    #  \param[in] n_threads number of threads, integer
+    def set_n_threads(self, n_threads):
+        self._n_threads = n_threads
+
+    def get_n_threads(self):
+        return self._n_threads
+
     # Get array of standard deviations used for recursive Gaussian smoothing
     #  in each direction. Sigmas are measured in the units of image spacing.
     #  \return sigma array, numpy array
@@ -92,12 +124,13 @@ class ScatteredDataApproximation:
         return self._sigma_array
 
     # Set approach for approximating the HR volume. It can be either
-    #  'Shepard-YVV' or 'Shepard-Deriche'
-    #  \param[in] sda_approach either 'Shepard-YVV' or 'Shepard-Deriche', string
+    #  'Shepard-YVV', 'Shepard-Deriche' or 'Shepard-PSF'
+    #  \param[in] sda_approach either 'Shepard-YVV', 'Shepard-Deriche' or
+    #             'Shepard-PSF', string
     def set_approach(self, sda_approach):
-        if sda_approach not in ["Shepard-YVV", "Shepard-Deriche"]:
+        if sda_approach not in SDA_APPROACHES:
             raise ValueError(
-                "Error: SDA approach can only be either 'Shepard-YVV' or 'Shepard-Deriche'")
+                "Error: SDA approach can only be in " + str(SDA_APPROACHES))
 
         self._sda_approach = sda_approach
 
@@ -129,7 +162,9 @@ class ScatteredDataApproximation:
     # slices
     def run(self):
         ph.print_info("Chosen SDA approach: " + self._sda_approach)
-        ph.print_info("Smoothing parameter sigma = " + str(self._sigma_array))
+        if self._sda_approach != "Shepard-PSF":
+            ph.print_info(
+                "Smoothing parameter sigma = " + str(self._sigma_array))
 
         t0 = time.clock()
 
@@ -247,64 +282,19 @@ class ScatteredDataApproximation:
     #  \remark Obtained intensity values are positive.
     def _run_discrete_shepard_reconstruction(self):
 
-        shape = sitk.GetArrayFromImage(self._HR_volume.sitk).shape
-        helper_N_nda = np.zeros(shape)
-        helper_D_nda = np.zeros(shape)
-
-        default_pixel_value = 0.0
+        # Computations are performed in the precision of the HR volume
+        precision = prec.get_precision(self._HR_volume.sitk)
+        dtype = prec.get_numpy_dtype(precision)
 
-        for i in range(0, self._N_stacks):
-            ph.print_info("Stack %s/%s" % (i+1, self._N_stacks))
-            stack = self._stacks[i]
-            slices = stack.get_slices()
-            N_slices = stack.get_number_of_slices()
-
-            # for j in range(10, 11):
-            for j in range(0, N_slices):
-                # print("\t\tSlice %s/%s" %(j,N_slices-1))
-                slice = slices[j]
-                slice_masked_sitk = slice.sitk
-                # slice_masked_sitk = slice.sitk * \
-                #     sitk.Cast(slice.sitk_mask, slice.sitk.GetPixelIDValue())
-
-                # Nearest neighbour resampling of slice to target space (HR
-                # volume)
-                slice_resampled_sitk = sitk.Resample(
-                    slice_masked_sitk,
-                    self._HR_volume.sitk,
-                    sitk.Euler3DTransform(),
-                    sitk.sitkNearestNeighbor,
-                    default_pixel_value,
-                    self._HR_volume.sitk.GetPixelIDValue())
-
-                # sitkh.show_sitk_image(slice_resampled_sitk)
-
-                # Extract array of pixel intensities
-                nda_slice = sitk.GetArrayFromImage(slice_resampled_sitk)
-
-                # Get voxels in HR volume space which are stroke by the slice
-                ind_nonzero = nda_slice > 0
-
-                # update arrays of numerator and denominator
-                helper_N_nda[ind_nonzero] += nda_slice[ind_nonzero]
-                helper_D_nda[ind_nonzero] += 1
-
-                # test = sitk.GetImageFromArray(helper_N_nda)
-                # sitkh.show_sitk_image(test,title="N")
-
-                # test = sitk.GetImageFromArray(helper_D_nda)
-                # sitkh.show_sitk_image(test,title="D")
-
-                # print("helper_N_nda: (min, max) = (%s, %s)" %(np.min(helper_N_nda), np.max(helper_N_nda)))
-                # print("helper_D_nda: (min, max) = (%s, %s)" %(np.min(helper_D_nda), np.max(helper_D_nda)))
+        # Accumulate nearest neighbour samples of all (unmasked) slices
+        helper_N_nda, helper_D_nda = self._get_shepard_numerator_denominator(
+            use_masks=False, dtype=dtype)
 
         # TODO: Set zero entries to one; Otherwise results are very weird!?
         helper_D_nda[helper_D_nda == 0] = 1
 
         # Create itk-images with correct header data
-        pixel_type = itk.D
-        dimension = 3
-        image_type = itk.Image[pixel_type, dimension]
+        image_type = prec.get_itk_image_type(precision)
 
         itk2np = itk.PyBuffer[image_type]
         helper_N = itk2np.GetImageFromArray(helper_N_nda)
@@ -320,21 +310,22 @@ class ScatteredDataApproximation:
             sitkh.get_itk_direction_from_sitk_image(self._HR_volume.sitk))
         helper_D.SetOrigin(self._HR_volume.sitk.GetOrigin())
 
-        # Apply Recursive Gaussian YVV filter
-        gaussian = itk.SmoothingRecursiveYvvGaussianImageFilter[
-            image_type, image_type].New()   # YVV-based Filter
-        # gaussian = itk.SmoothingRecursiveGaussianImageFilter[image_type,
-        # image_type].New()    # Deriche-based Filter
-        gaussian.SetSigmaArray(self._sigma_array)
-        gaussian.SetInput(helper_N)
-        gaussian.Update()
-        HR_volume_update_N = gaussian.GetOutput()
-        HR_volume_update_N.DisconnectPipeline()
-
-        gaussian.SetInput(helper_D)
-        gaussian.Update()
-        HR_volume_update_D = gaussian.GetOutput()
-        HR_volume_update_D.DisconnectPipeline()
+        # Apply Recursive Gaussian YVV filter; one filter per image to allow
+        # for concurrent execution
+        def smooth(image_itk):
+            gaussian = itk.SmoothingRecursiveYvvGaussianImageFilter[
+                image_type, image_type].New()   # YVV-based Filter
+            # gaussian = itk.SmoothingRecursiveGaussianImageFilter[image_type,
+            # image_type].New()    # Deriche-based Filter
+            gaussian.SetSigmaArray(self._sigma_array)
+            gaussian.SetInput(image_itk)
+            gaussian.Update()
+            image_itk_smoothed = gaussian.GetOutput()
+            image_itk_smoothed.DisconnectPipeline()
+            return image_itk_smoothed
+
+        HR_volume_update_N, HR_volume_update_D = self._map(
+            smooth, [helper_N, helper_D])
 
         # Convert numerator and denominator back to data array
         nda_N = itk2np.GetArrayFromImage(HR_volume_update_N)
@@ -342,7 +333,7 @@ class ScatteredDataApproximation:
 
         # Compute data array of HR volume:
         # nda_D[nda_D==0]=1
-        nda = nda_N/nda_D.astype(float)
+        nda = nda_N/nda_D.astype(dtype)
 
         # Update HR volume image file within Stack-object HR_volume
         HR_volume_update = sitk.GetImageFromArray(nda)
@@ -350,7 +341,8 @@ class ScatteredDataApproximation:
 
         # Link HR_volume.sitk to the updated volume
         self._HR_volume.sitk = HR_volume_update
-        self._HR_volume.itk = sitkh.get_itk_from_sitk_image(HR_volume_update)
+        self._HR_volume.itk = prec.get_itk_from_sitk_image(
+            HR_volume_update, precision)
 
     # Recontruct volume based on discrete Shepard's like method, cf. Vercauteren2006, equation (19).
     #  The computation here is based on the Deriche variant of Recursive Gaussian Filter and executed
@@ -358,47 +350,13 @@ class ScatteredDataApproximation:
     #  \remark Obtained intensity values can be negative.
     def _run_discrete_shepard_based_on_Deriche_reconstruction(self):
 
-        shape = sitk.GetArrayFromImage(self._HR_volume.sitk).shape
-        helper_N_nda = np.zeros(shape)
-        helper_D_nda = np.zeros(shape)
+        # Computations are performed in the precision of the HR volume
+        precision = prec.get_precision(self._HR_volume.sitk)
+        dtype = prec.get_numpy_dtype(precision)
 
-        default_pixel_value = 0.0
-
-        for i in range(0, self._N_stacks):
-            ph.print_info("Stack %s/%s" % (i+1, self._N_stacks))
-            stack = self._stacks[i]
-            slices = stack.get_slices()
-            N_slices = stack.get_number_of_slices()
-
-            for j in range(0, N_slices):
-
-                slice = slices[j]
-                slice_masked_sitk = slice.sitk * \
-                    sitk.Cast(slice.sitk_mask, slice.sitk.GetPixelIDValue())
-
-                # Nearest neighbour resampling of slice to target space (HR
-                # volume)
-                slice_resampled_sitk = sitk.Resample(
-                    slice_masked_sitk,
-                    self._HR_volume.sitk,
-                    sitk.Euler3DTransform(),
-                    sitk.sitkNearestNeighbor,
-                    default_pixel_value,
-                    self._HR_volume.sitk.GetPixelIDValue())
-
-                # Extract array of pixel intensities
-                nda_slice = sitk.GetArrayFromImage(slice_resampled_sitk)
-
-                # Look for indices which are stroke by the slice in the
-                # isotropic grid
-                ind_nonzero = nda_slice > 0
-
-                # update arrays of numerator and denominator
-                helper_N_nda[ind_nonzero] += nda_slice[ind_nonzero]
-                helper_D_nda[ind_nonzero] += 1
-
-                # print("helper_N_nda: (min, max) = (%s, %s)" %(np.min(helper_N_nda), np.max(helper_N_nda)))
-                # print("helper_D_nda: (min, max) = (%s, %s)" %(np.min(helper_D_nda), np.max(helper_D_nda)))
+        # Accumulate nearest neighbour samples of all masked slices
+        helper_N_nda, helper_D_nda = self._get_shepard_numerator_denominator(
+            use_masks=True, dtype=dtype)
 
         # TODO: Set zero entries to one; Otherwise results are very weird!?
         helper_D_nda[helper_D_nda == 0] = 1
@@ -410,12 +368,15 @@ class ScatteredDataApproximation:
         helper_N.CopyInformation(self._HR_volume.sitk)
         helper_D.CopyInformation(self._HR_volume.sitk)
 
-        # Apply recursive Gaussian smoothing
-        gaussian = sitk.SmoothingRecursiveGaussianImageFilter()
-        gaussian.SetSigma(self._sigma_array[1])
+        # Apply recursive Gaussian smoothing; one filter per image to allow
+        # for concurrent execution
+        def smooth(image_sitk):
+            gaussian = sitk.SmoothingRecursiveGaussianImageFilter()
+            gaussian.SetSigma(self._sigma_array[1])
+            return gaussian.Execute(image_sitk)
 
-        HR_volume_update_N = gaussian.Execute(helper_N)
-        HR_volume_update_D = gaussian.Execute(helper_D)
+        HR_volume_update_N, HR_volume_update_D = self._map(
+            smooth, [helper_N, helper_D])
 
         # ## Avoid undefined division by zero
         # """
@@ -457,3 +418,259 @@ class ScatteredDataApproximation:
         """
         nda = sitk.GetArrayFromImage(HR_volume_update)
         print("Minimum of data array = %s" % np.min(nda))
+
+    ##
+    # Reconstruct volume based on a discrete Shepard's like method whereby
+    # each slice voxel is splatted into the HR grid with its truncated
+    # oriented PSF kernel instead of nearest neighbour deposition followed by
+    # global Gaussian smoothing, i.e.
+    # \f$ \vec{x} = \frac{\sum_k A_k^* M_k \vec{y}_k}{\sum_k A_k^* M_k
+    # \vec{1}} \f$ voxel-wise.
+    #
+    # The splatting is given by the adjoint of the slice acquisition model
+    # and hence uses the same PSF covariances as LinearOperators.
+    # \date       2018-03-29 09:21:37+0100
+    #
+    # \remark     Obtained intensity values are positive for positive slice
+    #             data. Voxels not covered by any slice are set to zero.
+    #
+    def _run_discrete_shepard_based_on_PSF_reconstruction(self):
+
+        # Computations are performed in the precision of the HR volume
+        precision = prec.get_precision(self._HR_volume.sitk)
+        dtype = prec.get_numpy_dtype(precision)
+
+        # Solver provides (multi-threaded, footprint restricted) evaluations
+        # of sum_k A_k^* M_k
+        solver = tk.TikhonovSolver(
+            stacks=self._stacks,
+            reconstruction=self._HR_volume,
+            alpha_cut=self._alpha_cut,
+            deconvolution_mode="full_3D",
+            verbose=0,
+            use_masks=True,
+            n_threads=self._n_threads,
+        )
+        A_adj = solver.get_A_adj()
+        b = solver.get_b()
+
+        helper_N_nda = A_adj(b)
+        helper_D_nda = A_adj(np.ones_like(b))
+
+        nda = np.zeros_like(helper_N_nda, dtype=dtype)
+        ind_nonzero = helper_D_nda > 0
+        nda[ind_nonzero] = helper_N_nda[ind_nonzero] / \
+            helper_D_nda[ind_nonzero]
+        nda = nda.reshape(sitk.GetArrayFromImage(self._HR_volume.sitk).shape)
+
+        # Update HR volume image file within Stack-object HR_volume
+        HR_volume_update = sitk.GetImageFromArray(nda)
+        HR_volume_update.CopyInformation(self._HR_volume.sitk)
+
+        self._HR_volume.sitk = HR_volume_update
+        self._HR_volume.itk = prec.get_itk_from_sitk_image(
+            HR_volume_update, precision)
+
+    ##
+    # Gets numerator and denominator of the discrete Shepard method, i.e. the
+    # sum and the number of nearest neighbour samples of all slices at each
+    # HR voxel, cf. Vercauteren2006, equation (19).
+    #
+    # A HR voxel is sampled by a slice if its centre falls within the slice
+    # voxel extent (nearest neighbour interpolation of the slice). Only
+    # positive samples are considered. Instead of resampling each slice onto
+    # the entire HR grid, only the HR voxels within the slab of each slice
+    # are visited and the samples are accumulated per stack by np.bincount.
+    # \date       2018-03-28 09:12:51+0100
+    #
+    # \param      self       The object
+    # \param      use_masks  Multiply slice intensities with slice masks
+    # \param      dtype      Data type of the returned arrays
+    #
+    # \return     Numerator and denominator as numpy arrays of HR volume shape
+    #
+    def _get_shepard_numerator_denominator(self, use_masks, dtype):
+
+        shape = sitk.GetArrayFromImage(self._HR_volume.sitk).shape
+        N_voxels = int(np.prod(shape))
+
+        # Accumulate samples of a subset of stacks into private arrays
+        def accumulate(stack_indices):
+            helper_N_nda = np.zeros(N_voxels)
+            helper_D_nda = np.zeros(N_voxels)
+
+            for i in stack_indices:
+                ph.print_info("Stack %s/%s" % (i+1, self._N_stacks))
+
+                indices, values = self._get_stack_samples(
+                    self._stacks[i], use_masks)
+
+                helper_N_nda += np.bincount(
+                    indices, weights=values, minlength=N_voxels)
+                helper_D_nda += np.bincount(indices, minlength=N_voxels)
+
+            return helper_N_nda, helper_D_nda
+
+        n_threads = max(1, min(self._n_threads, self._N_stacks))
+        results = self._map(accumulate, [
+            range(i, self._N_stacks, n_threads) for i in range(n_threads)])
+
+        # Reduce contributions of all threads
+        helper_N_nda, helper_D_nda = results[0]
+        for helper_N_nda_thread, helper_D_nda_thread in results[1:]:
+            helper_N_nda += helper_N_nda_thread
+            helper_D_nda += helper_D_nda_thread
+
+        return helper_N_nda.reshape(shape).astype(dtype), \
+            helper_D_nda.reshape(shape).astype(dtype)
+
+    ##
+    # Apply a function to all items, using up to n_threads threads.
+    # \date       2018-03-30 09:10:27+0100
+    #
+    # \param      self   The object
+    # \param      func   function taking one item
+    # \param      items  list of items
+    #
+    # \return     list of return values in order of items
+    #
+    def _map(self, func, items):
+
+        n_threads = min(self._n_threads, len(items))
+        if n_threads <= 1:
+            return [func(item) for item in items]
+
+        pool = ThreadPool(n_threads)
+        try:
+            results = pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+        return results
+
+    ##
+    # Gets the positive nearest neighbour samples of all slices of a stack at
+    # the HR voxels
+    # \date       2018-03-28 09:14:02+0100
+    #
+    # \param      self       The object
+    # \param      stack      Stack object
+    # \param      use_masks  Multiply slice intensities with slice masks
+    #
+    # \return     Flat HR voxel indices and sample values as 1D arrays
+    #
+    def _get_stack_samples(self, stack, use_masks):
+
+        indices = []
+        values = []
+        for slice in stack.get_slices():
+            nda_slice = sitk.GetArrayFromImage(slice.sitk).astype(np.float64)
+            if use_masks:
+                nda_slice *= sitk.GetArrayFromImage(slice.sitk_mask)
+
+            indices_slice, indices_HR = self._get_slice_to_HR_samples(
+                slice.sitk)
+            values_slice = nda_slice.ravel()[indices_slice]
+
+            ind_positive = values_slice > 0
+            indices.append(indices_HR[ind_positive])
+            values.append(values_slice[ind_positive])
+
+        if len(indices) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+
+        return np.concatenate(indices), np.concatenate(values)
+
+    ##
+    # Gets the correspondences between HR voxels and slice voxels obtained by
+    # nearest neighbour interpolation of the slice at the HR voxel centres.
+    #
+    # All HR voxels whose centres fall within the slice are visited in one
+    # vectorized computation: Along the HR axis most aligned with the slice
+    # normal, only the few HR voxels within the slab of slice thickness are
+    # enumerated for each HR voxel column of the slice bounding box.
+    # \date       2018-03-28 09:16:44+0100
+    #
+    # \param      self        The object
+    # \param      slice_sitk  Slice as sitk.Image object
+    #
+    # \return     Flat slice voxel indices and flat HR voxel indices as 1D
+    #             integer arrays of equal length
+    #
+    def _get_slice_to_HR_samples(self, slice_sitk):
+
+        size_r = np.array(self._HR_volume.sitk.GetSize())
+        size_s = np.array(slice_sitk.GetSize())
+
+        # Affine map p -> Q p + c from HR voxel indices to continuous slice
+        # voxel indices (both in (i, j, k) order)
+        A_r, o_r = self._get_index_to_physical_map(self._HR_volume.sitk)
+        A_s, o_s = self._get_index_to_physical_map(slice_sitk)
+        A_s_inv = np.linalg.inv(A_s)
+        Q = A_s_inv.dot(A_r)
+        c = A_s_inv.dot(o_r - o_s)
+
+        # Bounding box of the slice extent in HR voxel indices
+        corners = np.indices((2, 2, 2)).reshape(3, -1) * \
+            size_s[:, np.newaxis] - 0.5
+        corners_r = np.linalg.solve(Q, corners - c[:, np.newaxis])
+        lower = np.clip(np.floor(corners_r.min(axis=1)), 0, size_r - 1)
+        upper = np.clip(np.ceil(corners_r.max(axis=1)), 0, size_r - 1)
+        if np.any(corners_r.max(axis=1) < 0) or \
+                np.any(corners_r.min(axis=1) > size_r - 1):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        # HR axis a most aligned with the slice normal and remaining axes
+        q = Q[2]
+        a = int(np.argmax(np.abs(q)))
+        u, v = [axis for axis in range(0, 3) if axis != a]
+
+        # Slab condition -0.5 <= q.p + c_2 < 0.5 defines an interval of at
+        # most n_max indices along axis a for each column (p_u, p_v)
+        p_u, p_v = np.meshgrid(
+            np.arange(lower[u], upper[u] + 1),
+            np.arange(lower[v], upper[v] + 1),
+            indexing="ij")
+        p_u = p_u.ravel()
+        p_v = p_v.ravel()
+        offset = q[u] * p_u + q[v] * p_v + c[2]
+        start = np.ceil(np.minimum(
+            (-0.5 - offset) / q[a], (0.5 - offset) / q[a]))
+        n_max = int(np.ceil(1. / abs(q[a]))) + 1
+
+        p = np.zeros((3, p_u.size * n_max))
+        p[u] = np.repeat(p_u, n_max)
+        p[v] = np.repeat(p_v, n_max)
+        p[a] = (start[:, np.newaxis] + np.arange(0, n_max)).ravel()
+
+        # Keep HR voxels within the HR volume and the slice extent
+        s = Q.dot(p) + c[:, np.newaxis]
+        inside = (p[a] >= 0) & (p[a] <= size_r[a] - 1) & \
+            np.all(s >= -0.5, axis=0) & \
+            np.all(s < size_s[:, np.newaxis] - 0.5, axis=0)
+        p = p[:, inside].astype(int)
+        s = np.floor(s[:, inside] + 0.5).astype(int)
+
+        # Flat indices in numpy (k, j, i) order
+        indices_slice = (s[2] * size_s[1] + s[1]) * size_s[0] + s[0]
+        indices_HR = (p[2] * size_r[1] + p[1]) * size_r[0] + p[0]
+
+        return indices_slice, indices_HR
+
+    ##
+    # Gets the affine map from voxel indices to physical coordinates.
+    # \date       2018-03-28 09:18:20+0100
+    #
+    # \param      image_sitk  Image as sitk.Image object
+    #
+    # \return     3x3 matrix (direction times spacing) and origin as numpy
+    #             arrays
+    #
+    @staticmethod
+    def _get_index_to_physical_map(image_sitk):
+        direction = np.array(image_sitk.GetDirection()).reshape(3, 3)
+        spacing = np.array(image_sitk.GetSpacing())
+        origin = np.array(image_sitk.GetOrigin())
+
+        return direction.dot(np.diag(spacing)), origin
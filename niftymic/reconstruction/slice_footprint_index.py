@@ -0,0 +1,343 @@
+##
+# \file slice_footprint_index.py
+# \brief      Spatial index of the slice footprints in reconstruction space.
+#
+# The footprint of a slice is the region of the reconstruction space which
+# is affected by the slice acquisition model, i.e. the bounding box of all
+# slice voxel centres extended by the cut-off distance of the oriented PSF.
+# Footprints are stored both as reconstruction index regions and as world
+# (physical) bounding boxes. They are sorted by their lower bound along the
+# axis along which they are thinnest on average (typically the slice-select
+# direction), i.e. a region query only tests slices whose interval along this
+# axis can intersect the region.
+#
+# Every footprint is tagged with the geometry version of the slice it was
+# computed for. Queries use the footprints as of the last call of update().
+# Hence, update() is called once after a motion correction (not per query)
+# and only recomputes the footprints of moved slices.
+#
+# \author     Michael Ebner (michael.ebner.14@ucl.ac.uk)
+# \date       March 2018
+#
+
+# Import libraries
+import numpy as np
+
+import pysitk.simple_itk_helper as sitkh
+
+import niftymic.base.precision as prec
+import niftymic.reconstruction.linear_operators as lin_op
+
+
+class SliceFootprintIndex(object):
+
+    ##
+    # Constructor
+    # \date       2018-03-31 09:40:12+0100
+    #
+    # \param      self                   The object
+    # \param      slices                 list of Slice objects
+    # \param      reconstruction         Stack object defining the
+    #                                    reconstruction space
+    # \param      alpha_cut              Cut-off distance for Gaussian
+    #                                    blurring filter
+    # \param      deconvolution_mode     Either "full_3D" or "only_in_plane".
+    #                                    Indicates whether full 3D or only
+    #                                    in-plane deconvolution is considered
+    # \param      predefined_covariance  The predefined covariance
+    # \param      linear_operators       Optional LinearOperators object to
+    #                                    share the covariance cache with;
+    #                                    overrides the PSF settings above
+    #
+    def __init__(self,
+                 slices,
+                 reconstruction,
+                 alpha_cut=3,
+                 deconvolution_mode="full_3D",
+                 predefined_covariance=None,
+                 linear_operators=None,
+                 ):
+
+        if linear_operators is None:
+            precision = prec.get_precision(reconstruction.sitk)
+            linear_operators = lin_op.LinearOperators(
+                deconvolution_mode=deconvolution_mode,
+                predefined_covariance=predefined_covariance,
+                alpha_cut=alpha_cut,
+                image_type=prec.get_itk_image_type(precision),
+            )
+        self._linear_operators = linear_operators
+        self._linear_operators.set_reconstruction_space(reconstruction.itk)
+
+        self._reconstruction = reconstruction
+        self._slice_indices = {}
+        self.set_slices(slices)
+
+    ##
+    # Sets the indexed slices. Footprints of slices which are already indexed
+    # are kept (and recomputed by update() only if the slice has been moved
+    # since); all other footprints are computed on demand.
+    # \date       2018-03-31 09:42:30+0100
+    #
+    # \param      self    The object
+    # \param      slices  list of Slice objects
+    #
+    def set_slices(self, slices):
+
+        slices = list(slices)
+        N_slices = len(slices)
+
+        # Previous indices of the slices (None for slices not yet indexed)
+        indices_previous = [
+            self._slice_indices.get(slice_k) for slice_k in slices]
+        kept = [(k, k_previous)
+                for k, k_previous in enumerate(indices_previous)
+                if k_previous is not None]
+
+        # Geometry versions of the slice positions the footprints refer to
+        versions = [None] * N_slices
+        for k, k_previous in kept:
+            versions[k] = self._versions[k_previous]
+
+        # Footprints as half-open boxes [lower, upper) in reconstruction
+        # index space (i, j, k) and as closed boxes in world coordinates
+        index_lower = np.zeros((N_slices, 3), dtype=int)
+        index_upper = np.zeros((N_slices, 3), dtype=int)
+        world_lower = np.zeros((N_slices, 3))
+        world_upper = np.zeros((N_slices, 3))
+        if len(kept) > 0:
+            k, k_previous = [np.array(ind) for ind in zip(*kept)]
+            index_lower[k] = self._index_lower[k_previous]
+            index_upper[k] = self._index_upper[k_previous]
+            world_lower[k] = self._world_lower[k_previous]
+            world_upper[k] = self._world_upper[k_previous]
+
+        self._slices = slices
+        self._slice_indices = dict(
+            (slice_k, k) for k, slice_k in enumerate(self._slices))
+        self._versions = versions
+        self._index_lower = index_lower
+        self._index_upper = index_upper
+        self._world_lower = world_lower
+        self._world_upper = world_upper
+
+        # Slice orders sorted by the lower footprint bound along the sorting
+        # axis and the correspondingly sorted lower bounds
+        self._index_order = None
+        self._index_lower_sorted = None
+        self._world_order = None
+        self._world_lower_sorted = None
+
+        # Sorting axes in index and world space (updated with the orders)
+        self._index_axis = 2
+        self._world_axis = 2
+
+    def get_slices(self):
+        return self._slices
+
+    ##
+    # Sets the reconstruction space; all footprints are recomputed on demand.
+    # \date       2018-03-31 09:44:02+0100
+    #
+    # \param      self            The object
+    # \param      reconstruction  Stack object defining the reconstruction
+    #                             space
+    #
+    def set_reconstruction(self, reconstruction):
+        self._reconstruction = reconstruction
+        self._linear_operators.set_reconstruction_space(reconstruction.itk)
+
+        # Drop all footprints of the previous reconstruction space
+        self._slice_indices = {}
+        self.set_slices(self._slices)
+
+    def get_reconstruction(self):
+        return self._reconstruction
+
+    ##
+    # Update the footprints of all slices whose position has changed since
+    # their last evaluation, e.g. after update_motion_correction. Queries do
+    # not check the slice positions, i.e. update() needs to be called after
+    # every motion correction. Before the first update() the footprints are
+    # computed on first query.
+    # \date       2018-03-31 09:46:51+0100
+    #
+    # \param      self  The object
+    #
+    # \return     Number of updated footprints
+    #
+    def update(self):
+
+        reconstruction_itk = self._reconstruction.itk
+        spacing_r = np.array(reconstruction_itk.GetSpacing())
+        direction_r = np.array(sitkh.get_sitk_from_itk_direction(
+            reconstruction_itk.GetDirection())).reshape(3, 3)
+
+        # World extension of one reconstruction voxel along each axis
+        voxel_extent = np.abs(direction_r * spacing_r[np.newaxis, :])
+
+        N_updated = 0
+        for k, slice_k in enumerate(self._slices):
+            version = slice_k.get_geometry_version()
+            if self._versions[k] == version:
+                continue
+
+            slice_itk = slice_k.itk
+            index, size = self._linear_operators.get_footprint_region(
+                reconstruction_itk, slice_itk, slice_k=slice_k)
+            self._index_lower[k, :] = index
+            self._index_upper[k, :] = index + size
+
+            # World bounding box of slice voxel centres extended by the PSF
+            # cut-off distance
+            origin_s = np.array(slice_itk.GetOrigin())
+            spacing_s = np.array(slice_itk.GetSpacing())
+            direction_s = np.array(sitkh.get_sitk_from_itk_direction(
+                slice_itk.GetDirection())).reshape(3, 3)
+            size_s = np.array(slice_itk.GetLargestPossibleRegion().GetSize())
+            corners = np.indices((2, 2, 2)).reshape(3, -1) * \
+                (size_s[:, np.newaxis] - 1)
+            points = direction_s.dot(
+                spacing_s[:, np.newaxis] * corners) + origin_s[:, np.newaxis]
+            halo = voxel_extent.dot(self._linear_operators.get_psf_halo(
+                reconstruction_itk, slice_itk, slice_k=slice_k))
+            self._world_lower[k, :] = points.min(axis=1) - halo
+            self._world_upper[k, :] = points.max(axis=1) + halo
+
+            self._versions[k] = version
+            N_updated += 1
+
+        if N_updated > 0 or self._index_order is None:
+            self._update_orders()
+
+        return N_updated
+
+    ##
+    # Gets the footprint of a slice in reconstruction index space.
+    # \date       2018-03-31 09:50:17+0100
+    #
+    # \param      self     The object
+    # \param      slice_k  Indexed Slice object
+    #
+    # \return     Start index and size of region as integer numpy arrays in
+    #             itk.Image index order (i, j, k); the size is zero if the
+    #             slice does not affect the reconstruction space
+    #
+    def get_footprint_region(self, slice_k):
+        self._build()
+        k = self._slice_indices[slice_k]
+        return np.array(self._index_lower[k]), \
+            self._index_upper[k] - self._index_lower[k]
+
+    ##
+    # Gets the footprint of a slice in world coordinates.
+    # \date       2018-03-31 09:51:44+0100
+    #
+    # \param      self     The object
+    # \param      slice_k  Indexed Slice object
+    #
+    # \return     Lower and upper corner of the axis-aligned bounding box as
+    #             numpy arrays
+    #
+    def get_world_bounding_box(self, slice_k):
+        self._build()
+        k = self._slice_indices[slice_k]
+        return np.array(self._world_lower[k]), np.array(self._world_upper[k])
+
+    ##
+    # Gets all slices whose footprint intersects a region of the
+    # reconstruction space.
+    # \date       2018-03-31 09:53:26+0100
+    #
+    # \param      self   The object
+    # \param      index  Start index of region in (i, j, k)
+    # \param      size   Size of region in (i, j, k)
+    #
+    # \return     list of Slice objects in the order of the indexed slices
+    #
+    def get_slices_in_region(self, index, size):
+
+        self._build()
+
+        lower = np.array(index, dtype=int)
+        upper = lower + np.array(size, dtype=int)
+        if np.any(upper <= lower):
+            return []
+
+        # Candidates start before the end of the region along sorting axis
+        n = np.searchsorted(
+            self._index_lower_sorted, upper[self._index_axis], side="left")
+        candidates = self._index_order[0:n]
+
+        # Half-open boxes intersect iff they overlap along every axis.
+        # Empty footprints (lower == upper) never intersect.
+        intersect = np.all(
+            (self._index_lower[candidates] < upper) &
+            (self._index_upper[candidates] > lower) &
+            (self._index_upper[candidates] > self._index_lower[candidates]),
+            axis=1)
+
+        return [self._slices[k] for k in np.sort(candidates[intersect])]
+
+    ##
+    # Gets all slices whose footprint intersects a world bounding box.
+    # \date       2018-03-31 09:55:09+0100
+    #
+    # \param      self   The object
+    # \param      lower  Lower corner of box in world coordinates
+    # \param      upper  Upper corner of box in world coordinates
+    #
+    # \return     list of Slice objects in the order of the indexed slices
+    #
+    def get_slices_in_world_box(self, lower, upper):
+
+        self._build()
+
+        lower = np.array(lower, dtype=np.float64)
+        upper = np.array(upper, dtype=np.float64)
+
+        n = np.searchsorted(
+            self._world_lower_sorted, upper[self._world_axis], side="right")
+        candidates = self._world_order[0:n]
+
+        intersect = np.all(
+            (self._world_lower[candidates] <= upper) &
+            (self._world_upper[candidates] >= lower),
+            axis=1)
+
+        return [self._slices[k] for k in np.sort(candidates[intersect])]
+
+    ##
+    # Compute all footprints in case the index has not been built yet
+    # \date       2018-03-31 09:56:22+0100
+    #
+    # \param      self  The object
+    #
+    def _build(self):
+        if self._index_order is None:
+            self.update()
+
+    ##
+    # Update the slice orders after footprints have changed. The sorting axis
+    # is the one along which the footprints are thinnest on average.
+    # \date       2018-03-31 09:57:40+0100
+    #
+    # \param      self  The object
+    #
+    def _update_orders(self):
+
+        if len(self._slices) > 0:
+            self._index_axis = int(np.argmin(np.mean(
+                self._index_upper - self._index_lower, axis=0)))
+            self._world_axis = int(np.argmin(np.mean(
+                self._world_upper - self._world_lower, axis=0)))
+
+        self._index_order = np.argsort(
+            self._index_lower[:, self._index_axis], kind="mergesort")
+        self._index_lower_sorted = \
+            self._index_lower[self._index_order, self._index_axis]
+
+        self._world_order = np.argsort(
+            self._world_lower[:, self._world_axis], kind="mergesort")
+        self._world_lower_sorted = \
+            self._world_lower[self._world_order, self._world_axis]
@@ -11,18 +11,87 @@
 # Import libraries
 from abc import ABCMeta, abstractmethod
 import sys
+import weakref
 import itk
+from multiprocessing.pool import ThreadPool
 import SimpleITK as sitk
 import numpy as np
+import scipy.ndimage
+import scipy.sparse
+import scipy.sparse.linalg
 
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
 
+import niftymic.base.precision as prec
+import niftymic.reconstruction.gradient_operators as grad_op
 import niftymic.reconstruction.linear_operators as lin_op
+import niftymic.reconstruction.slice_footprint_index as sfi
 
 # Allowed data loss functions
 DATA_LOSS = ['linear', 'soft_l1', 'huber', 'cauchy', 'arctan']
 
+##
+# All slices of a stack which (still) share the rigid geometry of the stack.
+# Provides the itk.Image object of the stack and the stacked slice masks so
+# that it can be used in place of a Slice object for operator evaluations.
+# Batches are rebuilt whenever the geometry may have changed and hence never
+# move, i.e. their geometry version is constant.
+# \date       2018-03-12 10:19:02+0000
+#
+class SliceBatch(object):
+
+    def __init__(self, itk, itk_mask):
+        self.itk = itk
+        self.itk_mask = itk_mask
+
+    def get_geometry_version(self):
+        return 0
+
+
+##
+# Raised by ConvergenceObserver to stop the iterations of an NSoL solver once
+# a convergence criterion is met.
+# \date       2018-03-16 09:08:12+0000
+#
+class ConvergenceReached(Exception):
+    pass
+
+
+##
+# Observer passed to NSoL solvers (see nsol.solver.Solver.set_observer). NSoL
+# solvers iterating themselves (e.g. primal-dual or ADMM) hand over the
+# initial value and the estimate after each iteration. The convergence
+# callback is evaluated for every estimate and the solver is stopped by
+# ConvergenceReached once it returns True.
+# \date       2018-03-16 09:09:40+0000
+#
+class ConvergenceObserver(object):
+
+    ##
+    # \date       2018-03-16 09:10:02+0000
+    #
+    # \param      self      The object
+    # \param      callback  function callback(n, x) called after the n-th
+    #                       iteration; returns True to stop the iterations
+    #
+    def __init__(self, callback):
+        self._callback = callback
+        self._n = -1
+        self._x = None
+
+    def add_x(self, x):
+        self._n += 1
+        self._x = x
+        if self._n > 0 and self._callback(self._n, x):
+            raise ConvergenceReached()
+
+    def set_computational_time(self, computational_time):
+        pass
+
+    def get_x(self):
+        return self._x
+
 
 ##
 # This class contains the common functions/attributes of the solvers
@@ -59,6 +128,26 @@ class Solver(object):
     #                                       (sigma_x2, sigma_y2, sigma_z2) or
     #                                       as full 3x3 numpy array
     # \param         verbose                The verbose
+    # \param         image_type             itk.Image type used for the ITK
+    #                                       filters. If None, it is chosen
+    #                                       according to the precision of the
+    #                                       reconstruction image, i.e.
+    #                                       itk.Image.F3 for sitk.sitkFloat32
+    #                                       and itk.Image.D3 otherwise
+    # \param         use_assembled_operator Boolean to indicate whether the
+    #                                       PSF-weighted operator MA is
+    #                                       assembled once as sparse matrix
+    #                                       and used for all forward and
+    #                                       adjoint evaluations
+    # \param         n_threads              Number of threads used to
+    #                                       evaluate the slice-wise forward
+    #                                       and adjoint operations
+    # \param         use_mask_compression   Boolean to indicate whether the
+    #                                       unknown vector x is restricted to
+    #                                       the voxels within the
+    #                                       reconstruction mask (dilated by
+    #                                       the PSF cut-off distance). All
+    #                                       other voxels are fixed to zero.
     #
     def __init__(self,
                  stacks,
@@ -74,8 +163,11 @@ class Solver(object):
                  deconvolution_mode,
                  predefined_covariance,
                  verbose,
-                 image_type=itk.Image.D3,
+                 image_type=None,
                  use_masks=True,
+                 use_assembled_operator=False,
+                 n_threads=1,
+                 use_mask_compression=False,
                  ):
 
         # Initialize variables
@@ -85,6 +177,12 @@ class Solver(object):
         # Cut-off distance for Gaussian blurring filter
         self._alpha_cut = alpha_cut
 
+        # Floating point precision of the data and the solver vectors
+        self._precision = prec.get_precision(self._reconstruction.sitk)
+        self._dtype = prec.get_numpy_dtype(self._precision)
+        if image_type is None:
+            image_type = prec.get_itk_image_type(self._precision)
+
         self._deconvolution_mode = deconvolution_mode
         self._predefined_covariance = predefined_covariance
         self._linear_operators = lin_op.LinearOperators(
@@ -93,6 +191,14 @@ class Solver(object):
             alpha_cut=self._alpha_cut,
             image_type=image_type
         )
+        self._image_type = image_type
+
+        # Per-thread LinearOperators instances and thread pool (created on
+        # demand)
+        self._n_threads = n_threads
+        self._linear_operators_threads = []
+        self._thread_pool = None
+        self._thread_pool_size = 0
 
         # Settings for solver
         self._alpha = alpha
@@ -100,6 +206,76 @@ class Solver(object):
 
         self._use_masks = use_masks
 
+        # Assembled sparse representation of MA and its transpose. Computed
+        # lazily for the current slice geometries at first use within run()
+        self._use_assembled_operator = use_assembled_operator
+        self._MA_sparse = None
+        self._MA_sparse_T = None
+
+        # Persistent data buffers and itk.Image views on them used to pass
+        # the solver vectors to the ITK filters without per-slice allocations
+        self._x_buffer = None
+        self._x_itk_view = None
+        self._slices_buffer = None
+        self._slices_itk_views = None
+
+        # Slices, or batches of slices, for forward and adjoint evaluations
+        self._operator_ranges = None
+
+        # Data derived from the slice intensities and masks only, i.e.
+        # independent of the slice positions. Kept across runs.
+        self._slice_ranges = None
+        self._M_y = None
+        self._M_y_signature = None
+
+        # Per-slice data derived from the slice positions (assembled operator
+        # rows), each entry tagged with the geometry version of the slice it
+        # was computed for. Kept across runs so that only moved slices are
+        # updated
+        self._slice_caches = {}
+
+        # Footprints of all slices in reconstruction space. The index is
+        # updated once per geometry change, i.e. at the first adjoint
+        # evaluation after the operator caches have been cleared, and only
+        # recomputes the footprints of moved slices.
+        self._footprint_index = sfi.SliceFootprintIndex(
+            slices=[slice_k for stack in self._stacks
+                    for slice_k in stack.get_slices()],
+            reconstruction=self._reconstruction,
+            linear_operators=self._linear_operators,
+        )
+        self._footprint_index_updated = False
+
+        # Evaluate the operators of slices (or stacks) which are axis-aligned
+        # with the reconstruction grid via separable one-dimensional operators
+        self._use_separable_operators = True
+
+        # Flat indices of the reconstruction voxels which form the unknown
+        # vector x in case of mask compression (computed on demand)
+        self._use_mask_compression = use_mask_compression
+        self._x_indices = None
+
+        # Diagonal of (MA)^T MA for the current geometry (computed on demand)
+        self._MA_diagonal = None
+
+        # Gradient operators with preallocated work buffers for the current
+        # reconstruction grid and unknowns (created on demand)
+        self._gradient_operators = None
+
+        # Estimated squared operator norms. The one of the gradient is cached
+        # per reconstruction grid, the one of MA for the current geometry
+        self._gradient_norm_squared = {}
+        self._MA_norm_squared = None
+
+        # Convergence control. If no tolerance is set, the full iteration
+        # budget is used. Otherwise, the criteria are checked every iter_step
+        # iterations by the solvers performing the iterations themselves.
+        self._rtol_residual = None
+        self._rtol_x = None
+        self._rtol_data_fit = None
+        self._iter_step = 5
+        self._convergence_history = None
+
         self._minimizer = minimizer
         self._data_loss = data_loss
         self._data_loss_scale = data_loss_scale
@@ -131,11 +307,14 @@ class Solver(object):
         # -----------------------------Set helpers-----------------------------
         self._N_stacks = len(self._stacks)
 
-        # Compute total amount of pixels for all slices
+        # Compute total amount of pixels for all slices. Stacks may consist of
+        # a subset of slices only (e.g. after slice rejection or in case of
+        # block-wise reconstructions)
         self._N_total_slice_voxels = 0
         for i in range(0, self._N_stacks):
-            N_stack_voxels = np.array(self._stacks[i].sitk.GetSize()).prod()
-            self._N_total_slice_voxels += N_stack_voxels
+            for slice_k in self._stacks[i].get_slices():
+                self._N_total_slice_voxels += \
+                    np.array(slice_k.sitk.GetSize()).prod()
 
         # Extract information ready to use for itk image conversion operations
         self._reconstruction_shape = sitk.GetArrayFromImage(
@@ -151,15 +330,50 @@ class Solver(object):
         # Update helpers
         self._N_stacks = len(self._stacks)
 
-        # Compute total amount of pixels for all slices
+        # Compute total amount of pixels for all slices. Stacks may consist of
+        # a subset of slices only (e.g. after slice rejection or in case of
+        # block-wise reconstructions)
         self._N_total_slice_voxels = 0
         for i in range(0, self._N_stacks):
-            N_stack_voxels = np.array(self._stacks[i].sitk.GetSize()).prod()
-            self._N_total_slice_voxels += N_stack_voxels
+            for slice_k in self._stacks[i].get_slices():
+                self._N_total_slice_voxels += \
+                    np.array(slice_k.sitk.GetSize()).prod()
+
+        # Per-slice caches and footprints are tagged with the slice geometry
+        # version and remain valid for slices which are still in use, e.g. if
+        # stacks are added to an existing reconstruction problem
+        slices = set([slice_k for stack in self._stacks
+                      for slice_k in stack.get_slices()])
+        self._slice_caches = dict(
+            (slice_k, cache)
+            for slice_k, cache in self._slice_caches.items()
+            if slice_k in slices)
+
+        self._footprint_index.set_slices(
+            [slice_k for stack in self._stacks
+             for slice_k in stack.get_slices()])
+
+        self._slice_ranges = None
+        self._M_y = None
+        self._M_y_signature = None
+        self._clear_operator_caches()
+
+    def get_stacks(self):
+        return self._stacks
 
     def set_reconstruction(self, reconstruction):
         self._reconstruction = reconstruction
 
+        # Per-slice data refers to the reconstruction grid. Cached PSF
+        # covariances are kept as long as the reconstruction orientation
+        # remains the same, e.g. for a resampled reconstruction grid
+        self._slice_caches = {}
+        for linear_operators in \
+                [self._linear_operators] + self._linear_operators_threads:
+            linear_operators.set_reconstruction_space(reconstruction.itk)
+        self._footprint_index.set_reconstruction(reconstruction)
+        self._clear_operator_caches()
+
         # Extract information ready to use for itk image conversion operations
         self._reconstruction_shape = sitk.GetArrayFromImage(
             self._reconstruction.sitk).shape
@@ -239,11 +453,127 @@ class Solver(object):
     def get_verbose(self):
         return self._verbose
 
+    ##
+    # Sets whether the assembled sparse matrix representation of MA shall be
+    # used for the forward and adjoint operator evaluations.
+    # \date       2018-03-05 10:12:41+0000
+    #
+    # \param      self                    The object
+    # \param      use_assembled_operator  boolean
+    #
+    def set_use_assembled_operator(self, use_assembled_operator):
+        self._use_assembled_operator = use_assembled_operator
+        self._clear_assembled_operator()
+
+    def get_use_assembled_operator(self):
+        return self._use_assembled_operator
+
+    ##
+    # Sets the number of threads used to evaluate the slice-wise forward and
+    # adjoint operations.
+    # \date       2018-03-07 09:44:20+0000
+    #
+    # \param      self       The object
+    # \param      n_threads  Number of threads, integer
+    #
+    def set_n_threads(self, n_threads):
+        self._n_threads = n_threads
+
+    def get_n_threads(self):
+        return self._n_threads
+
+    ##
+    # Sets whether the operators of slices (or unmoved stacks) whose grids are
+    # axis-aligned with the reconstruction grid are evaluated as separable
+    # operators instead of via the oriented Gaussian ITK filters.
+    # \date       2018-03-20 10:02:44+0000
+    #
+    # \param      self                     The object
+    # \param      use_separable_operators  boolean
+    #
+    def set_use_separable_operators(self, use_separable_operators):
+        self._use_separable_operators = use_separable_operators
+
+    def get_use_separable_operators(self):
+        return self._use_separable_operators
+
+    ##
+    # Sets whether the unknown vector x is restricted to the voxels within the
+    # (dilated) reconstruction mask.
+    # \date       2018-03-13 09:51:07+0000
+    #
+    # \param      self                  The object
+    # \param      use_mask_compression  boolean
+    #
+    def set_use_mask_compression(self, use_mask_compression):
+        self._use_mask_compression = use_mask_compression
+        self._clear_operator_caches()
+
+    def get_use_mask_compression(self):
+        return self._use_mask_compression
+
+    ##
+    # Sets the criteria to stop the iterations before the iteration budget is
+    # exhausted.
+    #
+    # The criteria are checked every iter_step iterations and the iterations
+    # are stopped if any of the given relative tolerances is met. Solvers are
+    # never restarted for the checks, except for Tikhonov reconstructions
+    # with the lsmr minimizer, which is run in chunks of iter_step iterations,
+    # each warm-started from the previous estimate. The minimizers
+    # 'lsq_linear' and 'least_squares' do not expose the iterates; they
+    # always use the full budget and the result is checked once.
+    # \date       2018-03-16 09:02:33+0000
+    #
+    # \param      self           The object
+    # \param      rtol_residual  Tolerance for ||MAx - My|| / ||My||
+    # \param      rtol_x         Tolerance for the relative change of x
+    #                            between two checks
+    # \param      rtol_data_fit  Tolerance for the relative change of the
+    #                            data fit 1/2 ||MAx - My||^2 (stagnation)
+    # \param      iter_step      Number of iterations between two checks
+    #
+    def set_convergence_criteria(self,
+                                 rtol_residual=None,
+                                 rtol_x=None,
+                                 rtol_data_fit=None,
+                                 iter_step=5):
+        if iter_step < 1:
+            raise ValueError(
+                "Number of iterations between two checks must be positive")
+        self._rtol_residual = rtol_residual
+        self._rtol_x = rtol_x
+        self._rtol_data_fit = rtol_data_fit
+        self._iter_step = iter_step
+
+    ##
+    # Gets the convergence history of the last run, i.e. relative residual,
+    # data fit, regularizer and relative change of x at each check. It is
+    # only recorded if any convergence criterion is set.
+    # \date       2018-03-16 09:05:12+0000
+    #
+    # \param      self  The object
+    #
+    # \return     dictionary of lists with keys "iterations", "residual",
+    #             "data_fit", "regularizer" and "x_change"
+    #
+    def get_convergence_history(self):
+        return self._convergence_history
+
     def run(self):
 
+        # Slice positions might have changed since last call (e.g. due to
+        # slice-to-volume registration in between)
+        self._clear_operator_caches()
+
+        self._reset_convergence_history()
+
         # Run solver specific reconstruction
         self._run()
 
+        # Release memory of assembled operator and buffers
+        self._clear_operator_caches()
+
     # Get current estimate of reconstruction
     #  \return current estimate of reconstruction, instance of Stack
     def get_reconstruction(self):
@@ -282,7 +612,12 @@ class Solver(object):
         return lambda x: self._A_adj_M(x)
 
     ##
-    # Gets the right hand-side vector b \in R^m
+    # Gets the right hand-side vector b \in R^m.
+    #
+    # The stacked masked slice data is computed once and reused across runs
+    # (e.g. between two-step cycles or for several alphas) as long as the
+    # slice images and masks remain the same objects; slice motion does not
+    # affect it.
     # \date       2017-07-25 16:19:30+0100
     #
     # \param      self  The object
@@ -290,11 +625,25 @@ class Solver(object):
     # \return     1D numpy array
     #
     def get_b(self):
-        return self._get_M_y()
+        return np.array(self._get_M_y())
+
+    ##
+    # Clear all cached data derived from the slice intensities and masks.
+    # Required in case the slice data arrays were modified in-place.
+    # \date       2018-03-21 09:10:23+0000
+    #
+    # \param      self  The object
+    #
+    def clear_data_cache(self):
+        self._slice_ranges = None
+        self._M_y = None
+        self._M_y_signature = None
+        self._clear_slice_caches()
 
     ##
     # Gets the initial value given by the flattened reconstruction numpy data
-    # array in R^n.
+    # array in R^n. In case of mask compression, only the voxels within the
+    # dilated reconstruction mask are considered.
     # \date       2017-07-25 16:20:00+0100
     #
     # \param      self  The object
@@ -302,11 +651,73 @@ class Solver(object):
     # \return     1D numpy array
     #
     def get_x0(self):
-        return sitk.GetArrayFromImage(self._reconstruction.sitk).flatten()
+        return self._get_x_compressed(
+            sitk.GetArrayFromImage(self._reconstruction.sitk).flatten())
 
     def get_x_scale(self):
         return self._x_scale
 
+    ##
+    # Gets an estimate of the squared operator norm of the gradient, i.e.
+    # \f$ L^2 = \Vert \nabla \Vert^2 \f$, obtained by power iteration on the
+    # reconstruction grid. The estimate is cached per grid (spacing and size).
+    #
+    # It is a tighter substitute for the analytical bound 16/h^2 as used for
+    # the step sizes of primal-dual algorithms. Since power iteration
+    # approaches the norm from below, a safety factor is applied.
+    # \date       2018-03-23 09:41:27+0000
+    #
+    # \param      self           The object
+    # \param      iter_max       Maximum number of power iterations
+    # \param      safety_factor  Factor multiplied with the estimate
+    #
+    # \return     Estimated squared operator norm as scalar
+    #
+    def get_gradient_norm_squared(self, iter_max=50, safety_factor=1.1):
+
+        spacing = np.array(self._reconstruction.sitk.GetSpacing())
+        key = (tuple(spacing), self._reconstruction_shape)
+
+        if key not in self._gradient_norm_squared:
+            gradient_operators = grad_op.GradientOperators(
+                shape=self._reconstruction_shape,
+                spacing=spacing,
+                dtype=self._dtype)
+            grad, grad_adj = gradient_operators.get_gradient_operators()
+
+            self._gradient_norm_squared[key] = self._get_norm_squared_estimate(
+                grad, grad_adj, self._N_voxels_recon, iter_max=iter_max)
+
+            if self._verbose:
+                ph.print_info(
+                    "Estimated squared norm of gradient: %g (bound 16/h^2 = "
+                    "%g)" % (self._gradient_norm_squared[key],
+                             16. / spacing[0]**2))
+
+        return safety_factor * self._gradient_norm_squared[key]
+
+    ##
+    # Gets an estimate of the squared operator norm of the stacked operator
+    # MA, i.e. the largest eigenvalue of (MA)^T MA, obtained by power
+    # iteration. The estimate is cached for the current slice and
+    # reconstruction geometries.
+    # \date       2018-03-23 09:48:02+0000
+    #
+    # \param      self           The object
+    # \param      iter_max       Maximum number of power iterations
+    # \param      safety_factor  Factor multiplied with the estimate
+    #
+    # \return     Estimated squared operator norm as scalar
+    #
+    def get_MA_norm_squared(self, iter_max=20, safety_factor=1.1):
+
+        if self._MA_norm_squared is None:
+            self._MA_norm_squared = self._get_norm_squared_estimate(
+                self._MA, self._A_adj_M, self.get_x0().size,
+                iter_max=iter_max)
+
+        return safety_factor * self._MA_norm_squared
+
     ##
     #       Gets the setting specific filename indicating the information
     #             used for the reconstruction step
@@ -354,43 +765,39 @@ class Solver(object):
     #
     def _get_M_y(self):
 
-        # Allocate memory
-        My = np.zeros(self._N_total_slice_voxels)
-
-        # Define index for first voxel of first slice within array
-        i_min = 0
-
-        for i in range(0, self._N_stacks):
-            stack = self._stacks[i]
-            slices = stack.get_slices()
-
-            # Get number of voxels of each slice in current stack
-            N_slice_voxels = np.array(slices[0].sitk.GetSize()).prod()
+        # Image objects holding the slice intensities and masks. New objects
+        # indicate new data
+        signature = [self._use_masks] + [
+            image_itk
+            for slice_k, i_min, i_max in self._get_slice_ranges()
+            for image_itk in (slice_k.itk, slice_k.itk_mask)]
 
-            for j in range(0, stack.get_number_of_slices()):
+        if self._M_y is not None and \
+                len(signature) == len(self._M_y_signature) and \
+                all([a is b for a, b in zip(signature, self._M_y_signature)]):
+            return self._M_y
 
-                # Define index for last voxel to specify current slice
-                # (exlusive)
-                i_max = i_min + N_slice_voxels
+        # Allocate memory
+        My = np.zeros(self._N_total_slice_voxels, dtype=self._dtype)
 
-                # Get current slice
-                slice_k = slices[j]
+        def get_M_y_slices(linear_operators, slice_ranges):
+            for slice_k, i_min, i_max in slice_ranges:
 
                 # Apply M_k y_k
                 if self._use_masks:
-                    slice_itk = self._linear_operators.M_itk(
+                    slice_itk = linear_operators.M_itk(
                         slice_k.itk, slice_k.itk_mask)
                 else:
                     slice_itk = slice_k.itk
-                slice_nda_vec = self._itk2np.GetArrayFromImage(
-                    slice_itk).flatten()
+                slice_nda = self._itk2np.GetArrayViewFromImage(slice_itk)
 
                 # Fill respective elements
-                My[i_min:i_max] = slice_nda_vec
+                My[i_min:i_max] = slice_nda.ravel()
 
-                # Define index for first voxel to specify subsequent slice
-                # (inclusive)
-                i_min = i_max
+        self._run_slice_loop(get_M_y_slices)
+
+        self._M_y = My
+        self._M_y_signature = signature
 
         return My
 
@@ -398,23 +805,30 @@ class Solver(object):
     # Operation M_k A_k x
     # \date       2017-07-25 15:15:53+0100
     #
-    # \param      self       The object
+    # \param      self              The object
     # \param      reconstruction_itk  reconstruction image as itk.Image object
-    # \param      slice_k    Slice object which defines operator M_k and A_k
+    # \param      slice_k           Slice object which defines operator M_k
+    #                               and A_k
+    # \param      linear_operators  LinearOperators object used for the
+    #                               evaluation. If None, the solver's default
+    #                               instance is used.
     #
     # \return     { description_of_the_return_value }
     #
-    def _Mk_Ak(self, reconstruction_itk, slice_k):
+    def _Mk_Ak(self, reconstruction_itk, slice_k, linear_operators=None):
+
+        if linear_operators is None:
+            linear_operators = self._linear_operators
 
         # Compute A_k x
-        Ak_reconstruction_itk = self._linear_operators.A_itk(
-            reconstruction_itk, slice_k.itk)
+        Ak_reconstruction_itk = linear_operators.A_itk(
+            reconstruction_itk, slice_k.itk, slice_k)
 
         if not self._use_masks:
             return Ak_reconstruction_itk
-        
+
         # Compute M_k A_k x
-        Ak_reconstruction_itk = self._linear_operators.M_itk(
+        Ak_reconstruction_itk = linear_operators.M_itk(
             Ak_reconstruction_itk, slice_k.itk_mask)
 
         return Ak_reconstruction_itk
@@ -423,28 +837,104 @@ class Solver(object):
     # Operation A_k^* M_k y_k
     # \date       2017-07-25 15:15:53+0100
     #
-    # \param      self       The object
-    # \param      slice_itk  LR image as itk.Image object
-    # \param      slice_k    Slice object which defines operator A_k^*
+    # \param      self              The object
+    # \param      slice_itk         LR image as itk.Image object
+    # \param      slice_k           Slice object which defines operator A_k^*
+    # \param      reference_itk     Image as itk.Image object defining the
+    #                               output space. If None, the entire
+    #                               reconstruction space is used.
+    # \param      linear_operators  LinearOperators object used for the
+    #                               evaluation. If None, the solver's default
+    #                               instance is used.
     #
     # \return     image in reconstruction space as itk.Image object after
     #             performed backward operation
     #
-    def _Ak_adj_Mk(self, slice_itk, slice_k):
+    def _Ak_adj_Mk(self,
+                   slice_itk,
+                   slice_k,
+                   reference_itk=None,
+                   linear_operators=None):
+
+        if reference_itk is None:
+            reference_itk = self._reconstruction.itk
+
+        if linear_operators is None:
+            linear_operators = self._linear_operators
 
         # Compute M_k y_k
         if self._use_masks:
-            Mk_slice_itk = self._linear_operators.M_itk(
+            Mk_slice_itk = linear_operators.M_itk(
                 slice_itk, slice_k.itk_mask)
         else:
             Mk_slice_itk = slice_itk
 
         # Compute A_k^* M_k y_k
-        Mk_slice_itk = self._linear_operators.A_adj_itk(
-            Mk_slice_itk, self._reconstruction.itk)
+        Mk_slice_itk = linear_operators.A_adj_itk(
+            Mk_slice_itk, reference_itk, slice_k)
 
         return Mk_slice_itk
 
+    ##
+    # Gets the separable operators of a slice (or stack-batch) in case its
+    # grid is axis-aligned with the reconstruction grid.
+    # \date       2018-03-20 10:05:12+0000
+    #
+    # \param      self              The object
+    # \param      slice_k           Slice object (or SliceBatch)
+    # \param      linear_operators  LinearOperators object
+    #
+    # \return     list of sparse matrices [A_x, A_y, A_z] or None
+    #
+    def _get_separable_operators(self, slice_k, linear_operators):
+
+        if not self._use_separable_operators:
+            return None
+
+        return linear_operators.get_separable_operators(
+            self._reconstruction.itk, slice_k.itk, slice_k=slice_k)
+
+    ##
+    # Operation M_k A_k x for separable A_k
+    # \date       2018-03-20 10:06:38+0000
+    #
+    # \param      self               The object
+    # \param      reconstruction_nda  reconstruction data array
+    # \param      slice_k            Slice object (or SliceBatch)
+    # \param      operators          list of sparse matrices [A_x, A_y, A_z]
+    #
+    # \return     slice data array
+    #
+    def _Mk_Ak_separable(self, reconstruction_nda, slice_k, operators):
+
+        slice_nda = lin_op.LinearOperators.apply_separable_operators(
+            operators, reconstruction_nda)
+
+        if self._use_masks:
+            slice_nda *= self._itk2np.GetArrayViewFromImage(slice_k.itk_mask)
+
+        return slice_nda
+
+    ##
+    # Operation A_k^* M_k y_k for separable A_k
+    # \date       2018-03-20 10:07:51+0000
+    #
+    # \param      self       The object
+    # \param      slice_nda  slice data array
+    # \param      slice_k    Slice object (or SliceBatch)
+    # \param      operators  list of sparse matrices [A_x, A_y, A_z]
+    #
+    # \return     data array in reconstruction space
+    #
+    def _Ak_adj_Mk_separable(self, slice_nda, slice_k, operators):
+
+        if self._use_masks:
+            slice_nda = slice_nda * \
+                self._itk2np.GetArrayViewFromImage(slice_k.itk_mask)
+
+        return lin_op.LinearOperators.apply_separable_operators(
+            [operator.transpose() for operator in operators], slice_nda)
+
     #
     # Evaluate
     # \f$ MA \vec{x}
@@ -454,47 +944,54 @@ class Solver(object):
     # \f$
     # \date       2017-07-25 15:15:53+0100
     #
-    # \param      self           The object
+    # \param      self                    The object
     # \param      reconstruction_nda_vec  reconstruction data as 1D array
+    # \param      slice_ranges            list of tuples (slice_k, i_min,
+    #                                     i_max) to evaluate. If None, all
+    #                                     slices are used. Entries of other
+    #                                     slices remain zero.
     #
     # \return     evaluated MAx as part of augmented linear operator as 1D
     #             array
     #
-    def _MA(self, reconstruction_nda_vec):
+    def _MA(self, reconstruction_nda_vec, slice_ranges=None):
 
-        # Convert reconstruction data array back to itk.Image object
-        x_itk = self._get_itk_image_from_array_vec(
-            reconstruction_nda_vec, self._reconstruction.itk)
+        if self._use_assembled_operator:
+            MA = self._get_assembled_operator()
+            if slice_ranges is None:
+                return MA.dot(reconstruction_nda_vec)
+            MA_x = np.zeros(self._N_total_slice_voxels, dtype=self._dtype)
+            for slice_k, i_min, i_max in slice_ranges:
+                MA_x[i_min:i_max] = MA[i_min:i_max].dot(reconstruction_nda_vec)
+            return MA_x
 
-        # Allocate memory
-        MA_x = np.zeros(self._N_total_slice_voxels)
+        if slice_ranges is None:
+            slice_ranges = self._get_operator_ranges()
 
-        # Define index for first voxel of first slice within array
-        i_min = 0
+        # Pass reconstruction data array as itk.Image object
+        x_itk = self._get_x_itk_view(reconstruction_nda_vec)
 
-        for i in range(0, self._N_stacks):
-            stack = self._stacks[i]
-            slices = stack.get_slices()
-
-            # Get number of voxels of each slice in current stack
-            N_slice_voxels = np.array(slices[0].sitk.GetSize()).prod()
+        # Allocate memory
+        MA_x = np.zeros(self._N_total_slice_voxels, dtype=self._dtype)
 
-            for j in range(0, stack.get_number_of_slices()):
+        def MA_slices(linear_operators, slice_ranges):
+            for slice_k, i_min, i_max in slice_ranges:
 
-                # Define index for last voxel to specify current slice
-                # (exclusive)
-                i_max = i_min + N_slice_voxels
+                operators = self._get_separable_operators(
+                    slice_k, linear_operators)
 
                 # Compute M_k A_k y_k
-                slice_itk = self._Mk_Ak(x_itk, slices[j])
-                slice_nda = self._itk2np.GetArrayFromImage(slice_itk)
+                if operators is not None:
+                    slice_nda = self._Mk_Ak_separable(
+                        self._x_buffer, slice_k, operators)
+                else:
+                    slice_itk = self._Mk_Ak(x_itk, slice_k, linear_operators)
+                    slice_nda = self._itk2np.GetArrayViewFromImage(slice_itk)
 
                 # Fill corresponding elements
-                MA_x[i_min:i_max] = slice_nda.flatten()
+                MA_x[i_min:i_max] = slice_nda.ravel()
 
-                # Define index for first voxel to specify subsequent slice
-                # (inclusive)
-                i_min = i_max
+        self._run_slice_loop(MA_slices, slice_ranges)
 
         return MA_x
 
@@ -507,14 +1004,170 @@ class Solver(object):
     #
     # \param      self                    The object
     # \param      stacked_slices_nda_vec  stacked slice data as 1D array
+    # \param      slice_ranges            list of tuples (slice_k, i_min,
+    #                                     i_max) to consider. If None, all
+    #                                     slices are used.
     #
     # \return     evaluated A'My as part of augmented adjoint linear operator
     #             as 1D array
     #
-    def _A_adj_M(self, stacked_slices_nda_vec):
+    def _A_adj_M(self, stacked_slices_nda_vec, slice_ranges=None):
 
-        # Allocate memory
-        A_adj_M_y = np.zeros(self._N_voxels_recon)
+        if self._use_assembled_operator:
+            self._get_assembled_operator()
+            if slice_ranges is None:
+                return self._MA_sparse_T.dot(stacked_slices_nda_vec)
+            A_adj_M_y = np.zeros(self._MA_sparse.shape[1], dtype=self._dtype)
+            for slice_k, i_min, i_max in slice_ranges:
+                A_adj_M_y += self._MA_sparse[i_min:i_max].transpose().dot(
+                    stacked_slices_nda_vec[i_min:i_max])
+            return A_adj_M_y
+
+        if slice_ranges is None:
+            slice_ranges = self._get_operator_ranges()
+
+        # Pass stacked slice data array as itk.Image objects, one per slice
+        slices_itk = self._get_slices_itk_views(
+            stacked_slices_nda_vec, slice_ranges)
+
+        # Bring footprints up to date before they are read by the threads
+        self._get_footprint_index()
+
+        def A_adj_M_slices(linear_operators, slice_ranges):
+
+            # Allocate memory
+            A_adj_M_y = np.zeros(
+                self._reconstruction_shape, dtype=self._dtype)
+
+            for slice_k, i_min, i_max in slice_ranges:
+
+                # Get itk.Image object of current slice
+                slice_itk = slices_itk[(i_min, i_max)]
+
+                operators = self._get_separable_operators(
+                    slice_k, linear_operators)
+                if operators is not None:
+                    A_adj_M_y += self._Ak_adj_Mk_separable(
+                        self._itk2np.GetArrayViewFromImage(slice_itk),
+                        slice_k, operators)
+                    continue
+
+                # Restrict backward operation to the region affected by the
+                # slice
+                index, size = self._get_footprint_region(
+                    slice_k, linear_operators)
+
+                if size.prod() == 0:
+                    continue
+
+                footprint_itk = self._get_footprint_itk(index, size)
+
+                # Apply A_k' M_k on current slice
+                Ak_adj_Mk_slice_itk = self._Ak_adj_Mk(
+                    slice_itk, slice_k, footprint_itk, linear_operators)
+                Ak_adj_Mk_slice_nda = self._itk2np.GetArrayViewFromImage(
+                    Ak_adj_Mk_slice_itk)
+
+                # Add contribution to corresponding sub-block
+                A_adj_M_y[index[2]:index[2] + size[2],
+                          index[1]:index[1] + size[1],
+                          index[0]:index[0] + size[0]] += \
+                    Ak_adj_Mk_slice_nda
+
+            return A_adj_M_y
+
+        # Reduce contributions of all threads in place
+        results = self._run_slice_loop(A_adj_M_slices, slice_ranges)
+        A_adj_M_y = results[0]
+        for result in results[1:]:
+            A_adj_M_y += result
+
+        return self._get_x_compressed(A_adj_M_y.flatten())
+
+    ##
+    # Evaluate MA X for a block X = [x_1, ..., x_K] of K reconstructions on
+    # the same grid, e.g. the components of a multi-component reconstruction.
+    #
+    # With the assembled operator, the sparse matrix is applied to all K
+    # columns at once. Otherwise, the columns are evaluated one after another
+    # based on the same per-slice operator data.
+    # \date       2018-04-03 10:02:11+0100
+    #
+    # \param      self  The object
+    # \param      X     reconstruction data as 2D array of shape (N, K)
+    #
+    # \return     MA X as 2D array of shape (N_total_slice_voxels, K)
+    #
+    def _MA_block(self, X):
+
+        if self._use_assembled_operator:
+            return self._get_assembled_operator().dot(X)
+
+        return np.column_stack([self._MA(X[:, c]) for c in range(X.shape[1])])
+
+    ##
+    # Evaluate A^* M Y for a block Y = [y_1, ..., y_K] of K stacked slice data
+    # vectors sharing the slice geometry of the solver's stacks.
+    # \date       2018-04-03 10:03:40+0100
+    #
+    # \param      self  The object
+    # \param      Y     stacked slice data as 2D array of shape
+    #                   (N_total_slice_voxels, K)
+    #
+    # \return     A^* M Y as 2D array of shape (N, K)
+    #
+    def _A_adj_M_block(self, Y):
+
+        if self._use_assembled_operator:
+            self._get_assembled_operator()
+            return self._MA_sparse_T.dot(Y)
+
+        return np.column_stack(
+            [self._A_adj_M(Y[:, c]) for c in range(Y.shape[1])])
+
+    ##
+    # Gets the block-diagonal operators diag(MA, ..., MA) and its adjoint
+    # acting on K stacked vectors [x_1; ...; x_K], i.e. on 1D arrays as
+    # required by the minimizers. Internally, MA is applied to the (N, K)
+    # block of all components.
+    # \date       2018-04-03 10:05:27+0100
+    #
+    # \param      self          The object
+    # \param      n_components  Number of components K
+    #
+    # \return     Function calls A and A_adj mapping from and to 1D numpy
+    #             arrays
+    #
+    def _get_block_operators(self, n_components):
+        A = lambda x: self._MA_block(
+            x.reshape(n_components, -1).T).T.flatten()
+        A_adj = lambda y: self._A_adj_M_block(
+            y.reshape(n_components, -1).T).T.flatten()
+        return A, A_adj
+
+    ##
+    # Gets the list of all slices together with the index range of their
+    # voxels within the stacked slice data array.
+    # \date       2018-03-07 09:48:15+0000
+    #
+    # \param      self  The object
+    #
+    # \return     list of tuples (slice_k, i_min, i_max)
+    #
+    def _get_slice_ranges(self):
+
+        # Reuse voxel offsets as long as the slices of all stacks remain the
+        # same
+        slices = [
+            slice_k
+            for stack in self._stacks for slice_k in stack.get_slices()]
+        if self._slice_ranges is not None and \
+                len(slices) == len(self._slice_ranges) and \
+                all([slice_k is slice_range[0] for slice_k, slice_range in
+                     zip(slices, self._slice_ranges)]):
+            return self._slice_ranges
+
+        slice_ranges = []
 
         # Define index for first voxel of first slice within array
         i_min = 0
@@ -529,30 +1182,883 @@ class Solver(object):
             for j in range(0, stack.get_number_of_slices()):
 
                 # Define index for last voxel to specify current slice
-                # (exlusive)
+                # (exclusive)
                 i_max = i_min + N_slice_voxels
 
-                # Get current slice
-                slice_k = slices[j]
-
-                # Extract 1D corresponding to current slice and convert it to
-                # itk.Object
-                slice_itk = self._get_itk_image_from_array_vec(
-                    stacked_slices_nda_vec[i_min:i_max], slice_k.itk)
-
-                # Apply A_k' M_k on current slice
-                Ak_adj_Mk_slice_itk = self._Ak_adj_Mk(slice_itk, slice_k)
-                Ak_adj_Mk_slice_nda_vec = self._itk2np.GetArrayFromImage(
-                    Ak_adj_Mk_slice_itk).flatten()
-
-                # Add contribution
-                A_adj_M_y += Ak_adj_Mk_slice_nda_vec
+                slice_ranges.append((slices[j], i_min, i_max))
 
                 # Define index for first voxel to specify subsequent slice
                 # (inclusive)
                 i_min = i_max
 
-        return A_adj_M_y
+        self._slice_ranges = slice_ranges
+
+        return slice_ranges
+
+    ##
+    # Gets the list of items for the evaluation of the forward and adjoint
+    # operators together with the index range of their voxels within the
+    # stacked slice data array.
+    #
+    # Stacks whose slices still share the rigid geometry of the stack, e.g.
+    # prior to any slice-to-volume registration, are represented by a single
+    # SliceBatch so that the ITK filters are run only once on the entire
+    # stack instead of once per slice. All other slices are processed
+    # individually. The result is computed once per geometry.
+    # \date       2018-03-12 10:21:40+0000
+    #
+    # \param      self  The object
+    #
+    # \return     list of tuples (slice_k or SliceBatch, i_min, i_max)
+    #
+    def _get_operator_ranges(self):
+
+        if self._operator_ranges is not None:
+            return self._operator_ranges
+
+        slice_ranges = self._get_slice_ranges()
+        operator_ranges = []
+
+        i = 0
+        for stack in self._stacks:
+            N_slices = stack.get_number_of_slices()
+            stack_ranges = slice_ranges[i:i + N_slices]
+            i += N_slices
+
+            if N_slices > 1 and self._is_rigid_stack(stack):
+                slices = stack.get_slices()
+                nda_mask = np.concatenate([
+                    self._itk2np.GetArrayFromImage(slice_k.itk_mask)
+                    for slice_k in slices])
+                stack_itk_mask = self._itk2np.GetImageFromArray(nda_mask)
+                stack_itk_mask.SetOrigin(stack.itk.GetOrigin())
+                stack_itk_mask.SetSpacing(stack.itk.GetSpacing())
+                stack_itk_mask.SetDirection(stack.itk.GetDirection())
+
+                operator_ranges.append((
+                    SliceBatch(itk=stack.itk, itk_mask=stack_itk_mask),
+                    stack_ranges[0][1],
+                    stack_ranges[-1][2]))
+            else:
+                operator_ranges.extend(stack_ranges)
+
+        self._operator_ranges = operator_ranges
+
+        return self._operator_ranges
+
+    ##
+    # Check whether all slices of a stack are still positioned according to
+    # the stack geometry, i.e. whether the stack can be treated as one image.
+    # \date       2018-03-12 10:22:57+0000
+    #
+    # \param      stack      Stack object
+    # \param      tolerance  tolerance for comparing the image headers
+    #
+    # \return     True if all slices match the stack geometry, False otherwise
+    #
+    @staticmethod
+    def _is_rigid_stack(stack, tolerance=1e-6):
+
+        if stack.sitk is None or stack.itk is None:
+            return False
+
+        slices = stack.get_slices()
+        size = np.array(stack.sitk.GetSize())
+        if len(size) != 3 or len(slices) != size[2]:
+            return False
+
+        spacing = np.array(stack.sitk.GetSpacing())
+        direction = np.array(stack.sitk.GetDirection())
+
+        for j, slice_k in enumerate(slices):
+            if slice_k.get_slice_number() != j:
+                return False
+
+            if np.any(np.array(slice_k.sitk.GetSize()) != [
+                    size[0], size[1], 1]):
+                return False
+
+            origin = stack.sitk.TransformIndexToPhysicalPoint((0, 0, j))
+            if not np.allclose(
+                    slice_k.sitk.GetOrigin(), origin, atol=tolerance) or \
+                not np.allclose(
+                    slice_k.sitk.GetDirection(), direction, atol=tolerance) or \
+                not np.allclose(
+                    slice_k.sitk.GetSpacing(), spacing, atol=tolerance):
+                return False
+
+        return True
+
+    ##
+    # Execute a loop over all slices, either sequentially or split across
+    # n_threads threads.
+    #
+    # Slices are distributed in an interleaved manner so that all threads
+    # process a comparable amount of slices of each stack.
+    # \date       2018-03-07 09:52:31+0000
+    #
+    # \param      self          The object
+    # \param      loop_slices   function loop_slices(linear_operators,
+    #                           slice_ranges) processing the given list of
+    #                           slices
+    # \param      slice_ranges  list of tuples (slice_k, i_min, i_max) to
+    #                           process. If None, all slices are used.
+    #
+    # \return     list of return values of loop_slices, one per thread
+    #
+    def _run_slice_loop(self, loop_slices, slice_ranges=None):
+
+        if slice_ranges is None:
+            slice_ranges = self._get_slice_ranges()
+        n_threads = min(self._n_threads, len(slice_ranges))
+
+        if n_threads <= 1:
+            return [loop_slices(self._linear_operators, slice_ranges)]
+
+        linear_operators = self._get_linear_operators_threads(n_threads)
+        jobs = [(linear_operators[i], slice_ranges[i::n_threads])
+                for i in range(n_threads)]
+
+        return self._get_thread_pool(n_threads).map(
+            lambda job: loop_slices(*job), jobs)
+
+    ##
+    # Gets the thread pool used for the slice loops. It is created on first
+    # use and reused for all subsequent operator evaluations; it is only
+    # replaced if more threads are requested.
+    # \date       2018-03-07 09:53:48+0000
+    #
+    # \param      self       The object
+    # \param      n_threads  Number of threads, integer
+    #
+    # \return     ThreadPool object with at least n_threads threads
+    #
+    def _get_thread_pool(self, n_threads):
+
+        if self._thread_pool is None or self._thread_pool_size < n_threads:
+            if self._thread_pool is not None:
+                self._thread_pool.close()
+            self._thread_pool = ThreadPool(n_threads)
+            self._thread_pool_size = n_threads
+
+            # Let the threads terminate once the solver is discarded (not
+            # available for Python 2)
+            if hasattr(weakref, "finalize"):
+                weakref.finalize(self, self._thread_pool.close)
+
+        return self._thread_pool
+
+    ##
+    # Gets one LinearOperators instance per thread. ITK filters hold state
+    # and, thus, cannot be shared across threads.
+    # \date       2018-03-07 09:55:04+0000
+    #
+    # \param      self       The object
+    # \param      n_threads  Number of threads, integer
+    #
+    # \return     list of LinearOperators objects
+    #
+    def _get_linear_operators_threads(self, n_threads):
+
+        while len(self._linear_operators_threads) < n_threads:
+            linear_operators = lin_op.LinearOperators(
+                deconvolution_mode=self._deconvolution_mode,
+                predefined_covariance=self._predefined_covariance,
+                alpha_cut=self._alpha_cut,
+                image_type=self._image_type,
+            )
+            linear_operators.set_reconstruction_space(
+                self._reconstruction.itk)
+            self._linear_operators_threads.append(linear_operators)
+
+        return self._linear_operators_threads[0:n_threads]
+
+    ##
+    # Gets the cache entry holding the data derived from the current position
+    # of a slice.
+    #
+    # Each entry records the geometry version of the slice it was computed
+    # for. Once the slice has been moved or its images have been changed, its
+    # entry is replaced. Hence, only the data of moved slices gets recomputed
+    # in subsequent runs.
+    # \date       2018-03-22 09:31:14+0000
+    #
+    # \param      self     The object
+    # \param      slice_k  Slice object
+    #
+    # \return     cache entry as dictionary
+    #
+    def _get_slice_cache(self, slice_k):
+
+        version = slice_k.get_geometry_version()
+
+        cache = self._slice_caches.get(slice_k)
+        if cache is None or cache["version"] != version:
+            cache = {"version": version}
+            self._slice_caches[slice_k] = cache
+
+        return cache
+
+    def _clear_slice_caches(self):
+        self._slice_caches = {}
+        self._linear_operators.clear_covariance_cache()
+        for linear_operators in self._linear_operators_threads:
+            linear_operators.clear_covariance_cache()
+
+    ##
+    # Gets the footprint index of all slices. It is updated on first access
+    # after the slice or reconstruction geometries may have changed, i.e.
+    # after the operator caches have been cleared.
+    # \date       2018-03-22 09:38:12+0000
+    #
+    # \param      self  The object
+    #
+    # \return     SliceFootprintIndex object
+    #
+    def _get_footprint_index(self):
+        if not self._footprint_index_updated:
+            self._footprint_index.update()
+            self._footprint_index_updated = True
+        return self._footprint_index
+
+    ##
+    # Gets the region of the reconstruction space affected by a slice as
+    # given by the footprint index.
+    # \date       2018-03-22 09:40:51+0000
+    #
+    # \param      self              The object
+    # \param      slice_k           Slice object (or SliceBatch)
+    # \param      linear_operators  LinearOperators object
+    #
+    # \return     Start index and size of region as integer numpy arrays in
+    #             itk.Image index order (i, j, k)
+    #
+    def _get_footprint_region(self, slice_k, linear_operators):
+
+        # Batches are rebuilt in every run and hence not cached
+        if isinstance(slice_k, SliceBatch):
+            return linear_operators.get_footprint_region(
+                self._reconstruction.itk, slice_k.itk, slice_k)
+
+        return self._get_footprint_index().get_footprint_region(slice_k)
+
+    ##
+    # Gets the sub-region of the reconstruction space as (zero) itk.Image
+    # object to be used as output space of the backward operation.
+    # \date       2018-03-06 14:40:12+0000
+    #
+    # \param      self   The object
+    # \param      index  Start index of region in (i, j, k), numpy array
+    # \param      size   Size of region in (i, j, k), numpy array
+    #
+    # \return     Image of region as itk.Image object
+    #
+    def _get_footprint_itk(self, index, size):
+
+        reconstruction_itk = self._reconstruction.itk
+
+        spacing = np.array(reconstruction_itk.GetSpacing())
+        origin = np.array(reconstruction_itk.GetOrigin())
+        direction = np.array(sitkh.get_sitk_from_itk_direction(
+            reconstruction_itk.GetDirection())).reshape(3, 3)
+
+        footprint_itk = self._itk2np.GetImageFromArray(
+            np.zeros(size[::-1], dtype=self._dtype))
+        footprint_itk.SetOrigin(
+            tuple(origin + direction.dot(index * spacing)))
+        footprint_itk.SetSpacing(reconstruction_itk.GetSpacing())
+        footprint_itk.SetDirection(reconstruction_itk.GetDirection())
+
+        return footprint_itk
+
+    ##
+    # Gets the assembled sparse matrix representation of MA, i.e.
+    # \f$ \begin{pmatrix} M_1 A_1 \\ M_2 A_2 \\ \vdots \\ M_K A_K
+    # \end{pmatrix} \f$, for the current slice and reconstruction geometries.
+    # The matrix is computed only once and reused until the cache is cleared.
+    # The rows M_k A_k of slices which did not move since the previous
+    # assembly are reused.
+    # \date       2018-03-05 10:13:08+0000
+    #
+    # \param      self  The object
+    #
+    # \return     MA as scipy.sparse.csr_matrix of shape
+    #             (N_total_slice_voxels, N_voxels_recon)
+    #
+    def _get_assembled_operator(self):
+
+        if self._MA_sparse is not None:
+            return self._MA_sparse
+
+        if self._verbose:
+            ph.print_info("Assemble sparse matrix representation of MA ... ",
+                          newline=False)
+            time_start = ph.start_timing()
+
+        MA_k = []
+        N_updated = 0
+        for slice_k, i_min, i_max in self._get_slice_ranges():
+            if self._use_masks:
+                slice_itk_mask = slice_k.itk_mask
+            else:
+                slice_itk_mask = None
+
+            # Rows are only valid for the mask they were computed with
+            cache = self._get_slice_cache(slice_k)
+            if "MA_sparse" not in cache or \
+                    cache["MA_sparse"][0] is not slice_itk_mask:
+                cache["MA_sparse"] = (
+                    slice_itk_mask,
+                    self._linear_operators.get_A_sparse(
+                        self._reconstruction.itk, slice_k.itk, slice_itk_mask,
+                        slice_k=slice_k))
+                N_updated += 1
+            MA_k.append(cache["MA_sparse"][1])
+
+        self._MA_sparse = scipy.sparse.vstack(
+            MA_k, format="csr", dtype=self._dtype)
+        if self._use_mask_compression:
+            self._MA_sparse = self._MA_sparse[:, self._get_x_indices()]
+        self._MA_sparse_T = self._MA_sparse.transpose().tocsr()
+
+        if self._verbose:
+            print("done (%d of %d slice blocks updated, %d non-zero "
+                  "elements, %s)" % (
+                      N_updated, len(MA_k), self._MA_sparse.nnz,
+                      ph.stop_timing(time_start)))
+
+        return self._MA_sparse
+
+    def _clear_assembled_operator(self):
+        self._MA_sparse = None
+        self._MA_sparse_T = None
+
+    ##
+    # Solve the linear least-squares problem min_x ||Ax - b|| by lsmr
+    # warm-started from x0, i.e. lsmr is run for the correction dx with
+    # A dx = b - A x0 and the result x0 + dx is projected onto x >= 0.
+    # \date       2018-03-16 09:25:48+0000
+    #
+    # \param      A         Function call of forward operator
+    # \param      A_adj     Function call of adjoint operator
+    # \param      b         right-hand side as 1D array
+    # \param      x0        initial value as 1D array
+    # \param      iter_max  Maximum number of lsmr iterations
+    # \param      verbose   Show lsmr output, bool
+    #
+    # \return     x as 1D array and the number of performed iterations
+    #
+    @staticmethod
+    def _run_lsmr_from_x0(A, A_adj, b, x0, iter_max, verbose=False):
+        A_op = scipy.sparse.linalg.LinearOperator(
+            shape=(b.size, x0.size), matvec=A, rmatvec=A_adj)
+        dx, istop, n = scipy.sparse.linalg.lsmr(
+            A_op, b - A(x0), maxiter=iter_max, show=verbose,
+            atol=0, btol=0)[0:3]
+        return np.clip(x0 + dx, 0, np.inf), n
+
+    ##
+    # Run the iterations of a solver at once and check the convergence
+    # criteria while iterating.
+    #
+    # Solvers call the given callback after each iteration. Every iter_step
+    # iterations and after the last one, the convergence history is updated
+    # and the iterations are stopped once any of the criteria is met. As the
+    # solver is never restarted, its state (e.g. Krylov basis or dual
+    # variables) is kept. NSoL solvers iterating themselves are monitored via
+    # run_nsol_solver. Solvers stopping before n_max iterations (e.g. lsmr
+    # once it found an exact solution) call callback(n, x, final=True), which
+    # records the result. Without any tolerance, no history is recorded.
+    # \date       2018-03-16 09:11:47+0000
+    #
+    # \param      self      The object
+    # \param      run_step  function run_step(x0, n_max, callback) running the
+    #                       solver for at most n_max iterations from x0 and
+    #                       returning the obtained x and the computational
+    #                       time. If not None, callback(n, x) is to be called
+    #                       after the n-th iteration and the iterations are to
+    #                       be stopped once it returns True
+    # \param      x0        initial value as 1D array
+    # \param      n_max     Maximum number of iterations
+    # \param      b         right-hand side My the convergence criteria
+    #                       refer to. If None, the one of the solver's stacks
+    #                       is used
+    # \param      n_components  Number of components K stacked in x, i.e. x
+    #                           and b refer to the block-diagonal problem of
+    #                           K components
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_steps(self, run_step, x0, n_max, b=None, n_components=1):
+
+        if not self._use_convergence_criteria():
+            return run_step(x0, n_max, None)
+
+        if b is None:
+            b = self.get_b()
+
+        # Estimate at the previous check (list to allow for the assignment
+        # within the callback)
+        x_prev = [x0]
+
+        def callback(n, x, final=False):
+            if not final and n % self._iter_step != 0 and n < n_max:
+                return False
+
+            converged = self._update_convergence_history(
+                n, x, x_prev[0], b, n_components=n_components)
+            x_prev[0] = np.array(x)
+
+            if converged and self._verbose:
+                ph.print_info(
+                    "Convergence criterion met after %d iterations" % n)
+
+            return converged
+
+        x, computational_time = run_step(x0, n_max, callback)
+
+        # Solver without any callback evaluation
+        if len(self._convergence_history["iterations"]) == 0:
+            self._update_convergence_history(
+                n_max, x, x0, b, n_components=n_components)
+
+        return x, computational_time
+
+    def _use_convergence_criteria(self):
+        return any([
+            tol is not None for tol in
+            [self._rtol_residual, self._rtol_x, self._rtol_data_fit]])
+
+    ##
+    # Run an NSoL solver. Given a convergence callback, the solver is
+    # monitored by a ConvergenceObserver, i.e. the callback is evaluated after
+    # each iteration and the solver is stopped once it returns True.
+    # \date       2018-03-16 09:12:30+0000
+    #
+    # \param      self      The object
+    # \param      solver    NSoL solver object
+    # \param      callback  function callback(n, x) or None
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_nsol_solver(self, solver, callback=None):
+
+        if callback is None:
+            solver.run()
+            return solver.get_x(), solver.get_computational_time()
+
+        time_start = ph.start_timing()
+
+        observer = ConvergenceObserver(callback)
+        solver.set_observer(observer)
+        try:
+            solver.run()
+            x = solver.get_x()
+        except ConvergenceReached:
+            x = observer.get_x()
+
+        return x, ph.stop_timing(time_start)
+
+    def _reset_convergence_history(self):
+        self._convergence_history = {
+            "iterations": [],
+            "residual": [],
+            "data_fit": [],
+            "regularizer": [],
+            "x_change": [],
+        }
+
+    ##
+    # Record residual, data fit, regularizer and change of x and check
+    # whether any of the convergence criteria is met.
+    # \date       2018-03-16 09:14:20+0000
+    #
+    # \param      self    The object
+    # \param      n       Number of iterations performed so far
+    # \param      x       current x as 1D array
+    # \param      x_prev  previous x as 1D array
+    # \param      b       My as 1D array
+    # \param      n_components  Number of components K stacked in x and b
+    #
+    # \return     True if any convergence criterion is met
+    #
+    def _update_convergence_history(self, n, x, x_prev, b, n_components=1):
+
+        if n_components == 1:
+            MA_x = self._MA(x)
+            regularizer = self._get_regularizer_value(x)
+        else:
+            A = self._get_block_operators(n_components)[0]
+            MA_x = A(x)
+            regularizer = [self._get_regularizer_value(x_c)
+                           for x_c in x.reshape(n_components, -1)]
+            regularizer = None if regularizer[0] is None else sum(regularizer)
+
+        residual_ell2 = np.linalg.norm(MA_x - b)
+        norm_b = np.linalg.norm(b)
+        norm_x_prev = np.linalg.norm(x_prev)
+
+        residual = residual_ell2 / norm_b if norm_b > 0 else residual_ell2
+        data_fit = 0.5 * residual_ell2**2
+        x_change = np.linalg.norm(x - x_prev)
+        if norm_x_prev > 0:
+            x_change /= norm_x_prev
+
+        history = self._convergence_history
+        data_fit_prev = history["data_fit"][-1] \
+            if len(history["data_fit"]) > 0 else None
+
+        history["iterations"].append(n)
+        history["residual"].append(residual)
+        history["data_fit"].append(data_fit)
+        history["regularizer"].append(regularizer)
+        history["x_change"].append(x_change)
+
+        if self._verbose:
+            ph.print_info(
+                "Iteration %d: residual = %.3e, data fit = %.3e, "
+                "relative change of x = %.3e" % (
+                    n, residual, data_fit, x_change))
+
+        if self._rtol_residual is not None and \
+                residual <= self._rtol_residual:
+            return True
+
+        if self._rtol_x is not None and x_change <= self._rtol_x:
+            return True
+
+        if self._rtol_data_fit is not None and data_fit_prev is not None \
+                and data_fit_prev > 0 and \
+                abs(data_fit_prev - data_fit) / data_fit_prev <= \
+                self._rtol_data_fit:
+            return True
+
+        return False
+
+    ##
+    # Gets the value of the regularization term for the given x. To be
+    # implemented by the solvers.
+    # \date       2018-03-16 09:15:52+0000
+    #
+    # \param      self  The object
+    # \param      x     x as 1D array
+    #
+    # \return     value of the regularizer (without alpha) or None
+    #
+    def _get_regularizer_value(self, x):
+        return None
+
+    ##
+    # Gets the (isotropic) total variation of x, or its Huber-smoothed
+    # version, based on the gradient operator.
+    # \date       2018-03-16 09:33:05+0000
+    #
+    # \param      self         The object
+    # \param      x            x as 1D array
+    # \param      huber_gamma  Huber parameter. If None, plain TV is computed
+    #
+    # \return     TV value, scalar
+    #
+    def _get_total_variation(self, x, huber_gamma=None):
+
+        B = self._get_gradient_operators()[0]
+        dimension = len(self._reconstruction_shape)
+        norms = np.sqrt(np.sum(B(x).reshape(dimension, -1)**2, axis=0))
+
+        if huber_gamma is None:
+            return np.sum(norms)
+
+        return np.sum(np.where(
+            norms <= huber_gamma,
+            norms**2 / (2. * huber_gamma),
+            norms - huber_gamma / 2.))
+
+    ##
+    # Gets the diagonal of the normal operator (MA)^T MA, e.g. to define a
+    # Jacobi preconditioner.
+    #
+    # The diagonal is exact, i.e. the squared column norms of MA, in case the
+    # assembled operator is used. Otherwise, it is obtained by probing the
+    # normal operator with the all-ones vector. As all entries of MA are
+    # non-negative, this yields the row sums of (MA)^T MA, i.e. an upper bound
+    # of the diagonal which is commonly used for SIRT-type scalings. It is
+    # computed once per geometry.
+    # \date       2018-03-15 09:21:44+0000
+    #
+    # \param      self  The object
+    #
+    # \return     Diagonal as 1D numpy array in the space of the unknowns x
+    #
+    def _get_MA_diagonal(self):
+
+        if self._MA_diagonal is not None:
+            return self._MA_diagonal
+
+        if self._use_assembled_operator:
+            MA = self._get_assembled_operator()
+            MA_diagonal = np.asarray(MA.multiply(MA).sum(axis=0)).ravel()
+        else:
+            ones = np.ones_like(self.get_x0())
+            MA_diagonal = self._A_adj_M(self._MA(ones))
+
+        self._MA_diagonal = MA_diagonal.astype(self._dtype, copy=False)
+
+        return self._MA_diagonal
+
+    ##
+    # Estimate the squared operator norm of K, i.e. the largest eigenvalue of
+    # K^* K, by power iteration using the Rayleigh quotient.
+    # \date       2018-03-23 09:35:50+0000
+    #
+    # \param      K         Function call K(x) for 1D arrays x
+    # \param      K_adj     Function call of the adjoint operator of K
+    # \param      N         Length of x
+    # \param      iter_max  Maximum number of iterations
+    # \param      rtol      Relative tolerance of the estimate between two
+    #                       subsequent iterations
+    # \param      seed      Seed for the random initial vector
+    #
+    # \return     Estimated squared operator norm as scalar
+    #
+    @staticmethod
+    def _get_norm_squared_estimate(K, K_adj, N,
+                                   iter_max=50, rtol=1e-4, seed=0):
+
+        x = np.random.RandomState(seed).rand(N) - 0.5
+        x /= np.linalg.norm(x)
+
+        norm_squared = 0.
+        for i in range(0, iter_max):
+            K_adj_K_x = K_adj(K(x))
+
+            # Rayleigh quotient <x, K^*K x> for normalized x
+            norm_squared_prev = norm_squared
+            norm_squared = float(np.sum(x * K_adj_K_x))
+
+            norm = np.linalg.norm(K_adj_K_x)
+            if norm == 0:
+                break
+            x = K_adj_K_x / norm
+
+            if abs(norm_squared - norm_squared_prev) <= rtol * norm_squared:
+                break
+
+        return norm_squared
+
+    ##
+    # Clear all data derived from the current slice and reconstruction
+    # geometries as a whole, i.e. the assembled operator and the persistent
+    # buffers. Per-slice data (assembled operator rows, footprints) and the
+    # PSF covariances are tagged with the slice geometry version and remain
+    # valid for slices which did not move; the footprint index is marked for
+    # update.
+    # \date       2018-03-09 09:12:44+0000
+    #
+    # \param      self  The object
+    #
+    def _clear_operator_caches(self):
+        self._clear_assembled_operator()
+        self._x_buffer = None
+        self._x_itk_view = None
+        self._slices_buffer = None
+        self._slices_itk_views = None
+        self._operator_ranges = None
+        self._x_indices = None
+        self._gradient_operators = None
+        self._MA_diagonal = None
+        self._MA_norm_squared = None
+        self._footprint_index_updated = False
+
+    ##
+    # Gets the itk.Image object holding the given reconstruction data array.
+    #
+    # The image is a view on a persistent buffer which is allocated only once.
+    # Each call copies the data into that buffer and marks the image as
+    # modified so that the ITK filters get re-executed.
+    # \date       2018-03-09 09:13:31+0000
+    #
+    # \param      self     The object
+    # \param      nda_vec  reconstruction data as 1D array
+    #
+    # \return     reconstruction as itk.Image object
+    #
+    def _get_x_itk_view(self, nda_vec):
+
+        if self._x_itk_view is None:
+            self._x_buffer = np.zeros(
+                self._reconstruction_shape, dtype=self._dtype)
+            self._x_itk_view = self._itk2np.GetImageViewFromArray(
+                self._x_buffer)
+
+        if self._use_mask_compression:
+            # Voxels outside the compressed region remain zero
+            self._x_buffer.flat[self._get_x_indices()] = nda_vec
+        else:
+            np.copyto(self._x_buffer,
+                      nda_vec.reshape(self._reconstruction_shape),
+                      casting="unsafe")
+        self._update_itk_view(self._x_itk_view, self._reconstruction.itk)
+
+        return self._x_itk_view
+
+    ##
+    # Gets itk.Image objects for all slices (or batches of slices) holding
+    # the respective parts of the given stacked slice data array.
+    #
+    # The images are views on a persistent buffer of the size of the stacked
+    # slice data array which is allocated only once.
+    # \date       2018-03-09 09:15:02+0000
+    #
+    # \param      self          The object
+    # \param      nda_vec       stacked slice data as 1D array
+    # \param      slice_ranges  list of tuples (slice_k, i_min, i_max) for
+    #                           which views are required
+    #
+    # \return     dictionary mapping the index range (i_min, i_max) of each
+    #             slice within the stacked array to its itk.Image object
+    #
+    def _get_slices_itk_views(self, nda_vec, slice_ranges):
+
+        if self._slices_itk_views is None:
+            self._slices_buffer = np.zeros(
+                self._N_total_slice_voxels, dtype=self._dtype)
+            self._slices_itk_views = {}
+
+        np.copyto(self._slices_buffer, nda_vec, casting="unsafe")
+        for slice_k, i_min, i_max in slice_ranges:
+            key = (i_min, i_max)
+            if key not in self._slices_itk_views:
+                shape = np.array(
+                    slice_k.itk.GetLargestPossibleRegion().GetSize())[::-1]
+                self._slices_itk_views[key] = \
+                    self._itk2np.GetImageViewFromArray(
+                        self._slices_buffer[i_min:i_max].reshape(shape))
+            self._update_itk_view(self._slices_itk_views[key], slice_k.itk)
+
+        return self._slices_itk_views
+
+    ##
+    # Update image header of itk.Image view according to reference image and
+    # flag its (externally changed) data as modified.
+    # \date       2018-03-09 09:16:20+0000
+    #
+    # \param      image_itk      Image as itk.Image object
+    # \param      image_itk_ref  The image itk reference
+    #
+    @staticmethod
+    def _update_itk_view(image_itk, image_itk_ref):
+        image_itk.SetOrigin(image_itk_ref.GetOrigin())
+        image_itk.SetSpacing(image_itk_ref.GetSpacing())
+        image_itk.SetDirection(image_itk_ref.GetDirection())
+        image_itk.Modified()
+
+    ##
+    # Gets the flat indices of the reconstruction voxels forming the unknown
+    # vector x in case of mask compression.
+    #
+    # The reconstruction mask is dilated by the largest PSF cut-off distance
+    # of all slices so that the blurring at the mask boundary is still
+    # captured by the unknowns.
+    # \date       2018-03-13 09:55:41+0000
+    #
+    # \param      self  The object
+    #
+    # \return     Sorted flat indices as 1D numpy array
+    #
+    def _get_x_indices(self):
+
+        if self._x_indices is not None:
+            return self._x_indices
+
+        halo = np.zeros(3)
+        for slice_k, i_min, i_max in self._get_slice_ranges():
+            halo = np.maximum(halo, self._linear_operators.get_psf_halo(
+                self._reconstruction.itk, slice_k.itk, slice_k))
+
+        # Dilate mask by box of halo radius (separable; numpy index order)
+        radius = np.ceil(halo).astype(int)[::-1] + 1
+        nda_mask = sitk.GetArrayFromImage(
+            self._reconstruction.sitk_mask).astype(bool)
+        for axis in range(0, nda_mask.ndim):
+            shape = np.ones(nda_mask.ndim, dtype=int)
+            shape[axis] = 2 * radius[axis] + 1
+            nda_mask = scipy.ndimage.binary_dilation(
+                nda_mask, structure=np.ones(shape, dtype=bool))
+
+        self._x_indices = np.flatnonzero(nda_mask)
+
+        if self._verbose:
+            ph.print_info(
+                "Mask compression: %d of %d reconstruction voxels are "
+                "unknowns" % (self._x_indices.size, self._N_voxels_recon))
+
+        return self._x_indices
+
+    ##
+    # Gets the reconstruction data array on the full reconstruction grid from
+    # the (possibly compressed) unknown vector x.
+    # \date       2018-03-13 09:58:02+0000
+    #
+    # \param      self   The object
+    # \param      x_vec  unknown vector x as 1D array
+    #
+    # \return     reconstruction data as 1D array
+    #
+    def _get_x_full(self, x_vec):
+
+        if not self._use_mask_compression:
+            return x_vec
+
+        x_full = np.zeros(self._N_voxels_recon, dtype=self._dtype)
+        x_full[self._get_x_indices()] = x_vec
+
+        return x_full
+
+    ##
+    # Gets the (possibly compressed) unknown vector x from the reconstruction
+    # data array on the full reconstruction grid.
+    # \date       2018-03-13 09:58:49+0000
+    #
+    # \param      self        The object
+    # \param      x_full_vec  reconstruction data as 1D array
+    #
+    # \return     unknown vector x as 1D array
+    #
+    def _get_x_compressed(self, x_full_vec):
+
+        if not self._use_mask_compression:
+            return x_full_vec
+
+        return x_full_vec[self._get_x_indices()]
+
+    ##
+    # Gets the gradient operator and its adjoint acting on the (possibly
+    # compressed) unknown vector x.
+    #
+    # The gradient is evaluated on the full reconstruction grid as required
+    # by the regularizers. The operators are created once per geometry and
+    # work on preallocated buffers.
+    # \date       2018-03-13 10:02:15+0000
+    #
+    # \param      self  The object
+    #
+    # \return     Function calls B and B_adj mapping from and to 1D arrays
+    #
+    def _get_gradient_operators(self):
+
+        if self._gradient_operators is None:
+            if self._use_mask_compression:
+                indices = self._get_x_indices()
+            else:
+                indices = None
+
+            self._gradient_operators = grad_op.GradientOperators(
+                shape=self._reconstruction_shape,
+                spacing=self._reconstruction.sitk.GetSpacing(),
+                dtype=self._dtype,
+                indices=indices)
+
+        return self._gradient_operators.get_gradient_operators()
 
     #
     # Convert numpy data array (vector format) back to itk.Image object
@@ -570,7 +2076,8 @@ class Solver(object):
         shape_nda = np.array(
             image_itk_ref.GetLargestPossibleRegion().GetSize())[::-1]
 
-        image_itk = self._itk2np.GetImageFromArray(nda_vec.reshape(shape_nda))
+        image_itk = self._itk2np.GetImageFromArray(
+            nda_vec.reshape(shape_nda).astype(self._dtype, copy=False))
         image_itk.SetOrigin(image_itk_ref.GetOrigin())
         image_itk.SetSpacing(image_itk_ref.GetSpacing())
         image_itk.SetDirection(image_itk_ref.GetDirection())
@@ -10,13 +10,18 @@
 # Import libraries
 import SimpleITK as sitk
 import numpy as np
+import scipy.optimize
 
-import nsol.linear_operators as linop
 import nsol.tikhonov_linear_solver as tk
 import pysitk.python_helper as ph
 import pysitk.simple_itk_helper as sitkh
+from nsol.definitions import EPS
+from nsol.loss_functions import LossFunctions as lf
 # Import modules
+import niftymic.base.precision as prec
+import niftymic.base.stack as st
 from niftymic.reconstruction.solver import Solver
+from niftymic.reconstruction.solver import ConvergenceReached
 
 
 # This class implements the framework to iteratively solve
@@ -87,6 +92,32 @@ class TikhonovSolver(Solver):
     # \param         huber_gamma            The huber gamma
     # \param         predefined_covariance  The predefined covariance
     # \param         verbose                The verbose
+    # \param         use_masks              Use masks in the data fidelity
+    #                                       term
+    # \param         use_assembled_operator Evaluate MA and its adjoint via
+    #                                       a once assembled sparse matrix
+    #                                       instead of the ITK filters
+    # \param         n_threads              Number of threads for slice-wise
+    #                                       operator evaluations
+    # \param         use_mask_compression   Restrict the unknowns to the
+    #                                       voxels within the dilated
+    #                                       reconstruction mask
+    # \param         resolution_levels      List of downsampling factors of
+    #                                       the reconstruction grid, e.g.
+    #                                       [4, 2, 1], solved consecutively
+    #                                       (coarse-to-fine). The upsampled
+    #                                       result of each level serves as
+    #                                       initial value for the next one.
+    #                                       If None, only the reconstruction
+    #                                       grid itself is used.
+    # \param         iter_max_coarse        Number of maximum iterations for
+    #                                       each coarse resolution level. If
+    #                                       None, iter_max is split evenly
+    #                                       across all resolution levels.
+    # \param         use_preconditioning    Solve for the diagonally
+    #                                       (Jacobi) preconditioned variable
+    #                                       z = D^(1/2) x with D =
+    #                                       diag((MA)^T MA + alpha G^T G)
     #
     def __init__(self,
                  stacks,
@@ -104,6 +135,12 @@ class TikhonovSolver(Solver):
                  predefined_covariance=None,
                  verbose=1,
                  use_masks=True,
+                 use_assembled_operator=False,
+                 n_threads=1,
+                 use_mask_compression=False,
+                 resolution_levels=None,
+                 iter_max_coarse=None,
+                 use_preconditioning=False,
                  ):
 
         # Run constructor of superclass
@@ -122,11 +159,21 @@ class TikhonovSolver(Solver):
                         predefined_covariance=predefined_covariance,
                         verbose=verbose,
                         use_masks=use_masks,
+                        use_assembled_operator=use_assembled_operator,
+                        n_threads=n_threads,
+                        use_mask_compression=use_mask_compression,
                         )
 
         # Settings for optimizer
         self._reg_type = reg_type
 
+        self._resolution_levels = resolution_levels
+        self._iter_max_coarse = iter_max_coarse
+        self._use_preconditioning = use_preconditioning
+
+        # Reconstructions obtained by the last joint multi-component solve
+        self._component_reconstructions = None
+
     #
     # Set type of regularization. It can be either 'TK0' or 'TK1'
     # \date       2017-07-25 15:19:17+0100
@@ -144,6 +191,50 @@ class TikhonovSolver(Solver):
     def get_regularization_type(self):
         return self._reg_type
 
+    ##
+    # Sets the resolution levels for a coarse-to-fine reconstruction.
+    # \date       2018-03-14 09:12:31+0000
+    #
+    # \param      self               The object
+    # \param      resolution_levels  List of downsampling factors (>= 1) of
+    #                                the reconstruction grid, e.g. [4, 2, 1].
+    #                                None is equivalent to [1].
+    #
+    def set_resolution_levels(self, resolution_levels):
+        self._resolution_levels = resolution_levels
+
+    def get_resolution_levels(self):
+        return self._resolution_levels
+
+    ##
+    # Sets the number of maximum iterations for each coarse resolution level.
+    # \date       2018-03-14 09:12:58+0000
+    #
+    # \param      self             The object
+    # \param      iter_max_coarse  Number of maximum iterations, integer. If
+    #                              None, iter_max is split evenly across all
+    #                              resolution levels.
+    #
+    def set_iter_max_coarse(self, iter_max_coarse):
+        self._iter_max_coarse = iter_max_coarse
+
+    def get_iter_max_coarse(self):
+        return self._iter_max_coarse
+
+    ##
+    # Sets whether the least-squares problem is solved using a diagonal
+    # (Jacobi) preconditioner.
+    # \date       2018-03-15 09:25:10+0000
+    #
+    # \param      self                 The object
+    # \param      use_preconditioning  boolean
+    #
+    def set_use_preconditioning(self, use_preconditioning):
+        self._use_preconditioning = use_preconditioning
+
+    def get_use_preconditioning(self):
+        return self._use_preconditioning
+
     ##
     #       Gets the setting specific filename indicating the information
     #             used for the reconstruction step
@@ -175,16 +266,39 @@ class TikhonovSolver(Solver):
 
         return filename
 
-    def get_solver(self):
+    ##
+    # Gets the NSoL solver for the Tikhonov-regularized problem
+    # \date       2018-03-16 09:21:30+0000
+    #
+    # \param      self      The object
+    # \param      x0        initial value as 1D array. If None, the current
+    #                       reconstruction is used.
+    # \param      iter_max  Number of maximum iterations. If None, the
+    #                       chosen iter_max is used.
+    # \param      b         right-hand side My as 1D array. If None, the
+    #                       masked slice data of the solver's stacks is used.
+    # \param      n_components  Number of components K. For K > 1, x0 and b
+    #                           stack the K components and the solver acts
+    #                           on the block-diagonal problem of all
+    #                           components (see run_components).
+    #
+    # \return     tk.TikhonovLinearSolver object
+    #
+    def get_solver(self, x0=None, iter_max=None, b=None, n_components=1):
         if self._reg_type not in ["TK0", "TK1"]:
             raise ValueError(
                 "Error: regularization type can only be either 'TK0' or 'TK1'")
 
+        if x0 is None:
+            x0 = self.get_x0()
+        if iter_max is None:
+            iter_max = self._iter_max
+
         # Get operators
         A = self.get_A()
         A_adj = self.get_A_adj()
-        b = self.get_b()
-        x0 = self.get_x0()
+        if b is None:
+            b = self.get_b()
         x_scale = self.get_x_scale()
 
         if self._reg_type == "TK0":
@@ -192,15 +306,26 @@ class TikhonovSolver(Solver):
             B_adj = lambda x: x.flatten()
 
         elif self._reg_type == "TK1":
-            spacing = np.array(self._reconstruction.sitk.GetSpacing())
-            linear_operators = linop.LinearOperators3D(spacing=spacing)
-            grad, grad_adj = linear_operators.get_gradient_operators()
-
-            X_shape = self._reconstruction_shape
-            Z_shape = grad(x0.reshape(*X_shape)).shape
-
-            B = lambda x: grad(x.reshape(*X_shape)).flatten()
-            B_adj = lambda x: grad_adj(x.reshape(*Z_shape)).flatten()
+            B, B_adj = self._get_gradient_operators()
+
+        # Block-diagonal operators acting on the stacked components
+        if n_components > 1:
+            A, A_adj = self._get_block_operators(n_components)
+            B = self._get_block_diagonal_operator(B, n_components)
+            B_adj = self._get_block_diagonal_operator(B_adj, n_components)
+
+        # Change of variables x = S z with Jacobi scaling S = D^(-1/2), i.e.
+        # right-preconditioning of the least-squares problem
+        if self._use_preconditioning:
+            S = self._get_preconditioner_scaling(n_components)
+            A = self._get_scaled_operator(A, S)
+            A_adj = self._get_scaled_adjoint_operator(A_adj, S)
+            B = self._get_scaled_operator(B, S)
+            B_adj = self._get_scaled_adjoint_operator(B_adj, S)
+            x0 = x0 / S
+            x_scale = np.max(np.abs(x0))
+            if x_scale == 0:
+                x_scale = 1
 
         # Set up solver
         solver = tk.TikhonovLinearSolver(
@@ -216,7 +341,7 @@ class TikhonovSolver(Solver):
             data_loss_scale=self._data_loss_scale,
             verbose=self._verbose,
             minimizer=self._minimizer,
-            iter_max=self._iter_max,
+            iter_max=iter_max,
             bounds=(0, np.inf),
         )
         return solver
@@ -234,23 +359,471 @@ class TikhonovSolver(Solver):
     #
     def _run(self):
 
-        solver = self.get_solver()
+        if self._resolution_levels is None:
+            resolution_levels = [1]
+        else:
+            resolution_levels = self._resolution_levels
+
+        if any([factor < 1 for factor in resolution_levels]):
+            raise ValueError("Resolution levels must be at least 1")
+
+        # Iteration budgets of the coarse levels and the reconstruction grid
+        N_coarse = len([factor for factor in resolution_levels if factor != 1])
+        if self._iter_max_coarse is None:
+            iter_max_coarse = max(1, self._iter_max // len(resolution_levels))
+            iter_max = max(1, self._iter_max - N_coarse * iter_max_coarse)
+        else:
+            iter_max_coarse = self._iter_max_coarse
+            iter_max = self._iter_max
+
+        self._computational_time = ph.get_zero_time()
 
-        self._print_info_text()
+        for factor in resolution_levels:
+            if factor == 1:
+                self._run_level(iter_max)
+            else:
+                self._run_coarse_level(factor, iter_max_coarse)
+
+    ##
+    # Run the reconstruction on the current reconstruction grid
+    # \date       2018-03-14 09:14:02+0000
+    #
+    # \param      self      The object
+    # \param      iter_max  Number of maximum iterations
+    #
+    def _run_level(self, iter_max):
+
+        self._print_info_text(iter_max)
 
         # Run reconstruction
-        solver.run()
+        x, computational_time = self._run_steps(
+            self._run_step, self.get_x0(), iter_max)
 
         # Get computational time
-        self._computational_time = solver.get_computational_time()
+        self._computational_time += computational_time
 
         # After reconstruction: Update member attribute
         self._reconstruction.itk = self._get_itk_image_from_array_vec(
-            solver.get_x(), self._reconstruction.itk)
-        self._reconstruction.sitk = sitkh.get_sitk_from_itk_image(
-            self._reconstruction.itk)
+            self._get_x_full(x), self._reconstruction.itk)
+        self._reconstruction.sitk = prec.get_sitk_from_itk_image(
+            self._reconstruction.itk, self._precision)
+
+    ##
+    # Run the Tikhonov solver for a given number of iterations.
+    #
+    # The problem set up by the NSoL solver is solved here for the lsmr
+    # minimizer, which is warm-started from x0, and, given a callback, for
+    # minimizers of scipy.optimize.minimize (e.g. 'L-BFGS-B') so that the
+    # convergence criteria can stop the iterations: lsmr evaluates the
+    # callback every iter_step iterations, the minimizers of
+    # scipy.optimize.minimize after each iteration.
+    # Otherwise, the NSoL solver is run, i.e. 'lsq_linear' and
+    # 'least_squares' always use the full number of iterations.
+    # \date       2018-03-16 09:24:05+0000
+    #
+    # \param      self      The object
+    # \param      x0        initial value as 1D array
+    # \param      iter_max  Number of maximum iterations
+    # \param      callback  function callback(n, x) called after the n-th
+    #                       iteration; the iterations are stopped once it
+    #                       returns True. None to perform all iterations
+    # \param      b         right-hand side My as 1D array. If None, the
+    #                       masked slice data of the solver's stacks is used.
+    # \param      n_components  Number of components K stacked in x0 and b
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_step(self, x0, iter_max, callback=None, b=None, n_components=1):
+
+        solver = self.get_solver(
+            x0=x0, iter_max=iter_max, b=b, n_components=n_components)
+
+        S = None
+        if self._use_preconditioning:
+            S = self._get_preconditioner_scaling(n_components)
+
+            # Callback refers to x = S z
+            if callback is not None:
+                callback_x = callback
+                callback = lambda n, z, final=False: callback_x(
+                    n, S * z, final=final)
+
+        if self._minimizer == "lsmr" and self._data_loss == "linear":
+            x, computational_time = self._run_lsmr(solver, iter_max, callback)
+
+        elif callback is None or \
+                self._minimizer in ["lsq_linear", "least_squares"]:
+            solver.run()
+            x = solver.get_x()
+            computational_time = solver.get_computational_time()
+
+        else:
+            x, computational_time = self._run_minimize(
+                solver, iter_max, callback)
+
+        if S is not None:
+            x = S * x
+
+        return x, computational_time
+
+    ##
+    # Solve the problem of the NSoL Tikhonov solver by lsmr warm-started from
+    # its initial value, i.e. lsmr is run for the correction of x0. Given a
+    # callback, lsmr is run in chunks of iter_step iterations, each
+    # warm-started from the previous estimate, and the iterations are stopped
+    # once the callback evaluated after each chunk returns True.
+    # \date       2018-03-16 09:26:41+0000
+    #
+    # \param      self      The object
+    # \param      solver    tk.TikhonovLinearSolver object
+    # \param      iter_max  Number of maximum iterations
+    # \param      callback  function callback(n, x, final) or None
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_lsmr(self, solver, iter_max, callback=None):
+
+        time_start = ph.start_timing()
+
+        A, A_adj, B, B_adj, b, x0, x_scale = self._get_scaled_problem(solver)
+        alpha = solver.get_alpha()
+
+        if alpha > EPS:
+            sqrt_alpha = np.sqrt(alpha)
+            N_b = b.size
+            A_fw = lambda x: np.concatenate((A(x), sqrt_alpha * B(x)))
+            A_bw = lambda y: A_adj(y[0:N_b]) + sqrt_alpha * B_adj(y[N_b:])
+            b = np.concatenate((b, np.zeros(B(x0).size)))
+        else:
+            A_fw = A
+            A_bw = A_adj
+
+        if callback is None:
+            iter_step = iter_max
+        else:
+            iter_step = self._iter_step
+
+        x = x0
+        n = 0
+        while n < iter_max:
+            n_step = min(iter_step, iter_max - n)
+            x, n_performed = self._run_lsmr_from_x0(
+                A_fw, A_bw, b, x, n_step, verbose=self._verbose)
+            n += n_performed
+
+            # lsmr stops early once it found an exact solution
+            final = n_performed < n_step
+            if callback is not None and callback(n, x * x_scale, final=final):
+                break
+            if final:
+                break
+        x = x * x_scale
+
+        return x, ph.stop_timing(time_start)
+
+    ##
+    # Solve the problem of the NSoL Tikhonov solver by
+    # scipy.optimize.minimize with the chosen minimizer (e.g. 'L-BFGS-B') and
+    # stop the iterations once the callback returns True.
+    # \date       2018-03-16 09:28:15+0000
+    #
+    # \param      self      The object
+    # \param      solver    tk.TikhonovLinearSolver object
+    # \param      iter_max  Number of maximum iterations
+    # \param      callback  function callback(n, x)
+    #
+    # \return     x as 1D array and the computational time
+    #
+    def _run_minimize(self, solver, iter_max, callback):
+
+        time_start = ph.start_timing()
+
+        A, A_adj, B, B_adj, b, x0, x_scale = self._get_scaled_problem(solver)
+        alpha = solver.get_alpha()
+        loss = lf.get_loss[self._data_loss]
+        gradient_loss = lf.get_gradient_loss[self._data_loss]
+
+        def cost(x):
+            residual = A(x) - b
+            cost = 0.5 * np.sum(
+                loss(f2=residual**2, f_scale=self._data_loss_scale))
+            if alpha > EPS:
+                cost += alpha * 0.5 * np.sum(B(x)**2)
+            return cost
+
+        def grad_cost(x):
+            residual = A(x) - b
+            grad = A_adj(gradient_loss(
+                f2=residual**2, f_scale=self._data_loss_scale) * residual)
+            if alpha > EPS:
+                grad += alpha * B_adj(B(x))
+            return grad
+
+        # Number of iterations and last iterate (lists to allow for the
+        # assignment within the callback)
+        n = [0]
+        x_last = [x0]
+
+        def callback_minimize(x):
+            n[0] += 1
+            x_last[0] = np.array(x)
+            if callback(n[0], x * x_scale):
+                raise ConvergenceReached()
+
+        try:
+            x = scipy.optimize.minimize(
+                method=self._minimizer,
+                fun=cost,
+                jac=grad_cost,
+                x0=x0,
+                bounds=[[0, np.inf]] * x0.size,
+                callback=callback_minimize,
+                options={'maxiter': iter_max, 'disp': self._verbose}).x
+        except ConvergenceReached:
+            x = x_last[0]
+
+        return x * x_scale, ph.stop_timing(time_start)
+
+    ##
+    # Gets operators, right-hand side and initial value of the NSoL Tikhonov
+    # solver in its scaled variables x / x_scale.
+    # \date       2018-03-16 09:29:33+0000
+    #
+    # \param      solver  tk.TikhonovLinearSolver object
+    #
+    # \return     A, A_adj, B, B_adj, b, x0 and x_scale
+    #
+    @staticmethod
+    def _get_scaled_problem(solver):
+        x_scale = solver.get_x_scale()
+        b = solver.get_b() / x_scale
+        x0 = np.clip(solver.get_x0() / x_scale, 0, np.inf)
+        return solver.get_A(), solver.get_A_adj(), \
+            solver.get_B(), solver.get_B_adj(), b, x0, x_scale
+
+    ##
+    # Check whether components can be reconstructed via run_components, i.e.
+    # whether the stacks of all components share the slice geometry and, if
+    # masks are used, the slice masks of the solver's stacks.
+    # \date       2018-04-03 09:41:20+0100
+    #
+    # \param      self              The object
+    # \param      component_stacks  list of components, each given as list of
+    #                               Stack objects
+    #
+    # \return     True if all slices match in size, position and mask, False
+    #             otherwise
+    #
+    def can_run_components(self, component_stacks):
+
+        slices_ref = [
+            slice_k for stack in self._stacks for slice_k in stack.get_slices()]
+
+        for stacks in component_stacks:
+            slices = [
+                slice_k for stack in stacks for slice_k in stack.get_slices()]
+            if len(slices) != len(slices_ref):
+                return False
+
+            for slice_k, slice_ref in zip(slices, slices_ref):
+                if slice_k.sitk.GetSize() != slice_ref.sitk.GetSize():
+                    return False
+                for attr in ["GetOrigin", "GetSpacing", "GetDirection"]:
+                    if not np.allclose(getattr(slice_k.sitk, attr)(),
+                                       getattr(slice_ref.sitk, attr)()):
+                        return False
+
+                # The masks are part of the shared operator MA
+                if self._use_masks and \
+                        slice_k.sitk_mask is not slice_ref.sitk_mask and \
+                        not np.array_equal(
+                            sitk.GetArrayFromImage(slice_k.sitk_mask),
+                            sitk.GetArrayFromImage(slice_ref.sitk_mask)):
+                    return False
+
+        return True
+
+    ##
+    # Reconstruct multiple components (e.g. multi-echo or diffusion channels)
+    # sharing the slice geometry of the solver's stacks.
+    #
+    # As MA is the same for all components, the K components are
+    # reconstructed jointly: the unknowns x_1, ..., x_K are stacked and
+    # the block-diagonal problem with operators diag(MA, ..., MA) and
+    # diag(G, ..., G) is solved by a single run of the chosen minimizer with
+    # the solver's settings, i.e. bounds, x_scale, preconditioning and
+    # convergence criteria, starting from the current reconstruction. Within
+    # each iteration, MA and A^* M are applied to the (N, K) block of all
+    # components, i.e. the assembled operator, if chosen, is traversed only
+    # once per iteration. The reconstruction of the solver remains unchanged.
+    # \date       2018-04-03 09:45:02+0100
+    #
+    # \param      self              The object
+    # \param      component_stacks  list of K components, each given as list
+    #                               of Stack objects matching the solver's
+    #                               stacks in geometry and masks
+    # \post       Component reconstructions can be fetched by
+    #             get_component_reconstructions
+    #
+    def run_components(self, component_stacks):
+
+        if not self.can_run_components(component_stacks):
+            raise ValueError(
+                "Reconstruction of components requires stacks sharing the "
+                "slice geometry and masks of the solver's stacks")
+
+        self._clear_operator_caches()
+
+        n_components = len(component_stacks)
+        if self._verbose:
+            ph.print_subtitle(
+                "Tikhonov Solver: Joint reconstruction of %d components" %
+                n_components)
+
+        # Stacked right-hand sides and initial values of all components
+        b = np.concatenate(
+            [self._get_M_y_component(stacks) for stacks in component_stacks])
+        x0 = np.tile(self.get_x0(), n_components)
+
+        self._reset_convergence_history()
+        x, self._computational_time = self._run_steps(
+            lambda x0, iter_max, callback: self._run_step(
+                x0, iter_max, callback, b=b, n_components=n_components),
+            x0, self._iter_max, b=b, n_components=n_components)
+
+        self._component_reconstructions = []
+        for x_c in x.reshape(n_components, -1):
+            image_sitk = sitk.GetImageFromArray(
+                self._get_x_full(x_c).reshape(self._reconstruction_shape))
+            image_sitk.CopyInformation(self._reconstruction.sitk)
+            self._component_reconstructions.append(st.Stack.from_sitk_image(
+                image_sitk,
+                filename=self._reconstruction.get_filename(),
+                image_sitk_mask=self._reconstruction.sitk_mask,
+                extract_slices=False))
+
+        self._clear_operator_caches()
+
+    ##
+    # Gets the right-hand side My for the slices of a component sharing the
+    # slice geometry of the solver's stacks, each slice masked by its own mask
+    # \date       2018-04-03 09:52:13+0100
+    #
+    # \param      self    The object
+    # \param      stacks  list of Stack objects
+    #
+    # \return     1D numpy array
+    #
+    def _get_M_y_component(self, stacks):
+
+        slices = [
+            slice_k for stack in stacks for slice_k in stack.get_slices()]
+
+        My = np.zeros(self._N_total_slice_voxels, dtype=self._dtype)
+        for slice_k, (slice_ref, i_min, i_max) in zip(
+                slices, self._get_slice_ranges()):
+            y_k = self._itk2np.GetArrayViewFromImage(slice_k.itk).ravel()
+            if self._use_masks:
+                y_k = y_k * self._itk2np.GetArrayViewFromImage(
+                    slice_k.itk_mask).ravel()
+            My[i_min:i_max] = y_k
+
+        return My
+
+    def get_component_reconstructions(self):
+        return self._component_reconstructions
+
+    def _get_regularizer_value(self, x):
+        if self._reg_type == "TK0":
+            return 0.5 * np.sum(x**2)
+        B = self._get_gradient_operators()[0]
+        return 0.5 * np.sum(B(x)**2)
+
+    ##
+    # Run the reconstruction on a downsampled reconstruction grid and update
+    # the reconstruction by the upsampled result.
+    #
+    # The solver itself is run on the downsampled grid, i.e. its linear
+    # operators, the cached PSF covariances (the orientation of the grid is
+    # kept) and the masked slice data are reused.
+    # \date       2018-03-14 09:15:47+0000
+    #
+    # \param      self      The object
+    # \param      factor    Downsampling factor of the reconstruction grid
+    # \param      iter_max  Number of maximum iterations
+    #
+    def _run_coarse_level(self, factor, iter_max):
+
+        if self._verbose:
+            ph.print_title("Tikhonov Solver: Resolution level with "
+                           "downsampling factor %g" % factor)
+
+        # Initial value on downsampled grid
+        reconstruction = self._reconstruction
+        spacing = np.array(reconstruction.sitk.GetSpacing()) * factor
+        reconstruction_coarse = reconstruction.get_resampled_stack(
+            spacing=spacing,
+            filename=reconstruction.get_filename())
+
+        self.set_reconstruction(reconstruction_coarse)
+        try:
+            self._run_level(iter_max)
+        finally:
+            self.set_reconstruction(reconstruction)
+
+        # Upsampled result serves as initial value for the next level
+        reconstruction_sitk = reconstruction_coarse.get_resampled_stack(
+            resampling_grid=reconstruction.sitk).sitk
+        self._reconstruction.sitk = reconstruction_sitk
+        self._reconstruction.itk = prec.get_itk_from_sitk_image(
+            reconstruction_sitk, self._precision)
+
+    ##
+    # Gets the Jacobi scaling S = D^(-1/2) with D the diagonal of
+    # (MA)^T MA + alpha G^T G.
+    #
+    # For G = I the diagonal of G^T G is one, for G the gradient it is
+    # approximated by its value sum_i 2/h_i^2 away from the boundary.
+    # \date       2018-03-15 09:31:02+0000
+    #
+    # \param      self          The object
+    # \param      n_components  Number of components K the scaling is
+    #                           repeated for
+    #
+    # \return     Scaling as 1D numpy array in the space of the unknowns x
+    #
+    def _get_preconditioner_scaling(self, n_components=1):
+
+        D = np.array(self._get_MA_diagonal(), dtype=np.float64)
+
+        if self._reg_type == "TK0":
+            D += self._alpha
+        else:
+            spacing = np.array(self._reconstruction.sitk.GetSpacing())
+            D += self._alpha * np.sum(2. / spacing**2)
+
+        # Unknowns without any contribution remain unscaled
+        D[D <= 0] = 1
+
+        return np.tile(1. / np.sqrt(D), n_components).astype(self._dtype)
+
+    @staticmethod
+    def _get_scaled_operator(A, S):
+        return lambda z: A(S * z)
+
+    @staticmethod
+    def _get_block_diagonal_operator(B, n_components):
+        return lambda x: np.concatenate(
+            [B(x_c) for x_c in x.reshape(n_components, -1)])
+
+    @staticmethod
+    def _get_scaled_adjoint_operator(A_adj, S):
+        return lambda y: S * A_adj(y)
+
+    def _print_info_text(self, iter_max=None):
 
-    def _print_info_text(self):
+        if iter_max is None:
+            iter_max = self._iter_max
 
         ph.print_subtitle("Tikhonov Solver:")
         ph.print_info("Chosen regularization type: ", newline=False)
@@ -278,6 +851,8 @@ class TikhonovSolver(Solver):
 
         ph.print_info("Regularization parameter: " + str(self._alpha))
         ph.print_info("Minimizer: " + self._minimizer)
+        if self._use_preconditioning:
+            ph.print_info("Diagonal (Jacobi) preconditioning: on")
         ph.print_info(
-            "Maximum number of iterations: " + str(self._iter_max))
+            "Maximum number of iterations: " + str(iter_max))
         # ph.print_info("Tolerance: %.0e" %(self._tolerance))
@@ -15,6 +15,7 @@ import SimpleITK as sitk
 import itk
 import numpy as np
 
+import niftymic.base.precision as prec
 import niftymic.base.slice as sl
 import niftymic.base.stack as st
 import niftymic.utilities.intensity_correction as ic
@@ -2118,10 +2119,11 @@ class IntraStackRegistration(StackRegistrationBase):
 
             slices_corrected[i].sitk.SetSpacing(spacing)
             slices_corrected[i].sitk_mask.SetSpacing(spacing)
-            slices_corrected[i].itk = sitkh.get_itk_from_sitk_image(
-                slices_corrected[i].sitk)
-            slices_corrected[i].itk_mask = \
-                sitkh.get_itk_from_sitk_image(slices_corrected[i].sitk_mask)
+            precision = prec.get_precision(slices_corrected[i].sitk)
+            slices_corrected[i].itk = prec.get_itk_from_sitk_image(
+                slices_corrected[i].sitk, precision)
+            slices_corrected[i].itk_mask = prec.get_itk_from_sitk_image(
+                slices_corrected[i].sitk_mask, precision)
 
             # Update affine transform (including scaling information)
             affine_3D_sitk = sitk.AffineTransform(3)
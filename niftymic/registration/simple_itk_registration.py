@@ -16,10 +16,10 @@ import SimpleITK as sitk
 # http://stackoverflow.com/questions/20263839/python-convert-a-string-to-arguments-list:
 from ast import literal_eval
 
-import pysitk.simple_itk_helper as sitkh
 import pysitk.python_helper as ph
 import simplereg.simple_itk_registration
 
+import niftymic.base.precision as prec
 import niftymic.base.psf as psf
 import niftymic.base.stack as st
 from niftymic.registration.registration_method \
@@ -170,8 +170,11 @@ class SimpleItkRegistration(AffineRegistrationMethod):
             ).get_covariance_matrix_in_reconstruction_space(
                 self._fixed, self._moving)
 
-            # Create recursive YVV Gaussianfilter
-            image_type = itk.Image[itk.D, self._fixed.sitk.GetDimension()]
+            # Create recursive YVV Gaussianfilter matching the precision of
+            # the moving image
+            precision = prec.get_precision(self._moving.sitk)
+            image_type = prec.get_itk_image_type(
+                precision, self._fixed.sitk.GetDimension())
             gaussian_yvv = itk.SmoothingRecursiveYvvGaussianImageFilter[
                 image_type, image_type].New()
 
@@ -190,7 +193,7 @@ class SimpleItkRegistration(AffineRegistrationMethod):
             gaussian_yvv.Update()
             moving_itk = gaussian_yvv.GetOutput()
             moving_itk.DisconnectPipeline()
-            moving_sitk = sitkh.get_sitk_from_itk_image(moving_itk)
+            moving_sitk = prec.get_sitk_from_itk_image(moving_itk, precision)
 
         else:
             moving_sitk = self._moving.sitk
@@ -332,6 +332,144 @@ class InputArgparser(object):
     ):
         self._add_argument(dict(locals()))
 
+    def add_use_assembled_operator(
+        self,
+        option_string="--use-assembled-operator",
+        type=int,
+        help="Assemble the slice acquisition operator as sparse matrix once "
+        "per reconstruction step instead of evaluating the ITK filters for "
+        "every slice and iteration. Trades memory for speed.",
+        default=0,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_use_preconditioning(
+        self,
+        option_string="--use-preconditioning",
+        type=int,
+        help="Use diagonal (Jacobi) preconditioning for the Tikhonov "
+        "reconstruction steps.",
+        default=0,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_use_adaptive_rho(
+        self,
+        option_string="--use-adaptive-rho",
+        type=int,
+        help="Adapt rho of ADMM by residual balancing and solve the ADMM "
+        "least-squares subproblems inexactly (warm-started) while far from "
+        "convergence.",
+        default=0,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_rtol_residual(
+        self,
+        option_string="--rtol-residual",
+        type=float,
+        help="Stop the reconstruction iterations once the relative residual "
+        "||MAx - My|| / ||My|| falls below this tolerance.",
+        default=None,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_rtol_x(
+        self,
+        option_string="--rtol-x",
+        type=float,
+        help="Stop the reconstruction iterations once the relative change of "
+        "the reconstruction between two checks falls below this tolerance. "
+        "Not available for the minimizers 'lsq_linear' and 'least_squares' "
+        "of the Tikhonov solver.",
+        default=None,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_rtol_data_fit(
+        self,
+        option_string="--rtol-data-fit",
+        type=float,
+        help="Stop the reconstruction iterations once the relative change of "
+        "the data fit between two checks falls below this tolerance. "
+        "Not available for the minimizers 'lsq_linear' and 'least_squares' "
+        "of the Tikhonov solver.",
+        default=None,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_iter_step(
+        self,
+        option_string="--iter-step",
+        type=int,
+        help="Number of iterations between two convergence checks. Only "
+        "used if any of the tolerances '--rtol-residual', '--rtol-x' or "
+        "'--rtol-data-fit' is given. The minimizer 'lsmr' is restarted "
+        "from the current estimate after each check.",
+        default=5,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_threads(
+        self,
+        option_string="--threads",
+        type=int,
+        help="Number of threads used to evaluate the slice acquisition "
+        "operators during the reconstruction.",
+        default=1,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_n_stacks(
+        self,
+        option_string="--n-stacks",
+        type=int,
+        help="Number of stacks to be expected. The streaming reconstruction "
+        "stops once this number of stacks has been ingested. If not given, "
+        "it stops after '--timeout' seconds without new stacks.",
+        default=None,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_poll_interval(
+        self,
+        option_string="--poll-interval",
+        type=float,
+        help="Time in seconds between two checks of the input directory for "
+        "new stacks.",
+        default=5,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_timeout(
+        self,
+        option_string="--timeout",
+        type=float,
+        help="Time in seconds without new stacks after which the streaming "
+        "reconstruction stops.",
+        default=1800,
+        required=False,
+    ):
+        self._add_argument(dict(locals()))
+
+    def add_precision(
+        self,
+        option_string="--precision",
+        type=str,
+        help="Floating point precision used to represent the image data "
+        "during the reconstruction, i.e. either 'double' or 'single'. "
+        "Single precision halves memory requirements. Reconstructions are "
+        "written in double precision in either case.",
+        default="double",
+    ):
+        self._add_argument(dict(locals()))
+
     def add_boundary_stacks(
         self,
         option_string="--boundary-stacks",
@@ -469,6 +607,20 @@ class InputArgparser(object):
     ):
         self._add_argument(dict(locals()))
 
+    def add_two_step_resolution_levels(
+        self,
+        option_string="--two-step-resolution-levels",
+        type=float,
+        nargs="+",
+        help="Downsampling factors of the reconstruction grid used for the "
+        "SRR steps of the two-step cycles, one per SRR step, e.g. '4 2'. "
+        "Early cycles can thus be computed on coarser grids. The final "
+        "reconstruction is always computed at full resolution. "
+        "If not given, all SRR steps are computed at full resolution.",
+        default=None,
+    ):
+        self._add_argument(dict(locals()))
+
     def add_sigma(
         self,
         option_string="--sigma",
@@ -479,6 +631,19 @@ class InputArgparser(object):
     ):
         self._add_argument(dict(locals()))
 
+    def add_sda_approach(
+        self,
+        option_string="--sda-approach",
+        type=str,
+        help="Approach of the Scattered Data Approximation to reconstruct "
+        "first estimate of HR volume. Possible choices are 'Shepard-YVV', "
+        "'Shepard-Deriche' (nearest neighbour deposition followed by "
+        "Gaussian smoothing with given sigma) and 'Shepard-PSF' (splatting "
+        "of slice voxels with their oriented PSF).",
+        default="Shepard-YVV",
+    ):
+        self._add_argument(dict(locals()))
+
     def add_minimizer(
         self,
         option_string="--minimizer",
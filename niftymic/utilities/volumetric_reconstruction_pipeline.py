@@ -435,6 +435,16 @@ class TwoStepSliceToVolumeRegistrationReconstruction(
     #                                    or array
     # \param      cycles                 Number of cycles, int
     # \param      verbose                The verbose
+    # \param      resolution_levels      Optional list of downsampling
+    #                                    factors of the reconstruction grid,
+    #                                    one for each SRR step (i.e. cycles-1
+    #                                    values), e.g. [4, 2]. Each SRR step
+    #                                    is then computed on the respective
+    #                                    coarser grid and upsampled
+    #                                    afterwards. Requires a
+    #                                    reconstruction method supporting
+    #                                    resolution levels, e.g.
+    #                                    TikhonovSolver
     #
     def __init__(self,
                  stacks,
@@ -444,6 +454,7 @@ class TwoStepSliceToVolumeRegistrationReconstruction(
                  alpha_range,
                  cycles,
                  verbose=1,
+                 resolution_levels=None,
                  ):
 
         ReconstructionRegistrationPipeline.__init__(
@@ -457,6 +468,17 @@ class TwoStepSliceToVolumeRegistrationReconstruction(
 
         self._cycles = cycles
 
+        if resolution_levels is not None:
+            if len(resolution_levels) < self._cycles - 1:
+                raise ValueError(
+                    "A resolution level for each of the %d SRR steps must "
+                    "be provided" % (self._cycles - 1))
+            if not hasattr(reconstruction_method, "set_resolution_levels"):
+                raise ValueError(
+                    "Reconstruction method does not support resolution "
+                    "levels")
+        self._resolution_levels = resolution_levels
+
     def _run(self):
 
         ph.print_title("Two-step S2V-Registration and SRR Reconstruction")
@@ -488,7 +510,15 @@ class TwoStepSliceToVolumeRegistrationReconstruction(
             # SRR step
             if cycle < self._cycles - 1:
                 self._reconstruction_method.set_alpha(alphas[cycle])
+                if self._resolution_levels is not None:
+                    resolution_levels = \
+                        self._reconstruction_method.get_resolution_levels()
+                    self._reconstruction_method.set_resolution_levels(
+                        [self._resolution_levels[cycle]])
                 self._reconstruction_method.run()
+                if self._resolution_levels is not None:
+                    self._reconstruction_method.set_resolution_levels(
+                        resolution_levels)
 
                 self._computational_time_reconstruction += \
                     self._reconstruction_method.get_computational_time()
@@ -715,7 +745,10 @@ class HieararchicalSliceSetRegistrationReconstruction(
 ##
 # Class to perform multi-component reconstruction
 #
-# Each stack is individually reconstructed at a given reconstruction space
+# Each stack is individually reconstructed at a given reconstruction space.
+# If the reconstruction method supports it (e.g. TikhonovSolver) and all
+# stacks share the slice geometry and masks, the components are reconstructed
+# jointly by one solve of the stacked block-diagonal problem.
 # \date       2017-08-08 02:34:40+0100
 #
 class MultiComponentReconstruction(Pipeline):
@@ -730,18 +763,26 @@ class MultiComponentReconstruction(Pipeline):
     # \param      suffix                 Suffix added to filenames of each
     #                                    individual stack, string
     # \param      verbose                The verbose
+    # \param      use_joint_reconstruction  Reconstruct all components
+    #                                    jointly in case the reconstruction
+    #                                    method supports it and all stacks
+    #                                    share the slice geometry and masks.
+    #                                    Otherwise, the components are
+    #                                    reconstructed one after another, bool
     #
     def __init__(self,
                  stacks,
                  reconstruction_method,
                  suffix="_recon",
-                 verbose=0):
+                 verbose=0,
+                 use_joint_reconstruction=True):
 
         Pipeline.__init__(self, stacks=stacks, verbose=verbose)
 
         self._reconstruction_method = reconstruction_method
         self._reconstructions = None
         self._suffix = suffix
+        self._use_joint_reconstruction = use_joint_reconstruction
 
     def set_reconstruction_method(self, reconstruction_method):
         self._reconstruction_method = reconstruction_method
@@ -752,6 +793,12 @@ class MultiComponentReconstruction(Pipeline):
     def get_suffix(self):
         return self._suffix
 
+    def set_use_joint_reconstruction(self, use_joint_reconstruction):
+        self._use_joint_reconstruction = use_joint_reconstruction
+
+    def get_use_joint_reconstruction(self):
+        return self._use_joint_reconstruction
+
     def get_reconstructions(self):
         return [st.Stack.from_stack(stack) for stack in self._reconstructions]
 
@@ -759,6 +806,25 @@ class MultiComponentReconstruction(Pipeline):
 
         ph.print_title("Multi-Component Reconstruction")
 
+        # Components sharing the slice geometry and masks are reconstructed
+        # jointly, i.e. MA is applied to all components at once
+        if self._use_joint_reconstruction and \
+                hasattr(self._reconstruction_method, "run_components"):
+            self._reconstruction_method.set_stacks([self._stacks[0]])
+            component_stacks = [[stack] for stack in self._stacks]
+            if self._reconstruction_method.can_run_components(
+                    component_stacks):
+                ph.print_info("Joint reconstruction of %d components" %
+                              len(self._stacks))
+                self._reconstruction_method.run_components(component_stacks)
+                self._reconstructions = self._reconstruction_method.\
+                    get_component_reconstructions()
+                for stack, reconstruction in zip(
+                        self._stacks, self._reconstructions):
+                    reconstruction.set_filename(
+                        stack.get_filename() + self._suffix)
+                return
+
         self._reconstructions = [None] * len(self._stacks)
 
         for i in range(0, len(self._stacks)):
@@ -771,3 +837,144 @@ class MultiComponentReconstruction(Pipeline):
                 self._reconstruction_method.get_reconstruction())
             self._reconstructions[i].set_filename(
                 stack.get_filename() + self._suffix)
+
+
+##
+# Class to perform a streaming reconstruction, i.e. to update the
+# reconstruction each time a new stack becomes available.
+#
+# Each new stack is registered to the current reconstruction (volume-to-volume
+# registration followed by an optional slice-to-volume registration of its
+# slices). Afterwards, the reconstruction method is run on all ingested stacks
+# and warm-started from the previous reconstruction, e.g. the lsmr minimizer
+# of TikhonovSolver is run for the correction of the previous reconstruction.
+# As the same reconstruction method is used throughout, per-slice data of
+# earlier stacks (assembled operator rows and slice footprints) is kept and
+# only recomputed for slices which have been moved; the assembled operator
+# itself is re-stacked from these rows in every run.
+# \date       2018-04-02 10:12:36+0100
+#
+class StreamingReconstruction(Pipeline):
+
+    ##
+    # Store information relevant for the streaming reconstruction
+    # \date       2018-04-02 10:14:52+0100
+    #
+    # \param      self                     The object
+    # \param      reconstruction_method    Reconstruction method, e.g.
+    #                                      TikhonovSolver. Its reconstruction
+    #                                      defines the reconstruction space
+    #                                      and the initial estimate
+    # \param      stacks                   Stacks already ingested, i.e.
+    #                                      consistent with the initial
+    #                                      estimate, list of Stack objects
+    # \param      registration_method      Volume-to-volume registration
+    #                                      method, e.g. FLIRT; None to skip
+    # \param      s2v_registration_method  Slice-to-volume registration
+    #                                      method, e.g. SimpleItkRegistration;
+    #                                      None to skip
+    # \param      verbose                  The verbose
+    #
+    def __init__(self,
+                 reconstruction_method,
+                 stacks=[],
+                 registration_method=None,
+                 s2v_registration_method=None,
+                 verbose=0,
+                 ):
+
+        Pipeline.__init__(self, stacks=list(stacks), verbose=verbose)
+
+        self._reconstruction_method = reconstruction_method
+        self._registration_method = registration_method
+        self._s2v_registration_method = s2v_registration_method
+
+        # Number of stacks whose information is contained in the current
+        # reconstruction
+        self._N_stacks_ingested = len(self._stacks)
+
+        self._reconstructions = []
+        self._computational_time_reconstruction = ph.get_zero_time()
+        self._computational_time_registration = ph.get_zero_time()
+
+    def get_reconstruction(self):
+        return st.Stack.from_stack(
+            self._reconstruction_method.get_reconstruction())
+
+    def get_iterative_reconstructions(self):
+        return self._reconstructions
+
+    def get_number_of_ingested_stacks(self):
+        return self._N_stacks_ingested
+
+    def get_computational_time_reconstruction(self):
+        return self._computational_time_reconstruction
+
+    def get_computational_time_registration(self):
+        return self._computational_time_registration
+
+    ##
+    # Ingest a new stack and update the reconstruction
+    # \date       2018-04-02 10:17:20+0100
+    #
+    # \param      self   The object
+    # \param      stack  Stack object
+    #
+    def add_stack(self, stack):
+        self._stacks.append(stack)
+        self.run()
+
+    ##
+    # Ingest all stacks added since the last run. The stacks of the first
+    # ingest are not registered as the initial estimate is assumed to be
+    # derived from them.
+    # \date       2018-04-02 10:19:03+0100
+    #
+    def _run(self):
+
+        stacks_new = self._stacks[self._N_stacks_ingested:]
+        if len(stacks_new) == 0:
+            return
+
+        reconstruction = self._reconstruction_method.get_reconstruction()
+
+        # Register new stacks to current reconstruction
+        if self._N_stacks_ingested > 0:
+            time_start = ph.start_timing()
+
+            if self._registration_method is not None:
+                v2vreg = VolumeToVolumeRegistration(
+                    stacks=stacks_new,
+                    reference=reconstruction,
+                    registration_method=self._registration_method,
+                    verbose=self._verbose)
+                v2vreg.run()
+
+            if self._s2v_registration_method is not None:
+                s2vreg = SliceToVolumeRegistration(
+                    stacks=stacks_new,
+                    reference=reconstruction,
+                    registration_method=self._s2v_registration_method,
+                    verbose=self._verbose,
+                    print_prefix="Stack %d: " % len(self._stacks))
+                s2vreg.run()
+
+            self._computational_time_registration += \
+                ph.stop_timing(time_start)
+
+        # Update reconstruction warm-started from the current estimate
+        ph.print_title("Streaming Reconstruction -- %d Stacks" %
+                       len(self._stacks))
+        self._reconstruction_method.set_stacks(list(self._stacks))
+        self._reconstruction_method.run()
+        self._computational_time_reconstruction += \
+            self._reconstruction_method.get_computational_time()
+
+        self._N_stacks_ingested = len(self._stacks)
+
+        filename = "Stacks%d_%s" % (
+            self._N_stacks_ingested,
+            self._reconstruction_method.get_setting_specific_filename())
+        self._reconstructions.insert(0, st.Stack.from_stack(
+            self._reconstruction_method.get_reconstruction(),
+            filename=filename))
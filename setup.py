@@ -105,6 +105,7 @@ setup(name='NiftyMIC',
               'niftymic_correct_intensities = niftymic.application.correct_intensities:main',
               'niftymic_reconstruct_volume = niftymic.application.reconstruct_volume:main',
               'niftymic_reconstruct_volume_from_slices = niftymic.application.reconstruct_volume_from_slices:main',
+              'niftymic_reconstruct_volume_streaming = niftymic.application.reconstruct_volume_streaming:main',
               'niftymic_register_image = niftymic.application.register_image:main',
               'niftymic_multiply_stack_with_mask = niftymic.application.multiply_stack_with_mask:main',
               'niftymic_run_reconstruction_parameter_study = niftymic.application.run_reconstruction_parameter_study:main',
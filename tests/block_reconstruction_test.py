@@ -0,0 +1,125 @@
+##
+# \file block_reconstruction_test.py
+#  \brief  unit tests of the domain-decomposed block reconstruction
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import os
+import unittest
+import numpy as np
+import SimpleITK as sitk
+
+import niftymic.base.stack as st
+import niftymic.base.data_reader as dr
+import niftymic.reconstruction.block_reconstruction as br
+import niftymic.reconstruction.tikhonov_solver as tk
+from niftymic.definitions import DIR_TEST
+
+
+class BlockReconstructionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.precision = 7
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filenames = [
+            "IC_N4ITK_HASTE_exam_3.5mm_800ms_3",
+        ]
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        paths_to_filenames = [
+            os.path.join(self.dir_data, "motion_correction", f + ".nii.gz")
+            for f in self.filenames]
+        data_reader = dr.MultipleImagesReader(
+            paths_to_filenames, suffix_mask=self.suffix_mask)
+        data_reader.read_data()
+        self.stacks = data_reader.get_data()
+
+        self.reconstruction = st.Stack.from_filename(
+            os.path.join(self.dir_data, self.filename_recon + ".nii.gz"),
+            os.path.join(self.dir_data,
+                         self.filename_recon + self.suffix_mask + ".nii.gz"))
+
+    ##
+    # Test that the blocks cover the reconstruction space with the requested
+    # overlap and that the blending weights form a partition of unity
+    # \date       2018-03-30 11:02:14+0100
+    #
+    def test_blocks(self):
+
+        block_reconstruction = br.BlockReconstruction(
+            stacks=self.stacks,
+            reconstruction=self.reconstruction,
+            block_size=40,
+            overlap=6,
+        )
+        size_r = self.reconstruction.sitk.GetSize()
+        shape = size_r[::-1]
+
+        covered = np.zeros(shape, dtype=int)
+        weight_sum = np.zeros(shape)
+        for index, size in block_reconstruction.get_blocks():
+            self.assertTrue(np.all(index + size <= np.array(size_r)))
+            region = tuple(slice(index[i], index[i] + size[i])
+                           for i in range(2, -1, -1))
+            covered[region] += 1
+            weight_sum[region] += \
+                block_reconstruction._get_blending_weights(index, size)
+
+        self.assertTrue(np.all(covered > 0))
+        self.assertGreater(covered.max(), 1)
+        self.assertTrue(np.all(weight_sum > 0))
+
+        # Overlaps larger than the block size are rejected
+        block_reconstruction.set_overlap(40)
+        self.assertRaises(ValueError, block_reconstruction.get_blocks)
+
+    ##
+    # Test that the block reconstruction yields a finite reconstruction on the
+    # original grid which is close to the reconstruction obtained from a
+    # single solve, independent of the number of processes
+    # \date       2018-03-30 11:05:38+0100
+    #
+    def test_block_reconstruction(self):
+
+        reconstruction_full = st.Stack.from_stack(self.reconstruction)
+        solver = tk.TikhonovSolver(
+            stacks=self.stacks,
+            reconstruction=reconstruction_full,
+            iter_max=5,
+            verbose=0,
+        )
+        solver.run()
+        nda_full = sitk.GetArrayFromImage(solver.get_reconstruction().sitk)
+
+        nda_blocks = []
+        for n_processes in [1, 2]:
+            block_reconstruction = br.BlockReconstruction(
+                stacks=self.stacks,
+                reconstruction=st.Stack.from_stack(self.reconstruction),
+                block_size=48,
+                overlap=8,
+                n_processes=n_processes,
+                iter_max=5,
+            )
+            block_reconstruction.run()
+            reconstruction = block_reconstruction.get_reconstruction()
+
+            self.assertEqual(reconstruction.sitk.GetSize(),
+                             self.reconstruction.sitk.GetSize())
+            self.assertEqual(
+                reconstruction.itk.GetLargestPossibleRegion().GetSize()[0],
+                self.reconstruction.sitk.GetSize()[0])
+            nda_blocks.append(sitk.GetArrayFromImage(reconstruction.sitk))
+            self.assertTrue(np.all(np.isfinite(nda_blocks[-1])))
+
+        self.assertAlmostEqual(
+            np.linalg.norm(nda_blocks[0] - nda_blocks[1]), 0,
+            places=self.precision)
+
+        # Block solves only differ by the boundary treatment of the blocks
+        self.assertLess(
+            np.linalg.norm(nda_blocks[0] - nda_full) /
+            np.linalg.norm(nda_full), 0.1)
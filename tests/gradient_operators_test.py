@@ -0,0 +1,113 @@
+##
+# \file gradient_operators_test.py
+#  \brief  unit tests of the in-place gradient operators
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import unittest
+import numpy as np
+
+import nsol.linear_operators as linop
+
+import niftymic.reconstruction.gradient_operators as grad_op
+
+
+class GradientOperatorsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.precision = 7
+        self.shape = (7, 9, 11)
+        self.spacing = (0.8, 1.1, 2.5)
+        self.random_state = np.random.RandomState(0)
+
+    ##
+    # Test forward differences on the grid interior and that constant images
+    # have zero gradient away from the upper grid boundary
+    # \date       2018-03-27 10:02:13+0100
+    #
+    def test_gradient(self):
+
+        gradient_operators = grad_op.GradientOperators(
+            self.shape, self.spacing)
+        x = self.random_state.rand(np.prod(self.shape))
+        nda = x.reshape(self.shape)
+
+        z = gradient_operators.grad(x).reshape((3,) + self.shape)
+
+        # Components are ordered as (i, j, k), i.e. reversed numpy axes
+        for c, axis in enumerate([2, 1, 0]):
+            nda_diff = np.diff(nda, axis=axis) / self.spacing[c]
+            self.assertAlmostEqual(
+                np.linalg.norm(np.take(z[c], range(0, self.shape[axis] - 1),
+                                       axis=axis) - nda_diff), 0,
+                places=self.precision)
+
+    ##
+    # Test parity of gradient and adjoint gradient with the NSoL gradient
+    # operators used by the regularizers
+    # \date       2018-03-27 10:03:48+0100
+    #
+    def test_gradient_nsol(self):
+
+        gradient_operators = grad_op.GradientOperators(
+            self.shape, self.spacing)
+        linear_operators = linop.LinearOperators3D(
+            spacing=np.array(self.spacing))
+        D, D_adj = linear_operators.get_gradient_operators()
+
+        x = self.random_state.rand(np.prod(self.shape))
+        z = self.random_state.rand(gradient_operators.get_gradient_size())
+
+        grad_x_nsol = D(x.reshape(self.shape))
+        grad_x = gradient_operators.grad(x)
+        self.assertAlmostEqual(
+            np.linalg.norm(grad_x - grad_x_nsol.flatten()), 0,
+            places=self.precision)
+
+        grad_adj_z_nsol = D_adj(z.reshape(grad_x_nsol.shape))
+        grad_adj_z = gradient_operators.grad_adj(z)
+        self.assertAlmostEqual(
+            np.linalg.norm(grad_adj_z - grad_adj_z_nsol.flatten()), 0,
+            places=self.precision)
+
+    ##
+    # Test that the operators are adjoint to each other, both on the full
+    # grid and on restricted unknowns, and that given output buffers are used
+    # \date       2018-03-27 10:05:31+0100
+    #
+    def test_adjoint(self):
+
+        N = np.prod(self.shape)
+        indices = np.sort(self.random_state.choice(N, N // 3, replace=False))
+
+        for idx in [None, indices]:
+            gradient_operators = grad_op.GradientOperators(
+                self.shape, self.spacing, indices=idx)
+            N_x = N if idx is None else idx.size
+            x = self.random_state.rand(N_x)
+            z = self.random_state.rand(gradient_operators.get_gradient_size())
+
+            grad_x = gradient_operators.grad(x)
+            grad_adj_z = gradient_operators.grad_adj(z)
+            self.assertAlmostEqual(
+                (np.sum(grad_x * z) - np.sum(x * grad_adj_z)) /
+                np.sum(grad_x * z), 0,
+                places=self.precision)
+
+            out = np.zeros_like(grad_x)
+            self.assertIs(gradient_operators.grad(x, out=out), out)
+            self.assertAlmostEqual(
+                np.linalg.norm(out - grad_x), 0, places=self.precision)
+
+        # Restricted unknowns correspond to zero-filled grid data
+        x_full = np.zeros(N)
+        x_full[indices] = x
+        grad_full = grad_op.GradientOperators(self.shape, self.spacing)
+        self.assertAlmostEqual(
+            np.linalg.norm(grad_full.grad(x_full) - grad_x), 0,
+            places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(grad_full.grad_adj(z)[indices] - grad_adj_z), 0,
+            places=self.precision)
@@ -19,6 +19,7 @@ import pysitk.simple_itk_helper as sitkh
 import pysitk.python_helper as ph
 
 # Import modules
+import niftymic.base.precision as prec
 import niftymic.base.stack as st
 import niftymic.registration.intra_stack_registration as inplanereg
 
@@ -966,6 +967,35 @@ class IntraStackRegistrationTest(unittest.TestCase):
         self.assertEqual(np.round(
             np.linalg.norm(stack_diff_nda), decimals=8), 0)
 
+    ##
+    # Test that slices corrected by the similarity registration of a stack
+    # in single precision remain in single precision
+    # \date       2018-03-08 14:12:05+0000
+    #
+    def test_inplane_similarity_alignment_single_precision(self):
+
+        filename_stack = "fetal_brain_0"
+
+        stack = st.Stack.from_filename(
+            os.path.join(self.dir_test_data, filename_stack + ".nii.gz"),
+            os.path.join(self.dir_test_data, filename_stack + "_mask.nii.gz"),
+            precision="single",
+        )
+
+        inplane_registration = inplanereg.IntraStackRegistration(
+            stack=stack, reference=stack)
+        inplane_registration.set_transform_type("similarity")
+        inplane_registration.use_stack_mask(True)
+        inplane_registration.set_optimizer_iter_max(2)
+        inplane_registration.run()
+
+        image_type = prec.get_itk_image_type("single")
+        stack_registered = inplane_registration.get_corrected_stack()
+        for slice in stack_registered.get_slices():
+            self.assertEqual(slice.sitk.GetPixelID(), sitk.sitkFloat32)
+            self.assertIsInstance(slice.itk, image_type)
+            self.assertIsInstance(slice.itk_mask, image_type)
+
     def test_inplane_rigid_alignment_to_reference_multimodal(self):
 
         filename_stack = "fetal_brain_0"
@@ -119,3 +119,68 @@ class LinearOperatorsTest(unittest.TestCase):
         exe = os.path.abspath(simulate_stacks_from_reconstruction.__file__)
         cmd = "python %s %s" % (exe, (" ").join(cmd_args))
         self.assertEqual(ph.execute_command(cmd), 0)
+
+    ##
+    # Test that cached PSF covariances are consistent with their computation,
+    # reused for unmoved slices and updated once a slice has been moved
+    # \date       2018-03-09 14:31:19+0000
+    #
+    def test_covariance_cache(self):
+
+        stack = st.Stack.from_filename(
+            self.paths_to_filenames[0], extract_slices=True)
+        reconstruction = st.Stack.from_filename(
+            self.path_to_recon, self.path_to_recon_mask)
+        slice = stack.get_slices()[0]
+
+        linear_operators = lin_op.LinearOperators()
+        cov = linear_operators.get_covariance(
+            reconstruction.itk, slice.itk, slice)
+        cov_ref = linear_operators._get_covariance_full_3d(
+            reconstruction.itk, slice.itk)
+        self.assertAlmostEqual(
+            np.linalg.norm(cov - cov_ref), 0, places=self.precision)
+        self.assertIs(linear_operators.get_covariance(
+            reconstruction.itk, slice.itk, slice), cov)
+
+        # Rotate slice and verify that covariance gets recomputed
+        version = slice.get_geometry_version()
+        transform_sitk = sitk.Euler3DTransform()
+        transform_sitk.SetRotation(0.3, 0.1, -0.2)
+        slice.update_motion_correction(sitk.AffineTransform(transform_sitk))
+        self.assertNotEqual(slice.get_geometry_version(), version)
+
+        cov = linear_operators.get_covariance(
+            reconstruction.itk, slice.itk, slice)
+        cov_ref = linear_operators._get_covariance_full_3d(
+            reconstruction.itk, slice.itk)
+        self.assertAlmostEqual(
+            np.linalg.norm(cov - cov_ref), 0, places=self.precision)
+        self.assertEqual(len(linear_operators._covariance_cache), 1)
+
+        # Without slice, the covariance is not cached
+        linear_operators.clear_covariance_cache()
+        cov = linear_operators.get_covariance(reconstruction.itk, slice.itk)
+        self.assertAlmostEqual(
+            np.linalg.norm(cov - cov_ref), 0, places=self.precision)
+        self.assertEqual(len(linear_operators._covariance_cache), 0)
+
+        # In-place geometry changes and image reassignments change the
+        # geometry version as well
+        version = slice.get_geometry_version()
+        slice.sitk.SetOrigin(np.array(slice.sitk.GetOrigin()) + 1.)
+        self.assertNotEqual(slice.get_geometry_version(), version)
+        version = slice.get_geometry_version()
+        slice.itk = sitkh.get_itk_from_sitk_image(slice.sitk)
+        self.assertNotEqual(slice.get_geometry_version(), version)
+
+        # Covariances are kept for a resampled reconstruction grid of the
+        # same orientation
+        linear_operators.set_reconstruction_space(reconstruction.itk)
+        cov = linear_operators.get_covariance(
+            reconstruction.itk, slice.itk, slice)
+        reconstruction_coarse = reconstruction.get_resampled_stack(
+            spacing=2 * np.array(reconstruction.sitk.GetSpacing()))
+        linear_operators.set_reconstruction_space(reconstruction_coarse.itk)
+        self.assertIs(linear_operators.get_covariance(
+            reconstruction_coarse.itk, slice.itk, slice), cov)
@@ -0,0 +1,119 @@
+##
+# \file ordered_subsets_solver_test.py
+#  \brief  unit tests of the ordered subsets solver
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import os
+import unittest
+import numpy as np
+
+import niftymic.base.stack as st
+import niftymic.base.data_reader as dr
+import niftymic.reconstruction.ordered_subsets_solver as oss
+from niftymic.definitions import DIR_TEST
+
+
+class OrderedSubsetsSolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.precision = 7
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filenames = [
+            "IC_N4ITK_HASTE_exam_3.5mm_800ms_3",
+        ]
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        paths_to_filenames = [
+            os.path.join(self.dir_data, "motion_correction", f + ".nii.gz")
+            for f in self.filenames]
+        data_reader = dr.MultipleImagesReader(
+            paths_to_filenames, suffix_mask=self.suffix_mask)
+        data_reader.read_data()
+        self.stacks = data_reader.get_data()
+
+        self.reconstruction = st.Stack.from_filename(
+            os.path.join(self.dir_data, self.filename_recon + ".nii.gz"),
+            os.path.join(self.dir_data,
+                         self.filename_recon + self.suffix_mask + ".nii.gz"))
+
+    ##
+    # Test that the subsets form a partition of all slice voxels
+    # \date       2018-03-19 10:01:22+0000
+    #
+    def test_subsets(self):
+
+        solver = oss.OrderedSubsetsSolver(
+            stacks=self.stacks,
+            reconstruction=self.reconstruction,
+            verbose=0)
+        N_total_slice_voxels = np.sum([
+            np.array(stack.sitk.GetSize()).prod() for stack in self.stacks])
+
+        for subset_type in oss.SUBSET_TYPES:
+            solver.set_subset_type(subset_type)
+            covered = np.zeros(N_total_slice_voxels, dtype=int)
+            for subset in solver.get_subsets():
+                for slice_k, i_min, i_max in subset:
+                    covered[i_min:i_max] += 1
+            self.assertTrue(np.all(covered == 1))
+
+    ##
+    # Test that the ordered subsets iterations yield a non-negative
+    # reconstruction on the original grid
+    # \date       2018-03-19 10:04:47+0000
+    #
+    def test_run(self):
+
+        solver = oss.OrderedSubsetsSolver(
+            stacks=self.stacks,
+            reconstruction=self.reconstruction,
+            iter_max=2,
+            subset_type="package",
+            verbose=0)
+        solver.set_convergence_criteria(rtol_x=0, iter_step=1)
+        size = self.reconstruction.sitk.GetSize()
+        solver.run()
+
+        history = solver.get_convergence_history()
+        self.assertEqual(history["iterations"], [1, 2])
+        self.assertTrue(np.all(np.isfinite(history["data_fit"])))
+
+        x = solver.get_x0()
+        self.assertEqual(solver.get_reconstruction().sitk.GetSize(), size)
+        self.assertTrue(np.all(x >= 0))
+
+        # Passes stop as soon as the loose tolerance is met
+        solver.set_iter_max(4)
+        solver.set_convergence_criteria(rtol_x=np.inf, iter_step=1)
+        solver.run()
+        self.assertEqual(solver.get_convergence_history()["iterations"], [1])
+
+    ##
+    # Test that the solver obtained by get_solver performs the same passes
+    # as run
+    # \date       2018-03-19 10:12:03+0000
+    #
+    def test_get_solver(self):
+
+        solver = oss.OrderedSubsetsSolver(
+            stacks=self.stacks,
+            reconstruction=self.reconstruction,
+            iter_max=2,
+            subset_type="random",
+            n_subsets=3,
+            verbose=0)
+
+        solver_os = solver.get_solver()
+        solver_os.run()
+        x = solver_os.get_x()
+        self.assertEqual(x.shape, solver.get_x0().shape)
+        self.assertTrue(np.all(x >= 0))
+
+        solver.run()
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_x0() - x) / np.linalg.norm(x), 0,
+            places=6)
@@ -15,17 +15,24 @@ import sys
 import os
 
 # Import modules for unit testing
+from block_reconstruction_test import *
 from brain_stripping_test import *
 from cpp_itk_registration_test import *
+from gradient_operators_test import *
 from intensity_correction_test import *
 from intra_stack_registration_test import *
 from linear_operators_test import *
 from niftyreg_test import *
+from ordered_subsets_solver_test import *
 from parameter_normalization_test import *
 from registration_test import *
+from scattered_data_approximation_test import *
 from segmentation_propagation_test import *
 from simulator_slice_acquisition_test import *
+from slice_footprint_index_test import *
+from solver_test import *
 from stack_test import *
+from streaming_reconstruction_test import *
 
 if __name__ == '__main__':
     print("\nUnit tests:\n--------------")
@@ -0,0 +1,140 @@
+##
+# \file scattered_data_approximation_test.py
+#  \brief  unit tests of the scattered data approximation
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import os
+import unittest
+import numpy as np
+import SimpleITK as sitk
+
+import pysitk.simple_itk_helper as sitkh
+
+import niftymic.base.stack as st
+import niftymic.base.data_reader as dr
+import niftymic.reconstruction.scattered_data_approximation as sda
+from niftymic.definitions import DIR_TEST
+
+
+class ScatteredDataApproximationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.precision = 7
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filenames = [
+            "IC_N4ITK_HASTE_exam_3.5mm_800ms_3",
+        ]
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        paths_to_filenames = [
+            os.path.join(self.dir_data, "motion_correction", f + ".nii.gz")
+            for f in self.filenames]
+        data_reader = dr.MultipleImagesReader(
+            paths_to_filenames, suffix_mask=self.suffix_mask)
+        data_reader.read_data()
+        self.stacks = data_reader.get_data()
+
+        self.HR_volume = st.Stack.from_filename(
+            os.path.join(self.dir_data, self.filename_recon + ".nii.gz"),
+            os.path.join(self.dir_data,
+                         self.filename_recon + self.suffix_mask + ".nii.gz"))
+
+    ##
+    # Test that the accumulated nearest neighbour samples match the ones
+    # obtained by resampling each slice onto the entire HR grid
+    # \date       2018-03-28 10:01:17+0100
+    #
+    def test_shepard_numerator_denominator(self):
+
+        # Move slices out of the stack geometry
+        transform_sitk = sitk.Euler3DTransform()
+        transform_sitk.SetRotation(0.1, -0.2, 0.05)
+        transform_sitk.SetTranslation((1.3, -0.4, 2.1))
+        for slice in self.stacks[0].get_slices()[::3]:
+            slice.update_motion_correction(transform_sitk)
+
+        SDA = sda.ScatteredDataApproximation(self.stacks, self.HR_volume)
+
+        for use_masks in [False, True]:
+            helper_N_nda, helper_D_nda = \
+                SDA._get_shepard_numerator_denominator(
+                    use_masks=use_masks, dtype=np.float64)
+
+            shape = sitk.GetArrayFromImage(self.HR_volume.sitk).shape
+            helper_N_nda_ref = np.zeros(shape)
+            helper_D_nda_ref = np.zeros(shape)
+            for slice in self.stacks[0].get_slices():
+                slice_sitk = sitk.Cast(slice.sitk, sitk.sitkFloat64)
+                if use_masks:
+                    slice_sitk *= sitk.Cast(slice.sitk_mask, sitk.sitkFloat64)
+                nda_slice = sitk.GetArrayFromImage(sitk.Resample(
+                    slice_sitk,
+                    self.HR_volume.sitk,
+                    sitk.Euler3DTransform(),
+                    sitk.sitkNearestNeighbor,
+                    0.,
+                    sitk.sitkFloat64))
+                ind_nonzero = nda_slice > 0
+                helper_N_nda_ref[ind_nonzero] += nda_slice[ind_nonzero]
+                helper_D_nda_ref[ind_nonzero] += 1
+
+            self.assertAlmostEqual(
+                np.linalg.norm(helper_N_nda - helper_N_nda_ref) /
+                np.linalg.norm(helper_N_nda_ref), 0,
+                places=self.precision)
+            self.assertAlmostEqual(
+                np.linalg.norm(helper_D_nda - helper_D_nda_ref) /
+                np.linalg.norm(helper_D_nda_ref), 0,
+                places=self.precision)
+
+    ##
+    # Test that the normalized PSF splatting reproduces constant slice
+    # intensities
+    # \date       2018-03-29 10:12:44+0100
+    #
+    def test_shepard_psf(self):
+
+        intensity = 5.
+        for slice in self.stacks[0].get_slices():
+            slice_sitk = sitk.GetImageFromArray(
+                intensity * np.ones_like(sitk.GetArrayFromImage(slice.sitk)))
+            slice_sitk.CopyInformation(slice.sitk)
+            slice.sitk = slice_sitk
+            slice.itk = sitkh.get_itk_from_sitk_image(slice_sitk)
+
+        SDA = sda.ScatteredDataApproximation(self.stacks, self.HR_volume)
+        SDA.set_approach("Shepard-PSF")
+        SDA.run()
+
+        nda = sitk.GetArrayFromImage(SDA.get_reconstruction().sitk)
+        self.assertGreater(np.sum(nda > 0), 0)
+        self.assertAlmostEqual(
+            np.max(np.abs(nda[nda > 0] - intensity)), 0, places=5)
+
+    ##
+    # Test that the multi-threaded accumulation over stacks yields the same
+    # result as the sequential one
+    # \date       2018-03-30 09:31:02+0100
+    #
+    def test_multithreaded_accumulation(self):
+
+        stacks = [self.stacks[0], st.Stack.from_stack(self.stacks[0])]
+        SDA = sda.ScatteredDataApproximation(stacks, self.HR_volume)
+        helper_N_nda, helper_D_nda = SDA._get_shepard_numerator_denominator(
+            use_masks=True, dtype=np.float64)
+
+        SDA.set_n_threads(2)
+        helper_N_nda_threads, helper_D_nda_threads = \
+            SDA._get_shepard_numerator_denominator(
+                use_masks=True, dtype=np.float64)
+
+        self.assertAlmostEqual(
+            np.linalg.norm(helper_N_nda_threads - helper_N_nda), 0,
+            places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(helper_D_nda_threads - helper_D_nda), 0,
+            places=self.precision)
@@ -0,0 +1,165 @@
+##
+# \file slice_footprint_index_test.py
+#  \brief  unit tests of the spatial index of slice footprints
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import os
+import unittest
+import numpy as np
+import SimpleITK as sitk
+
+import niftymic.base.stack as st
+import niftymic.base.data_reader as dr
+import niftymic.reconstruction.linear_operators as lin_op
+import niftymic.reconstruction.slice_footprint_index as sfi
+from niftymic.definitions import DIR_TEST
+
+
+class SliceFootprintIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filenames = [
+            "IC_N4ITK_HASTE_exam_3.5mm_800ms_3",
+        ]
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        paths_to_filenames = [
+            os.path.join(self.dir_data, "motion_correction", f + ".nii.gz")
+            for f in self.filenames]
+        data_reader = dr.MultipleImagesReader(
+            paths_to_filenames, suffix_mask=self.suffix_mask)
+        data_reader.read_data()
+        self.stacks = data_reader.get_data()
+        self.slices = [s for stack in self.stacks for s in stack.get_slices()]
+
+        self.reconstruction = st.Stack.from_filename(
+            os.path.join(self.dir_data, self.filename_recon + ".nii.gz"),
+            os.path.join(self.dir_data,
+                         self.filename_recon + self.suffix_mask + ".nii.gz"))
+
+        self.linear_operators = lin_op.LinearOperators()
+
+    def _get_slices_brute_force(self, index, size):
+        slices = []
+        for slice_k in self.slices:
+            index_k, size_k = self.linear_operators.get_footprint_region(
+                self.reconstruction.itk, slice_k.itk)
+            if size_k.prod() > 0 and \
+                    np.all(index_k < index + size) and \
+                    np.all(index_k + size_k > index):
+                slices.append(slice_k)
+        return slices
+
+    ##
+    # Test that region queries yield the same slices as the brute-force
+    # intersection of all footprints
+    # \date       2018-03-31 10:12:05+0100
+    #
+    def test_region_queries(self):
+
+        footprint_index = sfi.SliceFootprintIndex(
+            self.slices, self.reconstruction)
+        self.assertEqual(footprint_index.update(), len(self.slices))
+        self.assertEqual(footprint_index.update(), 0)
+
+        size_r = np.array(self.reconstruction.sitk.GetSize())
+        regions = [
+            (np.zeros(3, dtype=int), size_r),
+            (size_r // 4, size_r // 2),
+            (size_r // 2, np.array([1, 1, 1])),
+            (np.array([0, 0, size_r[2] - 2]), np.array([size_r[0], 5, 2])),
+        ]
+        for index, size in regions:
+            slices = footprint_index.get_slices_in_region(index, size)
+            slices_ref = self._get_slices_brute_force(index, size)
+            self.assertEqual(slices, slices_ref)
+
+        # Footprints agree with the ones of the linear operators
+        slice_k = self.slices[len(self.slices) // 2]
+        index, size = footprint_index.get_footprint_region(slice_k)
+        index_ref, size_ref = self.linear_operators.get_footprint_region(
+            self.reconstruction.itk, slice_k.itk)
+        self.assertEqual(list(index), list(index_ref))
+        self.assertEqual(list(size), list(size_ref))
+
+        # World bounding boxes contain the world positions of all slice voxels
+        lower, upper = footprint_index.get_world_bounding_box(slice_k)
+        slice_sitk = slice_k.sitk
+        size_s = slice_sitk.GetSize()
+        for corner in np.indices((2, 2, 2)).reshape(3, -1).transpose():
+            point = np.array(slice_sitk.TransformIndexToPhysicalPoint(
+                [int(c * (s - 1)) for c, s in zip(corner, size_s)]))
+            self.assertTrue(np.all(point >= lower))
+            self.assertTrue(np.all(point <= upper))
+        self.assertIn(
+            slice_k, footprint_index.get_slices_in_world_box(lower, upper))
+
+    ##
+    # Test that only the footprints of moved slices are recomputed
+    # \date       2018-03-31 10:15:40+0100
+    #
+    def test_incremental_update(self):
+
+        footprint_index = sfi.SliceFootprintIndex(
+            self.slices, self.reconstruction)
+        footprint_index.update()
+
+        slice_k = self.slices[0]
+        lower, upper = footprint_index.get_world_bounding_box(slice_k)
+
+        translation = np.array([4.5, -2., 3.])
+        transform_sitk = sitk.Euler3DTransform()
+        transform_sitk.SetTranslation(tuple(translation))
+        slice_k.update_motion_correction(transform_sitk)
+
+        self.assertEqual(footprint_index.update(), 1)
+
+        # Pure translations shift the world bounding box
+        lower_moved, upper_moved = footprint_index.get_world_bounding_box(
+            slice_k)
+        self.assertAlmostEqual(
+            np.linalg.norm(lower_moved - lower - (upper_moved - upper)), 0,
+            places=6)
+        self.assertAlmostEqual(
+            np.linalg.norm(np.abs(lower_moved - lower) - np.abs(translation)),
+            0, places=6)
+
+        size_r = np.array(self.reconstruction.sitk.GetSize())
+        index, size = size_r // 4, size_r // 2
+        self.assertEqual(
+            footprint_index.get_slices_in_region(index, size),
+            self._get_slices_brute_force(index, size))
+
+    ##
+    # Test that footprints of already indexed slices are kept when the
+    # indexed slices change, e.g. when stacks are added
+    # \date       2018-04-02 10:31:12+0100
+    #
+    def test_set_slices(self):
+
+        N_slices = len(self.slices) // 2
+        footprint_index = sfi.SliceFootprintIndex(
+            self.slices[0:N_slices], self.reconstruction)
+        self.assertEqual(footprint_index.update(), N_slices)
+        index, size = footprint_index.get_footprint_region(self.slices[0])
+
+        footprint_index.set_slices(self.slices[::-1])
+        self.assertEqual(
+            footprint_index.update(), len(self.slices) - N_slices)
+
+        index_kept, size_kept = footprint_index.get_footprint_region(
+            self.slices[0])
+        self.assertEqual(np.abs(index_kept - index).sum(), 0)
+        self.assertEqual(np.abs(size_kept - size).sum(), 0)
+
+        size_r = np.array(self.reconstruction.sitk.GetSize())
+        index, size = size_r // 4, size_r // 2
+        self.assertEqual(
+            sorted(footprint_index.get_slices_in_region(index, size),
+                   key=self.slices.index),
+            self._get_slices_brute_force(index, size))
@@ -0,0 +1,672 @@
+##
+# \file solver_test.py
+#  \brief  unit tests of the operator evaluations provided by Solver
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date March 2018
+
+
+import os
+import unittest
+import numpy as np
+import SimpleITK as sitk
+
+import niftymic.base.stack as st
+import niftymic.base.data_reader as dr
+import niftymic.reconstruction.admm_solver as admm
+import niftymic.reconstruction.tikhonov_solver as tk
+from niftymic.definitions import DIR_TEST
+
+
+class SolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.precision = 7
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filenames = [
+            "IC_N4ITK_HASTE_exam_3.5mm_800ms_3",
+        ]
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        self.paths_to_filenames = [
+            os.path.join(self.dir_data, "motion_correction", f + ".nii.gz")
+            for f in self.filenames]
+        self.path_to_recon = os.path.join(
+            self.dir_data, self.filename_recon + ".nii.gz")
+        self.path_to_recon_mask = os.path.join(
+            self.dir_data, self.filename_recon + self.suffix_mask + ".nii.gz")
+
+    def _get_solver(self,
+                    use_assembled_operator,
+                    precision="double",
+                    use_mask_compression=False):
+        data_reader = dr.MultipleImagesReader(
+            self.paths_to_filenames,
+            suffix_mask=self.suffix_mask,
+            precision=precision)
+        data_reader.read_data()
+        stacks = data_reader.get_data()
+
+        reconstruction = st.Stack.from_filename(
+            self.path_to_recon, self.path_to_recon_mask, precision=precision)
+
+        return tk.TikhonovSolver(
+            stacks=stacks,
+            reconstruction=reconstruction,
+            use_assembled_operator=use_assembled_operator,
+            use_mask_compression=use_mask_compression,
+            verbose=0,
+        )
+
+    ##
+    # Test that the assembled sparse matrix representation of MA yields the
+    # same forward and adjoint evaluations as the ITK filters
+    # \date       2018-03-05 11:02:17+0000
+    #
+    def test_assembled_operator(self):
+
+        solver_itk = self._get_solver(use_assembled_operator=False)
+        solver_sparse = self._get_solver(use_assembled_operator=True)
+
+        x = solver_itk.get_x0()
+        y = solver_itk.get_b()
+
+        MA_x_itk = solver_itk.get_A()(x)
+        MA_x_sparse = solver_sparse.get_A()(x)
+        A_adj_M_y_itk = solver_itk.get_A_adj()(y)
+        A_adj_M_y_sparse = solver_sparse.get_A_adj()(y)
+
+        self.assertEqual(MA_x_itk.shape, MA_x_sparse.shape)
+        self.assertEqual(A_adj_M_y_itk.shape, A_adj_M_y_sparse.shape)
+
+        # Differences only due to floating point precision of the filters
+        rel_error_forward = np.linalg.norm(MA_x_itk - MA_x_sparse) / \
+            np.linalg.norm(MA_x_itk)
+        rel_error_adjoint = np.linalg.norm(
+            A_adj_M_y_itk - A_adj_M_y_sparse) / \
+            np.linalg.norm(A_adj_M_y_itk)
+        self.assertAlmostEqual(rel_error_forward, 0, places=4)
+        self.assertAlmostEqual(rel_error_adjoint, 0, places=4)
+
+        # Assembled operators are adjoint to each other
+        self.assertAlmostEqual(
+            (np.sum(MA_x_sparse * y) - np.sum(x * A_adj_M_y_sparse)) /
+            np.sum(MA_x_sparse * y), 0,
+            places=self.precision)
+
+    ##
+    # Test that the backward operation restricted to the slice footprints
+    # yields the same result as the evaluation on the entire reconstruction
+    # space
+    # \date       2018-03-06 15:03:44+0000
+    #
+    def test_adjoint_operator_footprint(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver.set_use_separable_operators(False)
+        y = solver.get_b()
+
+        A_adj_M_y_footprint = solver.get_A_adj()(y)
+
+        A_adj_M_y = np.zeros_like(A_adj_M_y_footprint)
+        i_min = 0
+        for stack in solver._stacks:
+            for slice_k in stack.get_slices():
+                i_max = i_min + np.array(slice_k.sitk.GetSize()).prod()
+                slice_itk = solver._get_itk_image_from_array_vec(
+                    y[i_min:i_max], slice_k.itk)
+                A_adj_M_y += solver._itk2np.GetArrayFromImage(
+                    solver._Ak_adj_Mk(slice_itk, slice_k)).flatten()
+                i_min = i_max
+
+        self.assertAlmostEqual(
+            np.linalg.norm(A_adj_M_y_footprint - A_adj_M_y), 0,
+            places=self.precision)
+
+    ##
+    # Test that the multi-threaded evaluation of the operators yields the same
+    # results as the sequential one
+    # \date       2018-03-07 10:31:52+0000
+    #
+    def test_multithreaded_operators(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        x = solver.get_x0()
+        y = solver.get_b()
+        MA_x = solver.get_A()(x)
+        A_adj_M_y = solver.get_A_adj()(y)
+
+        solver.set_n_threads(4)
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_b() - y), 0, places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_A()(x) - MA_x), 0,
+            places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_A_adj()(y) - A_adj_M_y) /
+            np.linalg.norm(A_adj_M_y), 0,
+            places=self.precision)
+
+        # The thread pool is reused across operator evaluations
+        thread_pool = solver._thread_pool
+        solver.get_A()(x)
+        self.assertIs(solver._thread_pool, thread_pool)
+
+    ##
+    # Test that operator evaluations in single precision agree with the ones
+    # in double precision up to single precision accuracy
+    # \date       2018-03-08 11:20:36+0000
+    #
+    def test_single_precision_operators(self):
+
+        solver_double = self._get_solver(use_assembled_operator=False)
+        solver_single = self._get_solver(
+            use_assembled_operator=False, precision="single")
+
+        x = solver_double.get_x0()
+        y = solver_double.get_b()
+
+        MA_x = solver_single.get_A()(x)
+        A_adj_M_y = solver_single.get_A_adj()(y)
+
+        self.assertEqual(MA_x.dtype, np.float32)
+        self.assertEqual(A_adj_M_y.dtype, np.float32)
+        self.assertEqual(solver_single.get_x0().dtype, np.float32)
+
+        MA_x_double = solver_double.get_A()(x)
+        A_adj_M_y_double = solver_double.get_A_adj()(y)
+        self.assertAlmostEqual(
+            np.linalg.norm(MA_x - MA_x_double) /
+            np.linalg.norm(MA_x_double), 0, places=5)
+        self.assertAlmostEqual(
+            np.linalg.norm(A_adj_M_y - A_adj_M_y_double) /
+            np.linalg.norm(A_adj_M_y_double), 0, places=5)
+
+    ##
+    # Test that repeated operator evaluations on the persistent buffers
+    # reflect the updated input data
+    # \date       2018-03-09 10:02:51+0000
+    #
+    def test_repeated_operator_evaluations(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        x = solver.get_x0()
+        y = solver.get_b()
+
+        MA_x = solver.get_A()(x)
+        A_adj_M_y = solver.get_A_adj()(y)
+
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_A()(2 * x) - 2 * MA_x), 0,
+            places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_A_adj()(2 * y) - 2 * A_adj_M_y), 0,
+            places=self.precision)
+
+        # Input arrays remain unchanged
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_x0() - x), 0, places=self.precision)
+
+    ##
+    # Test that the evaluation of the operators on entire stacks whose slices
+    # share the rigid stack geometry yields the same results as the
+    # slice-wise evaluation
+    # \date       2018-03-12 11:04:13+0000
+    #
+    def test_stack_batched_operators(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        x = solver.get_x0()
+        y = solver.get_b()
+
+        # Stacks read from file are not affected by slice motion
+        self.assertEqual(
+            len(solver._get_operator_ranges()), len(solver._stacks))
+        MA_x_batched = solver.get_A()(x)
+        A_adj_M_y_batched = solver.get_A_adj()(y)
+
+        # Enforce slice-wise evaluation
+        solver._operator_ranges = solver._get_slice_ranges()
+        solver._slices_itk_views = None
+        MA_x = solver.get_A()(x)
+        A_adj_M_y = solver.get_A_adj()(y)
+
+        self.assertAlmostEqual(
+            np.linalg.norm(MA_x_batched - MA_x) / np.linalg.norm(MA_x), 0,
+            places=self.precision)
+        self.assertAlmostEqual(
+            np.linalg.norm(A_adj_M_y_batched - A_adj_M_y) /
+            np.linalg.norm(A_adj_M_y), 0,
+            places=self.precision)
+
+    ##
+    # Test that the operators acting on the mask-compressed unknown vector
+    # agree with the ones acting on the full reconstruction grid
+    # \date       2018-03-13 10:31:26+0000
+    #
+    def test_mask_compression(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver_compressed = self._get_solver(
+            use_assembled_operator=False, use_mask_compression=True)
+
+        x_compressed = solver_compressed.get_x0()
+        x = solver_compressed._get_x_full(x_compressed)
+        y = solver.get_b()
+
+        self.assertLessEqual(x_compressed.size, solver.get_x0().size)
+        self.assertEqual(solver_compressed.get_b().size, y.size)
+
+        MA_x = solver.get_A()(x)
+        MA_x_compressed = solver_compressed.get_A()(x_compressed)
+        self.assertAlmostEqual(
+            np.linalg.norm(MA_x_compressed - MA_x) / np.linalg.norm(MA_x), 0,
+            places=self.precision)
+
+        A_adj_M_y = solver_compressed._get_x_compressed(
+            solver.get_A_adj()(y))
+        A_adj_M_y_compressed = solver_compressed.get_A_adj()(y)
+        self.assertAlmostEqual(
+            np.linalg.norm(A_adj_M_y_compressed - A_adj_M_y) /
+            np.linalg.norm(A_adj_M_y), 0,
+            places=self.precision)
+
+        # Gradient operators remain adjoint to each other
+        B, B_adj = solver_compressed._get_gradient_operators()
+        B_x = B(x_compressed)
+        z = np.random.rand(B_x.size)
+        self.assertAlmostEqual(
+            (np.sum(B_x * z) - np.sum(x_compressed * B_adj(z))) /
+            np.sum(B_x * z), 0,
+            places=self.precision)
+
+    ##
+    # Test that a coarse-to-fine reconstruction yields a reconstruction on the
+    # original grid
+    # \date       2018-03-14 10:07:12+0000
+    #
+    def test_resolution_levels(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        size = solver.get_reconstruction().sitk.GetSize()
+        spacing = solver.get_reconstruction().sitk.GetSpacing()
+
+        solver.set_iter_max(2)
+        solver.set_resolution_levels([2, 1])
+        solver.run()
+        self.assertEqual(solver.get_reconstruction().sitk.GetSize(), size)
+
+        # Coarse levels with their own iteration budget
+        solver.set_iter_max_coarse(1)
+        solver.set_resolution_levels([4, 2, 1])
+        solver.run()
+
+        reconstruction = solver.get_reconstruction()
+        self.assertEqual(reconstruction.sitk.GetSize(), size)
+        self.assertEqual(reconstruction.sitk.GetSpacing(), spacing)
+        self.assertEqual(
+            reconstruction.itk.GetLargestPossibleRegion().GetSize()[0],
+            size[0])
+        self.assertTrue(np.all(np.isfinite(solver.get_x0())))
+
+        # lsmr is warm-started, i.e. the fine level started from the
+        # upsampled coarse result reaches a lower residual than from zero
+        solver = self._get_solver(use_assembled_operator=False)
+        solver._run_coarse_level(2, 10)
+        x_upsampled = solver.get_x0()
+        b = solver.get_b()
+
+        def get_residual(x):
+            return np.linalg.norm(solver.get_A()(x) - b)
+
+        x_warm = solver._run_step(x_upsampled, 2)[0]
+        x_cold = solver._run_step(np.zeros_like(x_upsampled), 2)[0]
+        self.assertLess(get_residual(x_warm), get_residual(x_cold))
+
+    ##
+    # Test that the diagonal of the normal operator obtained from the
+    # assembled operator matches the one obtained by unit vector probing
+    # \date       2018-03-15 10:12:40+0000
+    #
+    def test_MA_diagonal(self):
+
+        solver = self._get_solver(use_assembled_operator=True)
+        MA_diagonal = solver._get_MA_diagonal()
+
+        x = solver.get_x0()
+        self.assertEqual(MA_diagonal.shape, x.shape)
+
+        for j in np.nonzero(MA_diagonal)[0][::max(1, x.size // 20)][0:5]:
+            e_j = np.zeros_like(x)
+            e_j[j] = 1
+            self.assertAlmostEqual(
+                solver.get_A_adj()(solver.get_A()(e_j))[j], MA_diagonal[j],
+                places=self.precision)
+
+        # Jacobi scaling is positive and finite
+        S = solver._get_preconditioner_scaling()
+        self.assertTrue(np.all(S > 0))
+        self.assertTrue(np.all(np.isfinite(S)))
+
+    ##
+    # Test that the convergence history is only recorded if a convergence
+    # criterion is set and that the iterations are stopped once a criterion
+    # is met
+    # \date       2018-03-16 10:02:51+0000
+    #
+    def test_convergence_criteria(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver.set_iter_max(6)
+        solver.run()
+
+        history = solver.get_convergence_history()
+        self.assertEqual(history["iterations"], [])
+
+        # lsmr is checked every iter_step iterations
+        solver = self._get_solver(use_assembled_operator=False)
+        solver.set_iter_max(6)
+        solver.set_convergence_criteria(rtol_x=0, iter_step=2)
+        solver.run()
+
+        history = solver.get_convergence_history()
+        self.assertEqual(history["iterations"], [2, 4, 6])
+        for key in ["residual", "data_fit", "regularizer", "x_change"]:
+            self.assertEqual(len(history[key]), 3)
+            self.assertTrue(np.all(np.isfinite(history[key])))
+
+        # The residual refers to ||MAx - My|| / ||My||
+        x = solver.get_x0()
+        b = solver.get_b()
+        self.assertAlmostEqual(
+            history["residual"][-1],
+            np.linalg.norm(solver.get_A()(x) - b) / np.linalg.norm(b),
+            places=self.precision)
+
+        # Any change of x satisfies the loose tolerance
+        solver.set_convergence_criteria(rtol_x=np.inf, iter_step=2)
+        solver.run()
+        self.assertEqual(solver.get_convergence_history()["iterations"], [2])
+
+        # lsmr stops once the residual tolerance is met
+        solver.set_convergence_criteria(rtol_residual=np.inf, iter_step=2)
+        solver.run()
+        self.assertEqual(solver.get_convergence_history()["iterations"], [2])
+
+        # L-BFGS-B is stopped at the first check
+        solver.set_minimizer("L-BFGS-B")
+        solver.set_convergence_criteria(rtol_x=np.inf, iter_step=2)
+        solver.run()
+        self.assertEqual(solver.get_convergence_history()["iterations"], [2])
+
+    ##
+    # Test that the separable evaluation of the operators for a reconstruction
+    # space axis-aligned with the stack yields the same results as the ITK
+    # filters
+    # \date       2018-03-20 10:31:05+0000
+    #
+    def test_separable_operators(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        stack = solver._stacks[0]
+        reconstruction = stack.get_isotropically_resampled_stack(
+            extra_frame=5)
+        solver.set_reconstruction(reconstruction)
+
+        self.assertIsNotNone(solver._linear_operators.get_separable_operators(
+            reconstruction.itk, stack.itk))
+
+        x = solver.get_x0()
+        y = solver.get_b()
+        MA_x = solver.get_A()(x)
+        A_adj_M_y = solver.get_A_adj()(y)
+
+        solver.set_use_separable_operators(False)
+        MA_x_itk = solver.get_A()(x)
+        A_adj_M_y_itk = solver.get_A_adj()(y)
+
+        # Differences only due to floating point precision of the filters
+        self.assertAlmostEqual(
+            np.linalg.norm(MA_x - MA_x_itk) / np.linalg.norm(MA_x_itk), 0,
+            places=4)
+        self.assertAlmostEqual(
+            np.linalg.norm(A_adj_M_y - A_adj_M_y_itk) /
+            np.linalg.norm(A_adj_M_y_itk), 0,
+            places=4)
+
+    ##
+    # Test that the masked slice data is reused across runs and recomputed
+    # once the slice data changes
+    # \date       2018-03-21 09:24:37+0000
+    #
+    def test_data_cache(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver.set_iter_max(1)
+        y = solver.get_b()
+        M_y = solver._get_M_y()
+
+        # Runs do not recompute the data term
+        solver.run()
+        self.assertIs(solver._get_M_y(), M_y)
+
+        # Returned right hand-side vectors do not alias the cache
+        b = solver.get_b()
+        b[:] = 0
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_b() - y), 0, places=self.precision)
+
+        # Replaced slice intensities invalidate the cache
+        slice_k = solver._stacks[0].get_slices()[0]
+        slice_k.itk = solver._get_itk_image_from_array_vec(
+            2 * solver._itk2np.GetArrayFromImage(slice_k.itk).flatten(),
+            slice_k.itk)
+        self.assertIsNot(solver._get_M_y(), M_y)
+        self.assertGreater(np.linalg.norm(solver.get_b() - y), 0)
+
+        # Explicit invalidation for in-place modifications of the slice data
+        solver.clear_data_cache()
+        self.assertIsNone(solver._M_y)
+
+    ##
+    # Test that only the assembled operator rows of moved slices get
+    # recomputed and that the result matches a full assembly
+    # \date       2018-03-22 10:02:19+0000
+    #
+    def test_incremental_operator_update(self):
+
+        solver = self._get_solver(use_assembled_operator=True)
+        solver._get_assembled_operator()
+
+        slices = solver._stacks[0].get_slices()
+        MA_k_unchanged = solver._get_slice_cache(slices[1])["MA_sparse"][1]
+        linear_operators = solver._linear_operators
+        footprint = solver._get_footprint_region(slices[0], linear_operators)
+
+        # Move a single slice
+        transform_sitk = sitk.Euler3DTransform()
+        transform_sitk.SetTranslation((1.5, -0.5, 0.7))
+        slices[0].update_motion_correction(transform_sitk)
+
+        solver.run()
+        MA = solver._get_assembled_operator()
+
+        self.assertIs(
+            solver._get_slice_cache(slices[1])["MA_sparse"][1],
+            MA_k_unchanged)
+
+        solver_full = tk.TikhonovSolver(
+            stacks=solver._stacks,
+            reconstruction=solver.get_reconstruction(),
+            use_assembled_operator=True,
+            verbose=0,
+        )
+        MA_full = solver_full._get_assembled_operator()
+        self.assertAlmostEqual(
+            abs(MA - MA_full).max(), 0, places=self.precision)
+
+        # Footprints follow the moved slice; the footprint index is up to
+        # date after its first access following the run
+        self.assertIsNot(
+            solver._get_footprint_region(slices[0], linear_operators),
+            footprint)
+        self.assertEqual(solver._get_footprint_index().update(), 0)
+        index, size = solver._get_footprint_region(slices[0], linear_operators)
+        index_ref, size_ref = linear_operators.get_footprint_region(
+            solver.get_reconstruction().itk, slices[0].itk)
+        self.assertEqual(list(index), list(index_ref))
+        self.assertEqual(list(size), list(size_ref))
+
+    ##
+    # Test that the power iteration estimates of the squared operator norms
+    # bound the Rayleigh quotients of random vectors and improve on the
+    # analytical bound of the gradient
+    # \date       2018-03-23 10:05:13+0000
+    #
+    def test_operator_norm_estimates(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        spacing = solver.get_reconstruction().sitk.GetSpacing()
+
+        L2 = solver.get_gradient_norm_squared()
+        self.assertLess(L2, 16. / spacing[0]**2)
+        self.assertEqual(solver.get_gradient_norm_squared(), L2)
+
+        MA_L2 = solver.get_MA_norm_squared()
+        B = solver._get_gradient_operators()[0]
+        for seed in range(0, 3):
+            x = np.random.RandomState(seed).rand(solver.get_x0().size)
+            self.assertLessEqual(
+                np.sum(B(x)**2) / np.sum(x**2), L2)
+            self.assertLessEqual(
+                np.sum(solver.get_A()(x)**2) / np.sum(x**2), MA_L2)
+
+    ##
+    # Test that ADMM with residual balancing and inexact x-subproblems
+    # decreases the TV-L2 objective and is checked for convergence after
+    # each iteration without being restarted
+    # \date       2018-03-26 10:11:32+0100
+    #
+    def test_admm_adaptive_rho(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver = admm.ADMMSolver(
+            stacks=solver._stacks,
+            reconstruction=solver.get_reconstruction(),
+            alpha=0.01,
+            iter_max=5,
+            iterations=4,
+            use_adaptive_rho=True,
+            verbose=0,
+        )
+
+        def get_objective(x):
+            return 0.5 * np.sum((solver.get_A()(x) - solver.get_b())**2) + \
+                solver.get_alpha() * solver._get_total_variation(x)
+
+        objective_0 = get_objective(solver.get_x0())
+        solver.set_convergence_criteria(rtol_x=0, iter_step=1)
+        solver.run()
+        x = solver.get_x0()
+
+        self.assertTrue(np.all(np.isfinite(x)))
+        self.assertLess(get_objective(x), objective_0)
+        self.assertGreater(solver.get_rho_adapted(), 0)
+        self.assertEqual(
+            solver.get_convergence_history()["iterations"], [1, 2, 3, 4])
+
+        # Iterations stop as soon as the loose tolerance is met
+        solver.set_convergence_criteria(rtol_x=np.inf, iter_step=1)
+        solver.run()
+        self.assertEqual(solver.get_convergence_history()["iterations"], [1])
+
+        # Inexact x-subproblems refine the previous x, i.e. two lsmr
+        # iterations from the previous x yield a lower objective than from
+        # zero
+        A = solver.get_A()
+        A_adj = solver.get_A_adj()
+        b = solver.get_b()
+        B, B_adj = solver._get_gradient_operators()
+        rho = solver.get_rho_adapted()
+        z = B(x)
+
+        def get_objective_x_update(x):
+            return 0.5 * np.sum((A(x) - b)**2) + \
+                0.5 * rho * np.sum((B(x) - z)**2)
+
+        x_warm = solver._get_x_update(A, A_adj, B, B_adj, b, z, rho, x, 2)
+        x_cold = solver._get_x_update(
+            A, A_adj, B, B_adj, b, z, rho, np.zeros_like(x), 2)
+        self.assertLess(
+            get_objective_x_update(x_warm), get_objective_x_update(x_cold))
+
+    ##
+    # Test that the joint reconstruction of components matches the separate
+    # reconstructions of each component and requires a shared slice geometry
+    # and masks
+    # \date       2018-04-03 10:22:48+0100
+    #
+    def test_run_components(self):
+
+        solver = self._get_solver(use_assembled_operator=False)
+        solver.set_iter_max(5)
+        components = [
+            solver._stacks,
+            self._get_solver(use_assembled_operator=False)._stacks,
+        ]
+        self.assertTrue(solver.can_run_components(components))
+
+        x0 = solver.get_x0()
+        solver.run_components(components)
+        reconstructions = solver.get_component_reconstructions()
+        self.assertEqual(len(reconstructions), 2)
+
+        # Reconstruction of the solver remains unchanged
+        self.assertAlmostEqual(
+            np.linalg.norm(solver.get_x0() - x0), 0, places=self.precision)
+
+        for stacks, reconstruction in zip(components, reconstructions):
+            solver_component = self._get_solver(use_assembled_operator=False)
+            solver_component.set_iter_max(5)
+            solver_component.set_stacks(stacks)
+            solver_component.run()
+
+            nda = sitk.GetArrayFromImage(reconstruction.sitk)
+            nda_component = sitk.GetArrayFromImage(
+                solver_component.get_reconstruction().sitk)
+            self.assertEqual(nda.shape, nda_component.shape)
+            self.assertAlmostEqual(
+                np.linalg.norm(nda - nda_component) /
+                np.linalg.norm(nda_component), 0, places=self.precision)
+
+        # MA and A^* M applied to a block of components
+        for use_assembled_operator in [False, True]:
+            solver_block = self._get_solver(
+                use_assembled_operator=use_assembled_operator)
+            X = np.random.rand(x0.size, 3)
+            Y = np.random.rand(solver_block.get_b().size, 3)
+            MA_X = solver_block._MA_block(X)
+            A_adj_M_Y = solver_block._A_adj_M_block(Y)
+            for c in range(3):
+                self.assertAlmostEqual(
+                    np.linalg.norm(MA_X[:, c] - solver_block._MA(X[:, c])),
+                    0, places=self.precision)
+                self.assertAlmostEqual(
+                    np.linalg.norm(
+                        A_adj_M_Y[:, c] - solver_block._A_adj_M(Y[:, c])),
+                    0, places=self.precision)
+
+        # Different masks change the operator
+        stacks = self._get_solver(use_assembled_operator=False)._stacks
+        slice_k = stacks[0].get_slices()[0]
+        slice_k.sitk_mask = slice_k.sitk_mask * 0
+        self.assertFalse(solver.can_run_components([stacks]))
+
+        # Moved slices break the shared geometry
+        transform_sitk = sitk.Euler3DTransform()
+        transform_sitk.SetTranslation((1.5, -0.5, 0.7))
+        components[1][0].get_slices()[0].update_motion_correction(
+            transform_sitk)
+        self.assertFalse(solver.can_run_components(components))
+        self.assertRaises(ValueError, solver.run_components, components)
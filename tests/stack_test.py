@@ -153,3 +153,35 @@ class StackTest(unittest.TestCase):
 
         # No slice left for deletion
         self.assertRaises(RuntimeError, lambda: stack.delete_slice(-1))
+
+    def test_io_image_single_precision(self):
+        filename = "stack0"
+        stack = st.Stack.from_filename(
+            os.path.join(self.dir_test_data, filename + ".nii.gz"),
+            os.path.join(self.dir_test_data, filename + "_mask.nii.gz"),
+            precision="single",
+        )
+        stack_double = st.Stack.from_filename(
+            os.path.join(self.dir_test_data, filename + ".nii.gz"),
+            os.path.join(self.dir_test_data, filename + "_mask.nii.gz"),
+        )
+
+        # Image data and all slices are represented in single precision
+        self.assertEqual(stack.sitk.GetPixelID(), sitk.sitkFloat32)
+        for slice in stack.get_slices():
+            self.assertEqual(slice.sitk.GetPixelID(), sitk.sitkFloat32)
+
+        nda = sitk.GetArrayFromImage(stack.sitk)
+        nda_double = sitk.GetArrayFromImage(stack_double.sitk)
+        self.assertAlmostEqual(
+            np.linalg.norm(nda - nda_double) / np.linalg.norm(nda_double), 0,
+            places=6)
+
+        # Precision is propagated to derived stacks
+        stack_copy = st.Stack.from_stack(stack)
+        self.assertEqual(stack_copy.sitk.GetPixelID(), sitk.sitkFloat32)
+
+        # Unknown precision
+        self.assertRaises(ValueError, lambda: st.Stack.from_filename(
+            os.path.join(self.dir_test_data, filename + ".nii.gz"),
+            precision="half"))
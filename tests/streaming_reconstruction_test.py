@@ -0,0 +1,110 @@
+##
+# \file streaming_reconstruction_test.py
+#  \brief  unit tests of the streaming reconstruction pipeline
+#
+#  \author Michael Ebner (michael.ebner.14@ucl.ac.uk)
+#  \date April 2018
+
+
+import os
+import unittest
+import numpy as np
+import SimpleITK as sitk
+
+import niftymic.base.stack as st
+import niftymic.reconstruction.tikhonov_solver as tk
+import niftymic.utilities.volumetric_reconstruction_pipeline as pipeline
+from niftymic.definitions import DIR_TEST
+
+
+class StreamingReconstructionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_data = os.path.join(DIR_TEST, "reconstruction")
+        self.filename = "IC_N4ITK_HASTE_exam_3.5mm_800ms_3"
+        self.filename_recon = "SRR_stacks5_alpha0p01"
+        self.suffix_mask = "_brain"
+
+        self.path_to_stack = os.path.join(
+            self.dir_data, "motion_correction", self.filename + ".nii.gz")
+        self.path_to_stack_mask = os.path.join(
+            self.dir_data, "motion_correction",
+            self.filename + self.suffix_mask + ".nii.gz")
+
+        self.reconstruction = st.Stack.from_filename(
+            os.path.join(self.dir_data, self.filename_recon + ".nii.gz"),
+            os.path.join(self.dir_data,
+                         self.filename_recon + self.suffix_mask + ".nii.gz"))
+
+    def _get_stack(self):
+        return st.Stack.from_filename(
+            self.path_to_stack, self.path_to_stack_mask)
+
+    ##
+    # Test that each new stack updates the warm-started reconstruction and
+    # that the per-slice data of previously ingested stacks is kept
+    # \date       2018-04-02 11:40:12+0100
+    #
+    def test_add_stack(self):
+
+        SRR = tk.TikhonovSolver(
+            stacks=[],
+            reconstruction=self.reconstruction,
+            iter_max=2,
+            use_assembled_operator=True,
+            verbose=0,
+        )
+        streaming = pipeline.StreamingReconstruction(
+            reconstruction_method=SRR,
+            verbose=0,
+        )
+
+        stack_first = self._get_stack()
+        streaming.add_stack(stack_first)
+        self.assertEqual(streaming.get_number_of_ingested_stacks(), 1)
+        slice_k = stack_first.get_slices()[0]
+        MA_k = SRR._get_slice_cache(slice_k)["MA_sparse"]
+
+        nda_first = sitk.GetArrayFromImage(
+            streaming.get_reconstruction().sitk)
+
+        streaming.add_stack(self._get_stack())
+        self.assertEqual(streaming.get_number_of_ingested_stacks(), 2)
+        self.assertEqual(len(SRR.get_stacks()), 2)
+        self.assertIs(SRR._get_slice_cache(slice_k)["MA_sparse"], MA_k)
+
+        # Reconstruction is updated in place, i.e. warm-started
+        self.assertIs(SRR.get_reconstruction(), self.reconstruction)
+        nda_second = sitk.GetArrayFromImage(
+            streaming.get_reconstruction().sitk)
+        self.assertEqual(nda_first.shape, nda_second.shape)
+        self.assertTrue(np.all(np.isfinite(nda_second)))
+
+        reconstructions = streaming.get_iterative_reconstructions()
+        self.assertEqual(len(reconstructions), 2)
+        self.assertTrue(reconstructions[0].get_filename().startswith(
+            "Stacks2_"))
+
+        # The second update starts from the previous volume, i.e. it reaches
+        # a lower residual than the same number of iterations from zero
+        reconstruction_zero = st.Stack.from_sitk_image(
+            self.reconstruction.sitk * 0,
+            filename=self.reconstruction.get_filename(),
+            image_sitk_mask=self.reconstruction.sitk_mask,
+            extract_slices=False)
+        SRR_cold = tk.TikhonovSolver(
+            stacks=SRR.get_stacks(),
+            reconstruction=reconstruction_zero,
+            iter_max=2,
+            use_assembled_operator=True,
+            verbose=0,
+        )
+        SRR_cold.run()
+        b = SRR.get_b()
+        residual_warm = np.linalg.norm(SRR.get_A()(SRR.get_x0()) - b)
+        residual_cold = np.linalg.norm(SRR.get_A()(SRR_cold.get_x0()) - b)
+        self.assertLess(residual_warm, residual_cold)
+
+        # Running without new stacks leaves the reconstruction unchanged
+        streaming.run()
+        self.assertEqual(len(streaming.get_iterative_reconstructions()), 2)